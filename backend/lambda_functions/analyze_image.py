@@ -2,9 +2,11 @@ import json
 import boto3
 import os
 from typing import Dict, List
+from compression import compressed_responses
 
 rekognition = boto3.client('rekognition')
 
+@compressed_responses
 def lambda_handler(event, context):
     headers = {
         'Access-Control-Allow-Origin': '*',
@@ -105,6 +107,8 @@ def analyze_product_image(bucket: str, key: str) -> Dict:
             'category': category,
             'description': description,
             'labels': labels[:10],  # Top 10 labels
+            # Every label with its confidence, for the client to save on the product
+            'tags': [{'name': name, 'confidence': round(confidence_scores[name], 1)} for name in labels],
             'detectedText': detected_text[:5],  # Top 5 text detections
             'confidence': 'high' if max(confidence_scores.values()) > 85 else 'medium'
         }
@@ -116,6 +120,7 @@ def analyze_product_image(bucket: str, key: str) -> Dict:
             'category': 'General',
             'description': 'Product available for purchase',
             'labels': [],
+            'tags': [],
             'detectedText': [],
             'confidence': 'low',
             'error': 'Image analysis unavailable'
@@ -0,0 +1,164 @@
+import bisect
+import json
+import mmap
+import struct
+from collections.abc import Sequence
+
+# Compact binary catalogue snapshot.
+#
+# Layout (little-endian):
+#   header     HEADER
+#   meta       JSON object with the manifest's other fields (lastUpdated, changes)
+#   records    count x RECORD: offset/length of the record's JSON and of its ID
+#              in the heap, plus its price
+#   id index   count x u32 record numbers ordered by ID, for binary search
+#   heap       UTF-8 bytes referenced by the record table
+#
+# Every field lookup is an offset computation into the buffer, so a reader
+# over an mmapped file only touches (and only decodes) the records it uses.
+
+MAGIC = b'PCAT'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<4sHHIqIIIII')
+RECORD = struct.Struct('<IIIId')
+INDEX_ENTRY = struct.Struct('<I')
+
+
+def encode_catalog(products, version, meta=None):
+    """Serialize listing entries (dicts with at least an id) to the binary format"""
+    meta_bytes = json.dumps(meta or {}, separators=(',', ':')).encode('utf-8')
+    heap = bytearray()
+    records = bytearray()
+    ids = []
+    for number, product in enumerate(products):
+        record_json = json.dumps(product, separators=(',', ':')).encode('utf-8')
+        product_id = str(product['id']).encode('utf-8')
+        json_offset = len(heap)
+        heap += record_json
+        id_offset = len(heap)
+        heap += product_id
+        try:
+            price = float(product.get('price') or 0)
+        except (TypeError, ValueError):
+            price = 0.0
+        records += RECORD.pack(json_offset, len(record_json), id_offset, len(product_id), price)
+        ids.append((product_id, number))
+    ids.sort()
+    id_index = b''.join(INDEX_ENTRY.pack(number) for _, number in ids)
+
+    meta_offset = HEADER.size
+    records_offset = meta_offset + len(meta_bytes)
+    id_index_offset = records_offset + len(records)
+    heap_offset = id_index_offset + len(id_index)
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, 0, len(ids), version,
+        meta_offset, len(meta_bytes), records_offset, id_index_offset, heap_offset
+    )
+    return b''.join((header, meta_bytes, bytes(records), id_index, bytes(heap)))
+
+
+class BinaryCatalog(Sequence):
+    """Read-only, lazily decoded view of a binary catalogue snapshot.
+
+    Behaves like the manifest's list of listing entries: indexing or
+    iterating decodes one record at a time, get() finds a record by ID with a
+    binary search, and to_json() assembles the listing body from the stored
+    record bytes without decoding them.
+    """
+
+    def __init__(self, buffer, mapped_file=None):
+        self.buffer = memoryview(buffer)
+        self.mapped_file = mapped_file
+        if len(buffer) < HEADER.size:
+            raise ValueError('Truncated catalogue snapshot')
+        (magic, format_version, _, self.count, self.version, meta_offset, meta_length,
+         self.records_offset, self.id_index_offset, self.heap_offset) = HEADER.unpack_from(buffer)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError('Not a catalogue snapshot')
+        if self.heap_offset > len(buffer) or self.id_index_offset + self.count * INDEX_ENTRY.size != self.heap_offset:
+            raise ValueError('Corrupt catalogue snapshot')
+        self.meta = json.loads(bytes(self.buffer[meta_offset:meta_offset + meta_length]))
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a snapshot file"""
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, mapped)
+
+    def close(self):
+        self.buffer.release()
+        if self.mapped_file is not None:
+            self.mapped_file.close()
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, number):
+        return RECORD.unpack_from(self.buffer, self.records_offset + number * RECORD.size)
+
+    def _heap(self, offset, length):
+        start = self.heap_offset + offset
+        return self.buffer[start:start + length]
+
+    def _check(self, number):
+        if number < 0:
+            number += self.count
+        if not 0 <= number < self.count:
+            raise IndexError('catalogue record out of range')
+        return number
+
+    def record_json(self, number):
+        """Raw JSON bytes of one record"""
+        json_offset, json_length, _, _, _ = self._record(self._check(number))
+        return bytes(self._heap(json_offset, json_length))
+
+    def product_id(self, number):
+        _, _, id_offset, id_length, _ = self._record(self._check(number))
+        return bytes(self._heap(id_offset, id_length)).decode('utf-8')
+
+    def price(self, number):
+        return self._record(self._check(number))[4]
+
+    def __getitem__(self, number):
+        if isinstance(number, slice):
+            return [self[i] for i in range(*number.indices(self.count))]
+        return json.loads(self.record_json(number))
+
+    def __iter__(self):
+        for number in range(self.count):
+            yield self[number]
+
+    def _id_at(self, position):
+        number = INDEX_ENTRY.unpack_from(self.buffer, self.id_index_offset + position * INDEX_ENTRY.size)[0]
+        _, _, id_offset, id_length, _ = self._record(number)
+        return bytes(self._heap(id_offset, id_length)), number
+
+    def get(self, product_id):
+        """Listing entry for an ID, or None"""
+        target = str(product_id).encode('utf-8')
+        keys = _IdKeys(self)
+        position = bisect.bisect_left(keys, target)
+        if position < self.count:
+            found, number = self._id_at(position)
+            if found == target:
+                return self[number]
+        return None
+
+    def to_json(self):
+        """The listing as a JSON array, copied from the stored record bytes"""
+        return '[' + ','.join(self.record_json(i).decode('utf-8') for i in range(self.count)) + ']'
+
+
+class _IdKeys:
+    """Sequence of IDs in index order, for bisect"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __len__(self):
+        return self.catalog.count
+
+    def __getitem__(self, position):
+        return self.catalog._id_at(position)[0]
@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+import math
+
+# Row parsing and validation for bulk product imports.
+#
+# Rows are read lazily from the request body one line at a time, so a
+# malformed row only fails itself and memory does not grow with the number
+# of intermediate row objects.
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+MAX_IMPORT_ROWS = 5000
+
+MAX_NAME_LENGTH = 200
+MAX_DESCRIPTION_LENGTH = 5000
+
+# Rekognition returns at most 20 labels per image
+MAX_TAGS = 20
+MAX_TAG_LENGTH = 64
+
+
+class ImportRowError(ValueError):
+    """A single import row that cannot become a product"""
+
+
+def detect_format(content_type, requested=None):
+    """Import format from an explicit ?format= or the request Content-Type"""
+    if requested:
+        requested = requested.lower()
+        if requested not in IMPORT_FORMATS:
+            raise ValueError(f'format must be one of: {", ".join(IMPORT_FORMATS)}')
+        return requested
+    content_type = (content_type or '').lower()
+    if 'csv' in content_type:
+        return 'csv'
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type:
+        return 'ndjson'
+    raise ValueError('Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson')
+
+
+def iter_rows(body, import_format):
+    """Yield (row_number, row_or_error) for each non-blank row of the body.
+
+    row_or_error is a dict of raw field values, or an ImportRowError when the
+    row itself cannot be decoded. Row numbers are 1-based data rows.
+    """
+    stream = io.StringIO(body)
+    if import_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row_number, row in enumerate(reader, start=1):
+            if None in row:
+                yield row_number, ImportRowError('Row has more columns than the header')
+            else:
+                yield row_number, row
+        return
+
+    row_number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, ImportRowError(f'Invalid JSON: {e}')
+            continue
+        if isinstance(row, dict):
+            yield row_number, row
+        else:
+            yield row_number, ImportRowError('Each line must be a JSON object')
+
+
+def parse_import_price(value):
+    if isinstance(value, bool):
+        raise ImportRowError('price must be a number')
+    try:
+        price = float(value if value not in (None, '') else 0)
+    except (TypeError, ValueError):
+        raise ImportRowError('price must be a number')
+    if not math.isfinite(price) or price < 0:
+        raise ImportRowError('price must be a non-negative number')
+    return round(price, 2)
+
+
+def _text(row, field, max_length):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if len(value) > max_length:
+        raise ImportRowError(f'{field} must be at most {max_length} characters')
+    return value
+
+
+def parse_tags(value):
+    """Normalize tags to [{'name', 'confidence'?}], highest confidence first.
+
+    Accepts a comma-separated string, a list of names, or a list of
+    {'name', 'confidence'} objects as returned by image analysis. Tags that
+    differ only in case are merged, keeping the higher confidence.
+    """
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list):
+        raise ImportRowError('tags must be a list')
+    tags = {}
+    for tag in value:
+        if isinstance(tag, str):
+            tag = {'name': tag}
+        if not isinstance(tag, dict):
+            raise ImportRowError('Each tag must be a name or an object with a name')
+        name = _text(tag, 'name', MAX_TAG_LENGTH)
+        if not name:
+            continue
+        parsed = {'name': name}
+        if tag.get('confidence') is not None:
+            confidence = tag['confidence']
+            if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 100:
+                raise ImportRowError('tag confidence must be a number between 0 and 100')
+            parsed['confidence'] = round(float(confidence), 1)
+        existing = tags.get(name.lower())
+        if existing is None or parsed.get('confidence', 0) > existing.get('confidence', 0):
+            tags[name.lower()] = parsed
+    if len(tags) > MAX_TAGS:
+        raise ImportRowError(f'A product can have at most {MAX_TAGS} tags')
+    return sorted(tags.values(), key=lambda tag: (-tag.get('confidence', 100), tag['name'].lower()))
+
+
+# Editable product fields and their validators; imageUrl is accepted as an alias of image
+FIELD_PARSERS = {
+    'name': lambda row: _text(row, 'name', MAX_NAME_LENGTH),
+    'description': lambda row: _text(row, 'description', MAX_DESCRIPTION_LENGTH),
+    'price': lambda row: parse_import_price(row.get('price')),
+    'category': lambda row: _text(row, 'category', MAX_NAME_LENGTH),
+    'image': lambda row: _text(row, 'imageUrl', 2048) or _text(row, 'image', 2048),
+    'userId': lambda row: _text(row, 'userId', MAX_NAME_LENGTH),
+    'tags': lambda row: parse_tags(row.get('tags')),
+}
+
+
+def product_fields(row, partial=False):
+    """Validated product fields from one row; raises ImportRowError.
+
+    With partial=True only the fields present in the row are returned (for
+    updates), and fields that cannot be edited are rejected.
+    """
+    if partial:
+        present = {'image' if field == 'imageUrl' else field for field in row}
+        unknown = present - set(FIELD_PARSERS)
+        if unknown:
+            raise ImportRowError(f'Cannot update: {", ".join(sorted(unknown))}')
+        fields = {field: FIELD_PARSERS[field](row) for field in FIELD_PARSERS if field in present}
+    else:
+        fields = {field: parse(row) for field, parse in FIELD_PARSERS.items()}
+    if not fields.get('name', 'unchanged'):
+        raise ImportRowError('name is required')
+    return fields
@@ -0,0 +1,203 @@
+import base64
+import bisect
+import json
+
+# The versioned list of every product's listing fields, written by products.py
+# and read by the checkout pricing in catalog_prices.py
+CATALOG_MANIFEST_KEY = 'products/catalog/manifest.json'
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+SORT_FIELDS = ('createdAt', 'price')
+
+# Sorts after any product ID, so (price, ID_MAX) bounds every key with that price
+ID_MAX = '\U0010ffff'
+
+
+def product_price(product):
+    try:
+        return float(product.get('price') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def category_key(category):
+    return (category or '').strip().lower()
+
+
+def tag_keys(product):
+    """Normalized names of a product's tags (names, or {'name', ...} objects)"""
+    return {
+        category_key(tag.get('name') if isinstance(tag, dict) else tag)
+        for tag in product.get('tags') or ()
+    } - {''}
+
+
+def sort_key(product, sort='createdAt'):
+    """Listing order for a sort field, ties broken by ID"""
+    if sort == 'price':
+        return (product_price(product), product['id'])
+    return (product.get('createdAt') or '', product['id'])
+
+
+def encode_cursor(sort, key):
+    """Opaque cursor pointing just after the given sort key"""
+    payload = json.dumps([sort, *key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor, returning (sort, key); raises ValueError for anything malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort, first, product_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    expected = (int, float) if sort == 'price' else str
+    if sort not in SORT_FIELDS or not isinstance(first, expected) or not isinstance(product_id, str):
+        raise ValueError('Invalid cursor')
+    return sort, (first, product_id)
+
+
+def _remove_key(keys, key):
+    position = bisect.bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+
+class CatalogIndex:
+    """Lookup structures built once per catalogue version.
+
+    Holds an ID map, category -> IDs and tag -> IDs maps and (createdAt, id) /
+    (price, id) arrays kept sorted so filters and page starts are binary searches. Pages
+    are addressed by the sort key of the last item returned rather than an
+    offset, so cursors stay stable while products are added or removed.
+    apply_changes updates the structures in place after a write instead of
+    rebuilding them from the whole catalogue.
+    """
+
+    def __init__(self, products, version):
+        self.version = version
+        self.by_id = {}
+        self.by_category = {}
+        self.by_tag = {}
+        self.sorted_keys = {sort: [] for sort in SORT_FIELDS}
+        # Per-category and per-tag sorted keys, built lazily the first time one is queried
+        self.category_keys = {}
+        self.tag_keys = {}
+        for product in products:
+            self._index(product)
+        for keys in self.sorted_keys.values():
+            keys.sort()
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def _index(self, product, keep_sorted=False):
+        self.by_id[product['id']] = product
+        category = category_key(product.get('category'))
+        self.by_category.setdefault(category, set()).add(product['id'])
+        self.category_keys.pop(category, None)
+        for tag in tag_keys(product):
+            self.by_tag.setdefault(tag, set()).add(product['id'])
+            self.tag_keys.pop(tag, None)
+        for sort, keys in self.sorted_keys.items():
+            if keep_sorted:
+                bisect.insort(keys, sort_key(product, sort))
+            else:
+                keys.append(sort_key(product, sort))
+
+    def _unindex(self, product_id):
+        product = self.by_id.pop(product_id, None)
+        if product is None:
+            return
+        category = category_key(product.get('category'))
+        self.by_category.get(category, set()).discard(product_id)
+        self.category_keys.pop(category, None)
+        for tag in tag_keys(product):
+            tagged = self.by_tag.get(tag)
+            if tagged is not None:
+                tagged.discard(product_id)
+                if not tagged:
+                    del self.by_tag[tag]
+            self.tag_keys.pop(tag, None)
+        for sort, keys in self.sorted_keys.items():
+            _remove_key(keys, sort_key(product, sort))
+
+    def apply_changes(self, upserts, removed_ids, version):
+        """Incrementally move the index to a new catalogue version"""
+        for product_id in removed_ids:
+            self._unindex(product_id)
+        for product in upserts:
+            self._unindex(product['id'])
+            self._index(product, keep_sorted=True)
+        self.version = version
+
+    def _sorted(self, ids, sort):
+        return sorted(sort_key(self.by_id[product_id], sort) for product_id in ids)
+
+    def _keys_for(self, sort, category, tag=None):
+        if category is None and tag is None:
+            return self.sorted_keys[sort]
+        if tag is None:
+            category = category_key(category)
+            cached = self.category_keys.setdefault(category, {})
+            if sort not in cached:
+                cached[sort] = self._sorted(self.by_category.get(category, ()), sort)
+            return cached[sort]
+        tag = category_key(tag)
+        cached = self.tag_keys.setdefault(tag, {})
+        if sort not in cached:
+            cached[sort] = self._sorted(self.by_tag.get(tag, ()), sort)
+        if category is None:
+            return cached[sort]
+        # Both filters: the tag's keys are already sorted, so filtering keeps them sorted
+        in_category = self.by_category.get(category_key(category), set())
+        return [key for key in cached[sort] if key[1] in in_category]
+
+    def query(self, category=None, min_price=None, max_price=None, sort='createdAt', after=None,
+              limit=DEFAULT_PAGE_SIZE, tag=None):
+        """Return (products, next_key, total) for one page of a filtered listing.
+
+        total counts every product matching the filters, not just this page.
+        """
+        keys = self._keys_for(sort, category, tag)
+        lo, hi = 0, len(keys)
+        if sort == 'price':
+            # The price range is a contiguous slice of the price-sorted keys
+            if min_price is not None:
+                lo = bisect.bisect_left(keys, (min_price,))
+            if max_price is not None:
+                hi = max(lo, bisect.bisect_right(keys, (max_price, ID_MAX)))
+            total = hi - lo
+            price_filtered = False
+        else:
+            price_filtered = min_price is not None or max_price is not None
+            total = len(keys) if not price_filtered else sum(
+                1 for key in keys if self._price_in_range(key[1], min_price, max_price)
+            )
+
+        start = max(lo, bisect.bisect_right(keys, tuple(after), lo, hi)) if after else lo
+        page = []
+        last_key = None
+        position = start
+        while position < hi and len(page) < limit:
+            key = keys[position]
+            position += 1
+            if price_filtered and not self._price_in_range(key[1], min_price, max_price):
+                continue
+            page.append(self.by_id[key[1]])
+            last_key = key
+
+        has_more = False
+        if len(page) == limit:
+            has_more = any(
+                not price_filtered or self._price_in_range(keys[i][1], min_price, max_price)
+                for i in range(position, hi)
+            )
+        return page, last_key if has_more else None, total
+
+    def _price_in_range(self, product_id, min_price, max_price):
+        price = product_price(self.by_id[product_id])
+        return (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
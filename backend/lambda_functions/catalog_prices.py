@@ -0,0 +1,156 @@
+import os
+import time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from catalog_index import CATALOG_MANIFEST_KEY
+from s3_store import NOT_MODIFIED, read_json
+
+# Authoritative catalogue prices for checkout.
+#
+# Order and payment handlers price every line item from the catalogue rather
+# than trusting the client. The manifest is reduced once per catalogue
+# version to an id -> price-in-cents dict kept across warm invocations, so
+# pricing an order costs one dictionary lookup per line. All arithmetic is in
+# integer cents; dollars only appear at the edges for existing clients.
+
+# A warm container reuses its index this long before revalidating it with a
+# conditional GET, which costs a 304 while the catalogue is unchanged
+PRICE_INDEX_TTL = float(os.environ.get('PRICE_INDEX_TTL_SECONDS', '5'))
+price_index_cache = {'index': None, 'etag': None, 'checkedAt': 0.0}
+
+# Catalogue prices are in this currency, and so is every charge
+CURRENCY = os.environ.get('STORE_CURRENCY', 'usd').lower()
+
+MAX_ORDER_LINES = 100
+MAX_LINE_QUANTITY = int(os.environ.get('MAX_LINE_QUANTITY', '100'))
+
+CENT = Decimal('0.01')
+
+
+class PricingError(ValueError):
+    """Order items that cannot be priced"""
+
+
+class PriceMismatchError(PricingError):
+    """Client prices or totals that disagree with the catalogue.
+
+    Carries the repriced items and total so the client can show them.
+    """
+
+    def __init__(self, message, items, total_cents):
+        super().__init__(message)
+        self.items = items
+        self.total_cents = total_cents
+
+
+def to_cents(value):
+    """Integer cents of a dollar amount, rounded half up; PricingError if invalid"""
+    if isinstance(value, bool):
+        raise PricingError('Prices must be numbers')
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise PricingError('Prices must be numbers')
+    if not amount.is_finite() or amount < 0:
+        raise PricingError('Prices must be non-negative numbers')
+    return int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents):
+    return cents / 100
+
+
+class PriceIndex:
+    """Product ID -> price in cents for one catalogue version"""
+
+    def __init__(self, products=(), version=0):
+        self.version = version
+        self.prices = {}
+        for product in products:
+            try:
+                cents = to_cents(product.get('price'))
+            except PricingError:
+                continue
+            # A product without a positive price (missing, or saved as 0 from
+            # unparseable input) cannot be sold
+            if cents > 0:
+                self.prices[product['id']] = cents
+
+    def __len__(self):
+        return len(self.prices)
+
+    def get(self, product_id):
+        return self.prices.get(product_id)
+
+
+def load_price_index(s3_client, bucket, max_age=None):
+    """The price index for the current catalogue, cached per container"""
+    cached = price_index_cache['index']
+    now = time.monotonic()
+    max_age = PRICE_INDEX_TTL if max_age is None else max_age
+    if cached is not None and now - price_index_cache['checkedAt'] < max_age:
+        return cached
+
+    etag = price_index_cache['etag'] if cached is not None else None
+    manifest, etag = read_json(s3_client, bucket, CATALOG_MANIFEST_KEY, if_none_match=etag)
+    if manifest is NOT_MODIFIED:
+        index = cached
+    else:
+        manifest = manifest or {}
+        index = PriceIndex(manifest.get('products', []), manifest.get('version', 0))
+    price_index_cache.update(index=index, etag=etag, checkedAt=now)
+    return index
+
+
+def clear_price_index_cache():
+    price_index_cache.update(index=None, etag=None, checkedAt=0.0)
+
+
+def price_order(items, index, claimed_total=None):
+    """Return (items, total_cents) with every price taken from the index.
+
+    Each returned item keeps the client's fields (name, image, ...) with
+    price, total and unitPriceCents replaced. Raises PricingError for
+    malformed items or unknown products, and PriceMismatchError when an item
+    price or claimed_total disagrees with the catalogue.
+    """
+    if not isinstance(items, list) or not items:
+        raise PricingError('Order must contain at least one item')
+    if len(items) > MAX_ORDER_LINES:
+        raise PricingError(f'Order can contain at most {MAX_ORDER_LINES} items')
+
+    priced = []
+    unknown = []
+    mismatched = []
+    total_cents = 0
+    for item in items:
+        if not isinstance(item, dict):
+            raise PricingError('Each item must be an object')
+        product_id = str(item.get('productId') or item.get('id') or '')
+        quantity = item.get('quantity', 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or not 1 <= quantity <= MAX_LINE_QUANTITY:
+            raise PricingError(f'quantity must be a whole number between 1 and {MAX_LINE_QUANTITY}')
+        unit_cents = index.get(product_id)
+        if unit_cents is None:
+            unknown.append(product_id)
+            continue
+        if item.get('price') is not None and to_cents(item['price']) != unit_cents:
+            mismatched.append(product_id)
+        line_cents = unit_cents * quantity
+        total_cents += line_cents
+        priced.append({
+            **item,
+            'productId': product_id,
+            'quantity': quantity,
+            'price': from_cents(unit_cents),
+            'total': from_cents(line_cents),
+            'unitPriceCents': unit_cents
+        })
+
+    if unknown:
+        raise PricingError(f'Products not available: {", ".join(unknown)}')
+    if mismatched:
+        raise PriceMismatchError(f'Prices have changed for: {", ".join(mismatched)}', priced, total_cents)
+    if claimed_total is not None and to_cents(claimed_total) != total_cents:
+        raise PriceMismatchError('Order total does not match the current prices', priced, total_cents)
+    return priced, total_cents
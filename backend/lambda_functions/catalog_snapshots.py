@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+from catalog_index import category_key
+from s3_store import read_json, update_json
+
+# Static catalogue snapshots for the CDN.
+#
+# Every catalogue write renders the listing and one slice per category to
+# immutable files whose names carry a hash of their content, then moves a
+# small pointer file (current.json) to them. Browsers fetch the pointer with a
+# short max-age and the snapshot files with a far-future one, so anonymous
+# browsing is served from the bucket/CDN and never reaches Lambda. Files are
+# uploaded before the pointer, so the pointer never references a missing file.
+
+SNAPSHOT_PREFIX = 'products/snapshots/'
+POINTER_KEY = f'{SNAPSHOT_PREFIX}current.json'
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+POINTER_MAX_AGE = int(os.environ.get('SNAPSHOT_POINTER_MAX_AGE_SECONDS', '10'))
+
+# Superseded files stay readable this long, so clients holding an older
+# pointer can still fetch what it references
+RETIRED_GRACE_SECONDS = float(os.environ.get('SNAPSHOT_RETIRED_GRACE_SECONDS', '600'))
+
+SLUG_PATTERN = re.compile(r'[^a-z0-9]+')
+
+
+def content_hash(body):
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()[:16]
+
+
+def category_slug(category):
+    return SLUG_PATTERN.sub('-', category_key(category)).strip('-') or 'uncategorized'
+
+
+def snapshot_file(name, body):
+    """Relative path of a content-addressed snapshot file"""
+    return f'{name}.{content_hash(body)}.json'
+
+
+def render_snapshot(manifest, listing_body=None):
+    """Return (files, pointer) for a catalogue manifest.
+
+    files maps paths relative to SNAPSHOT_PREFIX to JSON bodies. listing_body
+    may pass in an already serialized manifest listing to avoid encoding it twice.
+    """
+    listing = manifest.get('products', [])
+    if listing_body is None:
+        listing_body = json.dumps(listing)
+    files = {snapshot_file('listing', listing_body): listing_body}
+
+    slices = {}
+    for product in listing:
+        key = category_key(product.get('category'))
+        if key not in slices:
+            slices[key] = ((product.get('category') or '').strip() or 'Uncategorized', [])
+        slices[key][1].append(product)
+
+    categories = []
+    for key, (name, category_products) in sorted(slices.items()):
+        body = json.dumps(category_products)
+        path = snapshot_file(f'category/{category_slug(key)}', body)
+        files[path] = body
+        categories.append({'name': name, 'key': key, 'file': path, 'count': len(category_products)})
+
+    pointer = {
+        'version': manifest.get('version', 0),
+        'lastUpdated': manifest.get('lastUpdated'),
+        'listing': next(iter(files)),
+        'count': len(listing),
+        'categories': categories
+    }
+    return files, pointer
+
+
+def referenced_files(pointer):
+    if not pointer:
+        return set()
+    return {pointer['listing'], *(category['file'] for category in pointer.get('categories', []))}
+
+
+def publish_snapshot(s3_client, bucket, manifest, listing_body=None):
+    """Upload the snapshot files for a manifest and point current.json at them.
+
+    Only files the current pointer does not already reference are uploaded,
+    so unchanged category slices cost nothing. The pointer is replaced with a
+    conditional write and never moves back to an older catalogue version;
+    files uploaded for a publish that lost to a newer one are retired, so
+    they are deleted after the grace period like any superseded file.
+    Returns the pointer now stored.
+    """
+    files, pointer = render_snapshot(manifest, listing_body)
+    previous, _ = read_json(s3_client, bucket, POINTER_KEY)
+    existing = referenced_files(previous)
+    uploaded = []
+    for path, body in files.items():
+        if path in existing:
+            continue
+        uploaded.append(path)
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=f'{SNAPSHOT_PREFIX}{path}',
+            Body=body,
+            ContentType='application/json',
+            CacheControl=IMMUTABLE_CACHE_CONTROL
+        )
+
+    expired = []
+    def advance(current):
+        expired[:] = []
+        if current and current.get('version', 0) >= pointer['version']:
+            # A newer catalogue version was published concurrently
+            return None
+        now = time.time()
+        live = referenced_files(pointer)
+        retired = []
+        for entry in (current or {}).get('retired', []):
+            if entry['file'] in live:
+                continue
+            if now - entry['retiredAt'] >= RETIRED_GRACE_SECONDS:
+                expired.append(entry['file'])
+            else:
+                retired.append(entry)
+        retired.extend(
+            {'file': path, 'retiredAt': now}
+            for path in sorted(referenced_files(current) - live)
+        )
+        return dict(pointer, publishedAt=now, retired=retired)
+
+    stored, _ = update_json(
+        s3_client, bucket, POINTER_KEY, advance,
+        CacheControl=f'public, max-age={POINTER_MAX_AGE}'
+    )
+    for path in expired:
+        s3_client.delete_object(Bucket=bucket, Key=f'{SNAPSHOT_PREFIX}{path}')
+    if stored.get('version') != pointer['version'] and uploaded:
+        stored = retire_unreferenced(s3_client, bucket, uploaded)
+    return stored
+
+
+def retire_unreferenced(s3_client, bucket, paths):
+    """Add the given files to the pointer's retired list unless it references them.
+
+    Returns the pointer now stored.
+    """
+    def retire(current):
+        if current is None:
+            return None
+        known = referenced_files(current) | {entry['file'] for entry in current.get('retired', [])}
+        orphaned = [path for path in paths if path not in known]
+        if not orphaned:
+            return None
+        now = time.time()
+        retired = [*current.get('retired', []), *({'file': path, 'retiredAt': now} for path in orphaned)]
+        return dict(current, retired=retired)
+
+    stored, _ = update_json(
+        s3_client, bucket, POINTER_KEY, retire,
+        CacheControl=f'public, max-age={POINTER_MAX_AGE}'
+    )
+    return stored
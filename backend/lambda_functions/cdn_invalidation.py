@@ -0,0 +1,104 @@
+import hashlib
+import os
+import urllib.parse
+import uuid
+
+import boto3
+
+# Batched CloudFront invalidations for objects the backend rewrites.
+#
+# Writers add the S3 keys they changed; flush() turns them into as few
+# invalidation paths as possible and submits them in one request. When many
+# keys share a directory they are coalesced into a single "dir/*" path, which
+# CloudFront bills as one path. CloudFront treats a repeated CallerReference
+# as the same invalidation, so the reference names the change being
+# published (the catalogue version): retrying one commit is collapsed, while
+# every later commit invalidates again even when it touches the same paths.
+
+# More keys than this in one directory become a single wildcard path
+COALESCE_THRESHOLD = int(os.environ.get('CLOUDFRONT_COALESCE_THRESHOLD', '20'))
+
+# CloudFront accepts up to 3000 paths per invalidation request
+MAX_PATHS_PER_INVALIDATION = 1000
+
+
+def coalesce_paths(paths, threshold=COALESCE_THRESHOLD):
+    """Sorted invalidation paths, with crowded directories replaced by a wildcard"""
+    by_directory = {}
+    for path in paths:
+        by_directory.setdefault(path.rsplit('/', 1)[0], set()).add(path)
+    coalesced = set()
+    for directory, directory_paths in by_directory.items():
+        if len(directory_paths) > threshold:
+            coalesced.add(f'{directory}/*')
+        else:
+            coalesced.update(directory_paths)
+    # A wildcard makes any path below it redundant
+    wildcards = [path[:-1] for path in coalesced if path.endswith('/*')]
+    return sorted(
+        path for path in coalesced
+        if not any(path != prefix + '*' and path.startswith(prefix) for prefix in wildcards)
+    )
+
+
+class InvalidationBatcher:
+    """Collects changed keys and submits them as coalesced CloudFront invalidations.
+
+    Does nothing when no distribution is configured.
+    """
+
+    def __init__(self, distribution_id, client=None, path_prefix=''):
+        self.distribution_id = distribution_id
+        self.client = client
+        self.path_prefix = path_prefix.rstrip('/')
+        self.pending = set()
+
+    @property
+    def enabled(self):
+        return bool(self.distribution_id)
+
+    def add(self, *keys):
+        """Queue S3 keys whose cached copies are now stale.
+
+        Keys are percent-encoded the way CloudFront expects, so an uploaded
+        file name with spaces still matches its cached object.
+        """
+        if not self.enabled:
+            return
+        for key in keys:
+            if key:
+                self.pending.add(f"{self.path_prefix}/{urllib.parse.quote(key.lstrip('/'))}")
+
+    def flush(self, reference=None):
+        """Submit pending paths; returns the invalidation IDs created.
+
+        reference identifies the change being published, e.g. the catalogue
+        version; flushing the same reference and paths again creates nothing
+        new. Without one every flush is a new invalidation. Paths that fail
+        to submit stay pending for the next flush.
+        """
+        if not self.enabled or not self.pending:
+            return []
+        paths = coalesce_paths(self.pending)
+        if self.client is None:
+            self.client = boto3.client('cloudfront')
+        reference = reference or uuid.uuid4().hex
+        invalidation_ids = []
+        for start in range(0, len(paths), MAX_PATHS_PER_INVALIDATION):
+            batch = paths[start:start + MAX_PATHS_PER_INVALIDATION]
+            digest = hashlib.sha1('\n'.join(batch).encode('utf-8')).hexdigest()[:16]
+            try:
+                response = self.client.create_invalidation(
+                    DistributionId=self.distribution_id,
+                    InvalidationBatch={
+                        'Paths': {'Quantity': len(batch), 'Items': batch},
+                        'CallerReference': f'{reference}-{digest}'
+                    }
+                )
+            except Exception as e:
+                print(f"Error creating CloudFront invalidation for {len(batch)} paths: {e}")
+                return invalidation_ids
+            invalidation_ids.append(response['Invalidation']['Id'])
+        print(f"Invalidated {len(paths)} CloudFront paths for {len(self.pending)} changed objects")
+        self.pending.clear()
+        return invalidation_ids
@@ -0,0 +1,179 @@
+import base64
+import functools
+import gzip
+import os
+import time
+
+from metrics import put_metrics
+
+try:
+    import brotli
+except ImportError as e:
+    print(f"Failed to import brotli: {e}")
+    brotli = None
+
+# Content-Encoding negotiation and compression for response bodies.
+#
+# API Gateway (REST) only passes a base64 body through as raw bytes when the
+# request's first Accept type is one of the API's BinaryMediaTypes, so
+# responses are only compressed for clients that ask for one of those types.
+
+# Preferred first; brotli is only offered when the module is available
+ENCODINGS = ('br', 'gzip')
+
+# Levels for bodies compressed once and stored
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Faster levels for per-response compression
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_BROTLI_QUALITY = 4
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+BINARY_ACCEPT_TYPES = tuple(
+    media_type.strip().lower()
+    for media_type in os.environ.get(
+        'BINARY_MEDIA_TYPES', 'application/vnd.lplivings+json,application/vnd.lplivings.catalog+json'
+    ).split(',')
+    if media_type.strip()
+)
+
+# Per-route counters for this container; every compressed response is also
+# recorded as a CloudWatch metric with its route, ratio and CPU cost
+compression_stats = {}
+
+
+def available_encodings():
+    return tuple(encoding for encoding in ENCODINGS if encoding != 'br' or brotli is not None)
+
+
+def accepted_encodings(accept_encoding):
+    """Encodings an Accept-Encoding header allows (q > 0), lowercased"""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def negotiate_encoding(accept_encoding):
+    """Best available encoding the client accepts, or None for identity"""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in available_encodings():
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+def compress(data, encoding, fast=False):
+    """Compress bytes with a Content-Encoding; gzip output is deterministic"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=RESPONSE_GZIP_LEVEL if fast else GZIP_LEVEL, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=RESPONSE_BROTLI_QUALITY if fast else BROTLI_QUALITY)
+    raise ValueError(f'Unsupported encoding: {encoding}')
+
+
+def get_compression_stats():
+    """Snapshot of the per-route compression counters, with ratios"""
+    stats = {}
+    for route, counters in compression_stats.items():
+        stats[route] = dict(counters)
+        if counters['bytesOut']:
+            stats[route]['ratio'] = round(counters['bytesIn'] / counters['bytesOut'], 2)
+    return stats
+
+
+def reset_compression_stats():
+    compression_stats.clear()
+
+
+def _header(event, name):
+    for key, value in ((event or {}).get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def accepts_binary(event):
+    """True if API Gateway will pass a binary body through for this request"""
+    accept = (_header(event, 'Accept') or '').split(',')[0].split(';')[0].strip().lower()
+    return accept in BINARY_ACCEPT_TYPES
+
+
+def route_name(event):
+    event = event or {}
+    return f"{event.get('httpMethod', '')} {event.get('resource') or event.get('path') or ''}".strip()
+
+
+def compress_response(event, response):
+    """Compress a Lambda proxy response body if the client and size allow it"""
+    if not isinstance(response, dict):
+        return response
+    headers = dict(response.get('headers') or {})
+    if any(key.lower() == 'vary' for key in headers):
+        vary_key = next(key for key in headers if key.lower() == 'vary')
+        if 'accept-encoding' not in headers[vary_key].lower():
+            headers[vary_key] += ', Accept-Encoding'
+    else:
+        headers['Vary'] = 'Accept, Accept-Encoding'
+    response = {**response, 'headers': headers}
+
+    body = response.get('body')
+    if (response.get('isBase64Encoded') or not isinstance(body, str)
+            or any(key.lower() == 'content-encoding' for key in headers)):
+        return response
+    data = body.encode('utf-8')
+    if len(data) < COMPRESSION_MIN_BYTES or not accepts_binary(event):
+        return response
+    encoding = negotiate_encoding(_header(event, 'Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    started = time.process_time()
+    encoded = compress(data, encoding, fast=True)
+    elapsed = time.process_time() - started
+    counters = compression_stats.setdefault(
+        route_name(event), {'responses': 0, 'bytesIn': 0, 'bytesOut': 0, 'cpuSeconds': 0.0}
+    )
+    counters['responses'] += 1
+    counters['bytesIn'] += len(data)
+    counters['bytesOut'] += len(encoded)
+    counters['cpuSeconds'] += elapsed
+    put_metrics(
+        {'Route': route_name(event), 'Encoding': encoding},
+        {
+            'CompressionBytesIn': len(data),
+            'CompressionBytesOut': len(encoded),
+            'CompressionRatio': round(len(data) / max(len(encoded), 1), 2),
+            'CompressionCpuMilliseconds': round(elapsed * 1000, 3)
+        },
+        {'CompressionBytesIn': 'Bytes', 'CompressionBytesOut': 'Bytes', 'CompressionCpuMilliseconds': 'Milliseconds'}
+    )
+    if len(encoded) >= len(data):
+        return response
+
+    headers['Content-Encoding'] = encoding
+    return {**response, 'body': base64.b64encode(encoded).decode('ascii'), 'isBase64Encoded': True}
+
+
+def compressed_responses(handler):
+    """Decorate a Lambda proxy handler so its responses are content-negotiated"""
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        return compress_response(event, handler(event, context))
+    return wrapper
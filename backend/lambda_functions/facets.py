@@ -0,0 +1,175 @@
+from array import array
+
+from catalog_index import category_key, product_price
+
+# numpy is imported by the first summary rather than with this module, so
+# cold starts that never serve facets do not pay for it; None if unavailable
+_NOT_IMPORTED = object()
+np = _NOT_IMPORTED
+
+DEFAULT_BUCKETS = 10
+MAX_BUCKETS = 50
+PERCENTILES = (25, 50, 75, 90)
+
+
+def _numpy():
+    global np
+    if np is _NOT_IMPORTED:
+        try:
+            import numpy
+            np = numpy
+        except ImportError as e:
+            print(f"Failed to import numpy: {e}")
+            np = None
+    return np
+
+
+def _percentile(sorted_values, percentile):
+    """Linear-interpolated percentile, matching numpy's default method"""
+    position = (len(sorted_values) - 1) * percentile / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class FacetIndex:
+    """Columnar price and category data for facet counts and price histograms.
+
+    Prices and category codes live in flat typed arrays (one row per product)
+    that writes append to or swap-remove from, so summaries are vectorized
+    NumPy passes over contiguous memory. Summaries are memoized until the
+    next change.
+    """
+
+    def __init__(self, version=0):
+        self.version = version
+        self.rows = {}
+        self.ids = []
+        self.prices = array('d')
+        self.codes = array('i')
+        self.category_codes = {}
+        self.category_names = []
+        self.summaries = {}
+
+    @classmethod
+    def build(cls, products, version):
+        index = cls(version)
+        for product in products:
+            index.add(product)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _category_code(self, category):
+        key = category_key(category)
+        if key not in self.category_codes:
+            self.category_codes[key] = len(self.category_names)
+            self.category_names.append((category or '').strip() or 'Uncategorized')
+        return self.category_codes[key]
+
+    def add(self, product):
+        self.remove(product['id'])
+        self.rows[product['id']] = len(self.ids)
+        self.ids.append(product['id'])
+        self.prices.append(product_price(product))
+        self.codes.append(self._category_code(product.get('category')))
+        self.summaries.clear()
+
+    def remove(self, product_id):
+        row = self.rows.pop(product_id, None)
+        if row is None:
+            return
+        # Move the last row into the gap so the columns stay contiguous
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.ids[row] = moved_id
+            self.prices[row] = self.prices[last]
+            self.codes[row] = self.codes[last]
+            self.rows[moved_id] = row
+        self.ids.pop()
+        self.prices.pop()
+        self.codes.pop()
+        self.summaries.clear()
+
+    def apply_changes(self, upserts, removed_ids, version):
+        """Incrementally move the index to a new catalogue version"""
+        for product_id in removed_ids:
+            self.remove(product_id)
+        for product in upserts:
+            self.add(product)
+        self.version = version
+
+    def summary(self, category=None, buckets=DEFAULT_BUCKETS):
+        """Category counts, price statistics and a price histogram, optionally within one category"""
+        key = (category_key(category) if category else None, buckets)
+        if key not in self.summaries:
+            self.summaries[key] = self._summarize(key[0], buckets)
+        return self.summaries[key]
+
+    def _summarize(self, category, buckets):
+        code = self.category_codes.get(category) if category is not None else None
+        np = _numpy()
+        if np is not None:
+            prices = np.frombuffer(self.prices, dtype=np.float64).copy()
+            codes = np.frombuffer(self.codes, dtype=np.intc).copy()
+            counts = np.bincount(codes, minlength=len(self.category_names)).tolist() if len(codes) else []
+            if category is not None:
+                prices = prices[codes == code] if code is not None else prices[:0]
+        else:
+            counts = [0] * len(self.category_names)
+            for product_code in self.codes:
+                counts[product_code] += 1
+            prices = [price for price, product_code in zip(self.prices, self.codes)
+                      if category is None or product_code == code]
+
+        categories = sorted(
+            ({'name': self.category_names[i], 'count': count} for i, count in enumerate(counts) if count),
+            key=lambda facet: (-facet['count'], facet['name'])
+        )
+        return {
+            'total': len(prices),
+            'categories': categories,
+            'price': self._price_stats(prices),
+            'histogram': self._histogram(prices, buckets)
+        }
+
+    def _price_stats(self, prices):
+        if not len(prices):
+            return None
+        np = _numpy()
+        if np is not None:
+            values = np.percentile(prices, PERCENTILES).tolist()
+            low, high = float(prices.min()), float(prices.max())
+        else:
+            ordered = sorted(prices)
+            values = [_percentile(ordered, p) for p in PERCENTILES]
+            low, high = ordered[0], ordered[-1]
+        stats = {'min': low, 'max': high}
+        stats.update({f'p{p}': round(value, 2) for p, value in zip(PERCENTILES, values)})
+        return stats
+
+    def _histogram(self, prices, buckets):
+        if not len(prices):
+            return []
+        np = _numpy()
+        if np is not None:
+            low, high = float(prices.min()), float(prices.max())
+        else:
+            low, high = min(prices), max(prices)
+        if low == high:
+            return [{'min': float(low), 'max': float(high), 'count': len(prices)}]
+        if np is not None:
+            counts, edges = np.histogram(prices, bins=buckets, range=(low, high))
+            counts, edges = counts.tolist(), edges.tolist()
+        else:
+            width = (high - low) / buckets
+            counts = [0] * buckets
+            for price in prices:
+                counts[min(int((price - low) / width), buckets - 1)] += 1
+            edges = [low + width * i for i in range(buckets)] + [high]
+        return [
+            {'min': round(edges[i], 2), 'max': round(edges[i + 1], 2), 'count': count}
+            for i, count in enumerate(counts)
+        ]
@@ -0,0 +1,161 @@
+import io
+import json
+import struct
+
+try:
+    import numpy as np
+except ImportError as e:
+    print(f"Failed to import numpy: {e}")
+    np = None
+
+# Visual similarity over product images.
+#
+# Each image is reduced to a small descriptor: a coarse RGB colour histogram
+# and a DCT perceptual hash of the downscaled greyscale image. Both halves are
+# scaled so the descriptor has unit length, making the dot product of two
+# descriptors a weighted blend of colour and shape similarity. Descriptors are
+# stored as one contiguous float32 matrix, so a nearest-neighbour query is a
+# single matrix-vector product over the whole catalogue.
+#
+# File layout (little-endian):
+#   header   HEADER
+#   rows     JSON array of [product id, image key], one per matrix row
+#   matrix   count x DIMENSIONS float32, starting at an aligned offset
+
+THUMBNAIL_SIZE = 64
+COLOR_BINS = 4
+DCT_SIZE = 32
+HASH_SIZE = 8
+DIMENSIONS = COLOR_BINS ** 3 + HASH_SIZE ** 2
+
+# Share of the similarity score that comes from colour; the rest is shape
+COLOR_WEIGHT = 0.6
+
+MAGIC = b'PIMF'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHIII')
+MATRIX_ALIGNMENT = 16
+
+
+def dct_matrix(size):
+    """Orthonormal DCT-II basis, so a 2-D DCT is D @ X @ D.T"""
+    k = np.arange(size, dtype=np.float64)[:, None]
+    i = np.arange(size, dtype=np.float64)[None, :]
+    basis = np.cos(np.pi * (2 * i + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    basis[0] /= np.sqrt(2)
+    return basis.astype(np.float32)
+
+
+DCT_BASIS = dct_matrix(DCT_SIZE) if np is not None else None
+
+
+def describe_image(data):
+    """Unit-length float32 descriptor of encoded image bytes"""
+    # Pillow is only needed here, so the similar-products query never loads it
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    if np is None or Image is None:
+        raise RuntimeError('Image features need numpy and Pillow')
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs decode directly at a reduced scale, which is most of the cost saved
+        image.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        thumbnail = image.convert('RGB').resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BILINEAR)
+
+    pixels = np.asarray(thumbnail, dtype=np.uint8) // (256 // COLOR_BINS)
+    codes = (pixels[..., 0].astype(np.int32) * COLOR_BINS + pixels[..., 1]) * COLOR_BINS + pixels[..., 2]
+    histogram = np.bincount(codes.ravel(), minlength=COLOR_BINS ** 3).astype(np.float32)
+    # Square roots of the bin shares have unit length and damp dominant colours
+    histogram = np.sqrt(histogram / histogram.sum())
+
+    grey = np.asarray(thumbnail.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.BILINEAR), dtype=np.float32)
+    low_frequencies = (DCT_BASIS @ grey @ DCT_BASIS.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    # The DC term is overall brightness, not shape, so it does not set the threshold
+    median = np.median(low_frequencies[1:])
+    shape = np.where(low_frequencies > median, 1.0, -1.0).astype(np.float32) / HASH_SIZE
+
+    return np.concatenate((
+        np.sqrt(COLOR_WEIGHT) * histogram,
+        np.sqrt(1 - COLOR_WEIGHT) * shape
+    )).astype(np.float32)
+
+
+class FeatureMatrix:
+    """Image descriptors of catalogue products, one matrix row per product"""
+
+    def __init__(self, rows=(), matrix=None):
+        self.rows = [tuple(row) for row in rows]
+        if matrix is None:
+            matrix = np.zeros((len(self.rows), DIMENSIONS), dtype=np.float32)
+        self.matrix = matrix
+        self.positions = {product_id: position for position, (product_id, _) in enumerate(self.rows)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, product_id):
+        return product_id in self.positions
+
+    def image_keys(self):
+        return {product_id: key for product_id, key in self.rows}
+
+    def nearest(self, product_id, limit=10):
+        """Return [(product_id, score)] of the most similar other images, best first"""
+        position = self.positions.get(product_id)
+        if position is None or len(self.rows) < 2:
+            return []
+        scores = self.matrix @ self.matrix[position]
+        scores[position] = -np.inf
+        limit = min(limit, len(self.rows) - 1)
+        if limit < len(self.rows) - 1:
+            # Only the candidates that can make the top results need sorting
+            candidates = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            candidates = np.flatnonzero(np.isfinite(scores))
+        ranked = sorted(candidates.tolist(), key=lambda row: (-scores[row], self.rows[row][0]))
+        return [(self.rows[row][0], round(float(scores[row]), 4)) for row in ranked]
+
+    def refresh(self, entries, describe):
+        """A matrix for the given (product_id, image_key) entries.
+
+        Rows whose image is unchanged are copied; describe(image_key) is only
+        called for new or replaced images and may return None to leave a
+        product out.
+        """
+        known = self.image_keys()
+        rows = []
+        vectors = []
+        for product_id, key in entries:
+            if known.get(product_id) == key:
+                vector = self.matrix[self.positions[product_id]]
+            else:
+                vector = describe(key)
+                if vector is None:
+                    continue
+            rows.append((product_id, key))
+            vectors.append(vector)
+        matrix = np.ascontiguousarray(np.vstack(vectors), dtype=np.float32) if vectors else None
+        return FeatureMatrix(rows, matrix)
+
+    def to_bytes(self):
+        rows_json = json.dumps([list(row) for row in self.rows], separators=(',', ':')).encode('utf-8')
+        matrix_offset = HEADER.size + len(rows_json)
+        padding = -matrix_offset % MATRIX_ALIGNMENT
+        matrix_offset += padding
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, DIMENSIONS, len(self.rows), len(rows_json), matrix_offset)
+        return b''.join((header, rows_json, b'\0' * padding, self.matrix.astype('<f4').tobytes()))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Read a stored matrix; the descriptors are a view of data, not a copy"""
+        if len(data) < HEADER.size:
+            raise ValueError('Truncated image feature file')
+        magic, format_version, dimensions, count, rows_length, matrix_offset = HEADER.unpack_from(data)
+        if magic != MAGIC or format_version != FORMAT_VERSION or dimensions != DIMENSIONS:
+            raise ValueError('Not an image feature file')
+        if matrix_offset + count * DIMENSIONS * 4 != len(data):
+            raise ValueError('Corrupt image feature file')
+        rows = json.loads(bytes(data[HEADER.size:HEADER.size + rows_length]))
+        matrix = np.frombuffer(data, dtype='<f4', count=count * DIMENSIONS, offset=matrix_offset)
+        return cls(rows, matrix.reshape(count, DIMENSIONS))
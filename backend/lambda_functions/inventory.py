@@ -0,0 +1,315 @@
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from s3_store import RETRY_BASE_DELAY, ConflictError, is_conflict, read_json, update_json, write_json
+
+# Per-product stock with reserve / commit / release.
+#
+# A tracked product's stock is split evenly across SHARDS small JSON objects.
+# A checkout takes units from one shard with a single conditional write; if
+# another checkout wrote that shard first it moves on to the next shard
+# instead of retrying, so concurrent checkouts of one hot product spread
+# their writes rather than queueing on one object. Units taken are held on
+# the shard under the reservation's ID until the order is paid (commit) or
+# abandoned (release). Holds that outlive their TTL are returned to stock by
+# the next write to their shard, so an abandoned checkout never needs cleanup.
+#
+# Products without shard objects are not tracked and never run out.
+# Changing INVENTORY_SHARDS requires setting each product's stock again.
+
+INVENTORY_PREFIX = 'inventory/'
+SHARDS = int(os.environ.get('INVENTORY_SHARDS', '8'))
+RESERVATION_TTL = int(os.environ.get('RESERVATION_TTL_SECONDS', '900'))
+
+# Passes over the shards that were busy before a reservation gives up
+MAX_ROUNDS = 4
+
+# Returned by _try_update when a concurrent writer won the race
+BUSY = object()
+
+# Per-container counters so contention shows up in logs and benchmarks
+inventory_stats = {'reservations': 0, 'shardWrites': 0, 'busyShards': 0, 'outOfStock': 0}
+
+
+class OutOfStockError(Exception):
+    """Not enough units of a product to reserve"""
+
+    def __init__(self, product_id, requested, available):
+        super().__init__(f'Only {available} of {product_id} available, {requested} requested')
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+
+class ReservationError(Exception):
+    """A reservation that is unknown or can no longer be committed"""
+
+
+def shard_key(product_id, shard):
+    return f'{INVENTORY_PREFIX}items/{product_id}/{shard}.json'
+
+
+def reservation_key(reservation_id):
+    return f'{INVENTORY_PREFIX}reservations/{reservation_id}.json'
+
+
+def empty_shard():
+    return {'available': 0, 'holds': {}, 'sold': 0}
+
+
+def get_inventory_stats():
+    return dict(inventory_stats)
+
+
+def reset_inventory_stats():
+    for name in inventory_stats:
+        inventory_stats[name] = 0
+
+
+def reclaim_expired(shard, now):
+    """Return expired holds to available stock; True if any were reclaimed"""
+    expired = [reservation_id for reservation_id, hold in shard['holds'].items() if hold['expiresAt'] <= now]
+    for reservation_id in expired:
+        shard['available'] += shard['holds'].pop(reservation_id)['quantity']
+    return bool(expired)
+
+
+def _try_update(s3_client, bucket, key, mutate):
+    """One conditional read-modify-write, without retrying.
+
+    Returns the stored document (the current one if mutate returned None),
+    None if the object does not exist, or BUSY if another writer got there
+    first.
+    """
+    current, etag = read_json(s3_client, bucket, key)
+    if current is None:
+        return None
+    updated = mutate(current)
+    if updated is None:
+        return current
+    try:
+        write_json(s3_client, bucket, key, updated, etag)
+    except ClientError as e:
+        if not is_conflict(e):
+            raise
+        inventory_stats['busyShards'] += 1
+        return BUSY
+    inventory_stats['shardWrites'] += 1
+    return updated
+
+
+def reserve_product(s3_client, bucket, product_id, quantity, reservation_id, expires_at):
+    """Hold quantity units of one product.
+
+    Returns the [[shard, quantity]] taken, or None if the product is not
+    tracked. Raises OutOfStockError, or ConflictError if shards stayed busy;
+    either way nothing is left held.
+    """
+    start = random.randrange(SHARDS)
+    pending = [(start + offset) % SHARDS for offset in range(SHARDS)]
+    allocations = []
+    remaining = quantity
+    busy = []
+    for round_number in range(MAX_ROUNDS):
+        busy = []
+        for shard in pending:
+            taken = 0
+
+            def take(document):
+                nonlocal taken
+                reclaimed = reclaim_expired(document, time.time())
+                taken = min(remaining, document['available'])
+                if not taken:
+                    return document if reclaimed else None
+                document['available'] -= taken
+                hold = document['holds'].setdefault(reservation_id, {'quantity': 0, 'expiresAt': expires_at})
+                hold['quantity'] += taken
+                return document
+
+            result = _try_update(s3_client, bucket, shard_key(product_id, shard), take)
+            if result is None:
+                if not allocations:
+                    return None
+                continue
+            if result is BUSY:
+                busy.append(shard)
+                continue
+            if taken:
+                allocations.append([shard, taken])
+                remaining -= taken
+                if not remaining:
+                    return allocations
+        if not busy:
+            break
+        pending = busy
+        time.sleep(random.uniform(0, RETRY_BASE_DELAY * (2 ** round_number)))
+
+    for shard, _ in allocations:
+        _settle(s3_client, bucket, product_id, shard, reservation_id, restock=True)
+    if busy:
+        raise ConflictError(f'Too many concurrent checkouts of {product_id}, please retry')
+    inventory_stats['outOfStock'] += 1
+    raise OutOfStockError(product_id, quantity, quantity - remaining)
+
+
+def _settle(s3_client, bucket, product_id, shard, reservation_id, restock):
+    """Remove a reservation's hold from a shard, restocking or selling it.
+
+    Returns the quantity the hold still had; 0 if it was already settled or
+    reclaimed after expiring.
+    """
+    settled = 0
+
+    def settle(document):
+        nonlocal settled
+        reclaimed = reclaim_expired(document, time.time())
+        hold = document['holds'].pop(reservation_id, None)
+        settled = hold['quantity'] if hold else 0
+        if not settled:
+            return document if reclaimed else None
+        if restock:
+            document['available'] += settled
+        else:
+            document['sold'] = document.get('sold', 0) + settled
+        return document
+
+    update_json(s3_client, bucket, shard_key(product_id, shard), settle)
+    return settled
+
+
+def _set_state(s3_client, bucket, reservation, state):
+    def mutate(current):
+        if current is None or current.get('state') == state:
+            return None
+        return {**current, 'state': state, f'{state}At': time.time()}
+
+    stored, _ = update_json(s3_client, bucket, reservation_key(reservation['id']), mutate)
+    return stored or reservation
+
+
+def reserve(s3_client, bucket, lines, ttl=None):
+    """Hold stock for [(product_id, quantity)] lines.
+
+    Returns the stored reservation, or None when none of the products is
+    tracked. Raises OutOfStockError (or ConflictError) with nothing held.
+    """
+    now = time.time()
+    reservation = {
+        'id': uuid.uuid4().hex,
+        'state': 'held',
+        'createdAt': now,
+        'expiresAt': now + (RESERVATION_TTL if ttl is None else ttl),
+        'items': {}
+    }
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    try:
+        for product_id, quantity in quantities.items():
+            allocations = reserve_product(
+                s3_client, bucket, product_id, quantity, reservation['id'], reservation['expiresAt']
+            )
+            if allocations is not None:
+                reservation['items'][product_id] = allocations
+        if reservation['items']:
+            write_json(s3_client, bucket, reservation_key(reservation['id']), reservation)
+    except Exception:
+        _settle_all(s3_client, bucket, reservation, restock=True)
+        raise
+    if not reservation['items']:
+        return None
+    inventory_stats['reservations'] += 1
+    return reservation
+
+
+def _settle_all(s3_client, bucket, reservation, restock):
+    """Settle every hold of a reservation; returns {product_id: quantity settled}"""
+    settled = {}
+    for product_id, allocations in reservation['items'].items():
+        settled[product_id] = sum(
+            _settle(s3_client, bucket, product_id, shard, reservation['id'], restock)
+            for shard, _ in allocations
+        )
+    return settled
+
+
+def commit_reservation(s3_client, bucket, reservation_id):
+    """Turn a reservation's holds into sales; idempotent.
+
+    Units whose hold expired and went back to stock are taken again, which
+    raises OutOfStockError if they have been sold to someone else since.
+    """
+    reservation, _ = read_json(s3_client, bucket, reservation_key(reservation_id))
+    if reservation is None:
+        raise ReservationError(f'Unknown reservation {reservation_id}')
+    if reservation['state'] == 'committed':
+        return reservation
+    if reservation['state'] == 'released':
+        raise ReservationError(f'Reservation {reservation_id} has been released')
+
+    expired = time.time() >= reservation['expiresAt']
+    settled = _settle_all(s3_client, bucket, reservation, restock=False)
+    # Before expiry a missing hold can only mean an earlier commit settled it
+    if expired:
+        for product_id, allocations in reservation['items'].items():
+            shortfall = sum(quantity for _, quantity in allocations) - settled[product_id]
+            if shortfall:
+                retaken = reserve_product(
+                    s3_client, bucket, product_id, shortfall, reservation_id, time.time() + RESERVATION_TTL
+                ) or []
+                for shard, _ in retaken:
+                    _settle(s3_client, bucket, product_id, shard, reservation_id, restock=False)
+    return _set_state(s3_client, bucket, reservation, 'committed')
+
+
+def release_reservation(s3_client, bucket, reservation_id):
+    """Return a held reservation's units to stock; committed sales are left alone"""
+    reservation, _ = read_json(s3_client, bucket, reservation_key(reservation_id))
+    if reservation is None or reservation['state'] != 'held':
+        return reservation
+    _settle_all(s3_client, bucket, reservation, restock=True)
+    return _set_state(s3_client, bucket, reservation, 'released')
+
+
+def set_stock(s3_client, bucket, product_id, quantity):
+    """Set the units available to reserve, spread evenly over the shards.
+
+    Units currently held by reservations are not counted and stay held.
+    """
+    shares = [quantity // SHARDS + (1 if shard < quantity % SHARDS else 0) for shard in range(SHARDS)]
+
+    def write(shard):
+        def mutate(document):
+            document = document or empty_shard()
+            reclaim_expired(document, time.time())
+            document['available'] = shares[shard]
+            return document
+        update_json(s3_client, bucket, shard_key(product_id, shard), mutate)
+
+    with ThreadPoolExecutor(max_workers=SHARDS) as pool:
+        list(pool.map(write, range(SHARDS)))
+
+
+def get_stock(s3_client, bucket, product_id):
+    """{'available', 'held', 'sold'} totals over the shards, or None if untracked"""
+    with ThreadPoolExecutor(max_workers=SHARDS) as pool:
+        shards = [document for document, _ in pool.map(
+            lambda shard: read_json(s3_client, bucket, shard_key(product_id, shard)), range(SHARDS)
+        )]
+    if all(document is None for document in shards):
+        return None
+    now = time.time()
+    totals = {'available': 0, 'held': 0, 'sold': 0}
+    for document in shards:
+        if document is None:
+            continue
+        reclaim_expired(document, now)
+        totals['available'] += document['available']
+        totals['held'] += sum(hold['quantity'] for hold in document['holds'].values())
+        totals['sold'] += document.get('sold', 0)
+    return totals
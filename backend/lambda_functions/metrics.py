@@ -0,0 +1,37 @@
+import json
+import os
+import time
+
+# CloudWatch metrics written as log lines in the Embedded Metric Format.
+#
+# Lambda ships stdout to CloudWatch Logs, which turns any line carrying an
+# "_aws" block into metrics, so this needs no client, no extra permissions
+# and no network call on the request path.
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'LPLivings/Backend')
+METRICS_ENABLED = os.environ.get('EMIT_METRICS', 'true').lower() == 'true'
+
+
+def put_metrics(dimensions, values, units=None):
+    """Print one EMF line recording values ({name: number}) under dimensions ({name: str}).
+
+    units maps metric names to CloudWatch units; unnamed ones are 'None'.
+    Returns the record, or None when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return None
+    units = units or {}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': units.get(name, 'None')} for name in values]
+            }]
+        },
+        **dimensions,
+        **values
+    }
+    print(json.dumps(record, separators=(',', ':')))
+    return record
@@ -0,0 +1,196 @@
+import os
+import random
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from s3_store import read_json, update_json
+
+# Near-duplicate listing detection with MinHash and locality-sensitive hashing.
+#
+# Each product's name and description are reduced to a set of character
+# shingles and summarized by a MinHash signature: for each of NUM_HASHES hash
+# functions, the smallest hash over the shingles. Two signatures agree in
+# roughly the fraction of positions given by the Jaccard similarity of the
+# shingle sets. Signatures are cut into BANDS bands; products sharing any
+# whole band land in the same bucket, so a lookup only compares against the
+# few products in its buckets instead of the whole catalogue.
+#
+# The buckets are spread over SHARDS small JSON objects by a hash of the band
+# key, each mapping band key -> [product IDs]. A lookup reads only the shards
+# its own band keys fall in and a write updates only those of the products it
+# added. Signatures are never stored: candidates are confirmed against their
+# current product text, and memberships left behind by edits and deletes are
+# pruned when a lookup finds them.
+
+SHINGLE_SIZE = 4
+NUM_HASHES = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_HASHES // BANDS
+
+# Estimated Jaccard similarity at or above which listings count as duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+BUCKET_PREFIX = 'products/catalog/duplicates/'
+SHARDS = int(os.environ.get('DUPLICATE_BUCKET_SHARDS', '256'))
+
+# Parallel S3 requests when reading or writing bucket shards
+SHARD_CONCURRENCY = 16
+
+# Mersenne prime modulus for the universal hash family; with 31-bit inputs
+# and coefficients every product fits in 64 bits
+PRIME = (1 << 31) - 1
+_generator = random.Random(20240611)
+HASH_COEFFICIENTS = [(_generator.randrange(1, PRIME), _generator.randrange(0, PRIME)) for _ in range(NUM_HASHES)]
+
+WHITESPACE = re.compile(r'\s+')
+NON_WORD = re.compile(r'[^a-z0-9 ]+')
+
+
+def normalize_text(product):
+    text = f"{product.get('name') or ''} {product.get('description') or ''}".lower()
+    return WHITESPACE.sub(' ', NON_WORD.sub(' ', text)).strip()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Hashed character shingles of normalized text"""
+    if len(text) <= size:
+        return {zlib.crc32(text.encode('utf-8')) % PRIME} if text else set()
+    return {zlib.crc32(text[i:i + size].encode('utf-8')) % PRIME for i in range(len(text) - size + 1)}
+
+
+def minhash(product):
+    """MinHash signature of a product's name and description, or None if it has no text"""
+    hashed = shingles(normalize_text(product))
+    if not hashed:
+        return None
+    return [min((a * x + b) % PRIME for x in hashed) for a, b in HASH_COEFFICIENTS]
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_HASHES
+
+
+def band_keys(signature):
+    return [
+        f"{band}:{zlib.crc32(repr(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]).encode('ascii'))}"
+        for band in range(BANDS)
+    ]
+
+
+def shard_key(shard):
+    return f'{BUCKET_PREFIX}{shard:03d}.json'
+
+
+def shard_of(band_key):
+    return zlib.crc32(band_key.encode('ascii')) % SHARDS
+
+
+def _parallel(action, items):
+    items = list(items)
+    if len(items) <= 1:
+        return [action(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(SHARD_CONCURRENCY, len(items))) as pool:
+        return list(pool.map(action, items))
+
+
+def bucket_memberships(products):
+    """{shard: {band_key: {product IDs}}} for the products' signatures"""
+    by_shard = {}
+    for product in products:
+        signature = minhash(product)
+        if signature is None:
+            continue
+        for key in band_keys(signature):
+            by_shard.setdefault(shard_of(key), {}).setdefault(key, set()).add(product['id'])
+    return by_shard
+
+
+def _update_shards(s3_client, bucket, by_shard, change):
+    """Apply change(document, band_key, ids) -> bool to each touched shard, one conditional write each"""
+    def update(shard):
+        def mutate(current):
+            current = current or {}
+            changed = False
+            for key, ids in by_shard[shard].items():
+                changed = change(current, key, ids) or changed
+            return current if changed else None
+        update_json(s3_client, bucket, shard_key(shard), mutate)
+    _parallel(update, sorted(by_shard))
+
+
+def _add_members(document, key, ids):
+    members = document.setdefault(key, [])
+    added = sorted(set(ids).difference(members))
+    members.extend(added)
+    return bool(added)
+
+
+def _remove_members(document, key, ids):
+    members = document.get(key)
+    if not members or not set(ids).intersection(members):
+        return False
+    remaining = [member for member in members if member not in ids]
+    if remaining:
+        document[key] = remaining
+    else:
+        del document[key]
+    return True
+
+
+def add_to_buckets(s3_client, bucket, products):
+    """Add products to the buckets of their band keys; only the shards they touch are written"""
+    _update_shards(s3_client, bucket, bucket_memberships(products), _add_members)
+
+
+def rebuild_buckets(s3_client, bucket, products):
+    """Replace every shard with buckets for exactly these products"""
+    by_shard = bucket_memberships(products)
+
+    def write(shard):
+        document = {key: sorted(ids) for key, ids in by_shard.get(shard, {}).items()}
+        update_json(s3_client, bucket, shard_key(shard), lambda current: document if current != document else None)
+    _parallel(write, range(SHARDS))
+
+
+def find_duplicates(s3_client, bucket, product, load_products, threshold=DUPLICATE_THRESHOLD, limit=5):
+    """Return [(product_id, similarity)] of likely duplicates, most similar first.
+
+    load_products(ids) returns the current records of the candidate products.
+    A candidate that is gone, or whose text no longer hashes to the bucket
+    it was found in, is removed from that bucket.
+    """
+    signature = minhash(product)
+    if signature is None:
+        return []
+    keys = band_keys(signature)
+    shards = sorted({shard_of(key) for key in keys})
+    documents = dict(zip(shards, _parallel(lambda shard: read_json(s3_client, bucket, shard_key(shard))[0], shards)))
+    found_in = {}
+    for key in keys:
+        for candidate in (documents[shard_of(key)] or {}).get(key, ()):
+            found_in.setdefault(candidate, set()).add(key)
+    found_in.pop(product.get('id'), None)
+
+    records = {record['id']: record for record in load_products(sorted(found_in))}
+    matches = []
+    stale = {}
+    for candidate, candidate_keys in found_in.items():
+        record = records.get(candidate)
+        candidate_signature = minhash(record) if record else None
+        current_keys = set(band_keys(candidate_signature)) if candidate_signature else set()
+        for key in candidate_keys - current_keys:
+            stale.setdefault(shard_of(key), {}).setdefault(key, set()).add(candidate)
+        if candidate_signature is None:
+            continue
+        score = similarity(signature, candidate_signature)
+        if score >= threshold:
+            matches.append((candidate, round(score, 3)))
+    if stale:
+        try:
+            _update_shards(s3_client, bucket, stale, _remove_members)
+        except Exception as e:
+            print(f"Error pruning duplicate buckets: {e}")
+    matches.sort(key=lambda match: (-match[1], match[0]))
+    return matches[:limit]
@@ -1,13 +1,27 @@
 import json
 import boto3
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from secrets_manager import get_admin_emails
+from s3_store import ConflictError, read_json, update_json
+from catalog_prices import (
+    CURRENCY, PriceMismatchError, PricingError, from_cents, load_price_index, price_order, to_cents
+)
+from inventory import OutOfStockError, commit_reservation, release_reservation, reserve
+from compression import compressed_responses
 
 s3_client = boto3.client('s3')
 S3_BUCKET = os.environ.get('S3_BUCKET', 'ecommerce-product-images')
 
+# A pending order nobody paid for is cancelled after this long and its held
+# stock given back. Longer than the reservation TTL, since a late payment
+# can still sell the stock if it is free.
+PENDING_ORDER_TTL = int(os.environ.get('PENDING_ORDER_TTL_SECONDS', '3600'))
+
+class PaymentError(ValueError):
+    """A payment intent that does not pay for the order it is applied to"""
+
 # Admin emails who can view all orders and update status
 def get_admin_emails_list():
     """Get admin emails from Secrets Manager with fallback"""
@@ -17,6 +31,7 @@ def get_admin_emails_list():
     # Fallback to environment variable
     return os.environ.get('ADMIN_EMAILS', 'admin@example.com').split(',')
 
+@compressed_responses
 def lambda_handler(event, context):
     http_method = event['httpMethod']
     
@@ -53,33 +68,31 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
+ORDERS_KEY = 'orders/orders.json'
+
 def get_orders_from_s3():
-    """Get orders from S3 JSON file"""
-    try:
-        response = s3_client.get_object(Bucket=S3_BUCKET, Key='orders/orders.json')
-        orders_data = json.loads(response['Body'].read().decode('utf-8'))
-        return orders_data.get('orders', [])
-    except s3_client.exceptions.NoSuchKey:
-        # File doesn't exist yet, return empty list
-        return []
-    except Exception as e:
-        print(f"Error reading orders from S3: {e}")
-        return []
+    """Get orders from S3 JSON file.
 
-def save_orders_to_s3(orders):
-    """Save orders to S3 JSON file"""
-    try:
-        orders_data = {'orders': orders, 'lastUpdated': datetime.now().isoformat()}
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key='orders/orders.json',
-            Body=json.dumps(orders_data, indent=2),
-            ContentType='application/json'
-        )
-        return True
-    except Exception as e:
-        print(f"Error saving orders to S3: {e}")
-        return False
+    Read errors propagate rather than looking like an empty order list.
+    """
+    orders_data, _ = read_json(s3_client, S3_BUCKET, ORDERS_KEY)
+    return (orders_data or {}).get('orders', [])
+
+def update_orders_in_s3(mutate):
+    """Apply mutate(orders) to the latest orders and save them with a conditional write.
+
+    mutate edits the list in place and returns False to skip the write. If
+    another invocation saved first, mutate is re-run against its orders so
+    neither update is lost. Returns the saved orders.
+    """
+    def merge(current):
+        orders = (current or {}).get('orders', [])
+        if mutate(orders) is False:
+            return None
+        return {'orders': orders, 'lastUpdated': datetime.now().isoformat()}
+    
+    orders_data, _ = update_json(s3_client, S3_BUCKET, ORDERS_KEY, merge)
+    return (orders_data or {}).get('orders', [])
 
 def get_user_email_from_token(event):
     """Extract user email from JWT token in Authorization header"""
@@ -177,34 +190,65 @@ def create_order(event, headers):
         body = json.loads(event['body'])
         order_id = f"order_{uuid.uuid4().hex[:8]}_{int(datetime.now().timestamp())}"
         
-        # Calculate total if not provided
-        items = body.get('items', [])
-        total = body.get('total', 0)
-        if not total and items:
-            total = sum(item.get('price', 0) * item.get('quantity', 1) for item in items)
+        # Price every line from the catalogue; the client's prices and total
+        # are only checked against it, never trusted
+        try:
+            items, total_cents = price_order(
+                body.get('items'), load_price_index(s3_client, S3_BUCKET), body.get('total') or None
+            )
+        except PriceMismatchError as e:
+            return {
+                'statusCode': 409,
+                'headers': headers,
+                'body': json.dumps({'error': str(e), 'items': e.items, 'total': from_cents(e.total_cents)})
+            }
+        except PricingError as e:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        # Every order starts pending and holds its stock until the payment is
+        # confirmed; the client cannot choose the status or claim a payment
+        status = 'pending'
+        try:
+            reservation = reserve(s3_client, S3_BUCKET, [(item['productId'], item['quantity']) for item in items])
+        except OutOfStockError as e:
+            return out_of_stock_response(headers, e)
         
         # Create order object
         new_order = {
             'id': order_id,
             'userId': body.get('userId', ''),
             'items': items,
-            'total': float(total),
-            'status': body.get('status', 'pending'),
+            'total': from_cents(total_cents),
+            'totalCents': total_cents,
+            'status': status,
             'createdAt': datetime.now().isoformat(),
             'customerInfo': body.get('customerInfo', {}),
-            'paymentIntentId': body.get('paymentIntentId', ''),
+            'paymentIntentId': '',
             'trackingNumber': '',
             'statusHistory': [{
-                'status': body.get('status', 'pending'),
+                'status': status,
                 'timestamp': datetime.now().isoformat(),
                 'updatedBy': 'system'
             }]
         }
+        if reservation:
+            new_order['reservationId'] = reservation['id']
+            new_order['reservationExpiresAt'] = datetime.fromtimestamp(reservation['expiresAt']).isoformat()
         
-        # Add to S3 storage
-        existing_orders = get_orders_from_s3()
-        existing_orders.append(new_order)
-        save_orders_to_s3(existing_orders)
+        # Add to S3 storage. A failed save has a hold to give back.
+        try:
+            update_orders_in_s3(lambda orders: orders.append(new_order))
+        except Exception:
+            if reservation:
+                try:
+                    release_reservation(s3_client, S3_BUCKET, reservation['id'])
+                except Exception as e:
+                    print(f"Could not release reservation {reservation['id']}: {e}")
+            raise
         
         return {
             'statusCode': 201,
@@ -215,6 +259,13 @@ def create_order(event, headers):
                 'order': new_order
             })
         }
+    except ConflictError as e:
+        print(f"Order write conflict in create_order: {e}")
+        return {
+            'statusCode': 409,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
     except Exception as e:
         print(f"Error in create_order: {e}")
         return {
@@ -223,15 +274,143 @@ def create_order(event, headers):
             'body': json.dumps({'error': f'Failed to create order: {str(e)}'})
         }
 
+def out_of_stock_response(headers, error):
+    print(f"Out of stock: {error}")
+    return {
+        'statusCode': 409,
+        'headers': headers,
+        'body': json.dumps({'error': str(error), 'productId': error.product_id, 'available': error.available})
+    }
+
+def record_inventory_error(order_id, error):
+    """Flag a saved order whose stock could not be committed, for follow-up"""
+    def apply_error(orders):
+        order = next((order for order in orders if order['id'] == order_id), None)
+        if order is None:
+            return False
+        order['inventoryError'] = error
+        return True
+    
+    try:
+        update_orders_in_s3(apply_error)
+    except Exception as e:
+        print(f"Could not record inventory error on order {order_id}: {e}")
+
+def check_payment(order, intent, orders):
+    """Raise PaymentError unless intent is a completed payment for order"""
+    if intent.status != 'succeeded':
+        raise PaymentError(f'Payment {intent.id} is not complete')
+    if (intent.metadata or {}).get('order_id') != order['id']:
+        raise PaymentError(f'Payment {intent.id} is not for order {order["id"]}')
+    if intent.currency != CURRENCY:
+        raise PaymentError(f'Payment {intent.id} is in {intent.currency}, not {CURRENCY}')
+    total_cents = order.get('totalCents', to_cents(order.get('total', 0)))
+    if intent.amount_received < total_cents:
+        raise PaymentError(f'Payment {intent.id} received {intent.amount_received} of {total_cents} cents')
+    if any(other['id'] != order['id'] and other.get('paymentIntentId') == intent.id for other in orders):
+        raise PaymentError(f'Payment {intent.id} is already recorded on another order')
+
+def mark_order_paid(order_id, intent):
+    """Move a pending order to processing once intent has paid for it, and sell its held stock.
+
+    intent is the Stripe PaymentIntent as retrieved from Stripe, never the
+    client's word: it must have succeeded, name this order in its metadata,
+    cover the order total in the store currency and not already pay for
+    another order. Returns the order, or None if there is no such order;
+    raises PaymentError if the intent does not pay for it. Confirming the
+    same intent again returns the order unchanged. A paid order whose stock
+    could not be committed is still marked paid, with inventoryError set for
+    follow-up.
+    """
+    found = None
+    newly_paid = False
+    def apply_payment(orders):
+        nonlocal found, newly_paid
+        newly_paid = False
+        found = next((order for order in orders if order['id'] == order_id), None)
+        if found is None:
+            return False
+        if found.get('status') != 'pending':
+            if found.get('paymentIntentId') == intent.id:
+                return False
+            raise PaymentError(f'Order {order_id} is {found.get("status")}')
+        check_payment(found, intent, orders)
+        found['status'] = 'processing'
+        found['paymentIntentId'] = intent.id
+        found['lastModified'] = datetime.now().isoformat()
+        found.setdefault('statusHistory', []).append({
+            'status': 'processing',
+            'timestamp': datetime.now().isoformat(),
+            'updatedBy': 'payment'
+        })
+        newly_paid = True
+        return True
+    
+    update_orders_in_s3(apply_payment)
+    
+    # The order is saved as paid before its stock is sold, so a failed commit
+    # leaves a paid order to follow up rather than stock sold for nothing
+    if newly_paid and found.get('reservationId'):
+        try:
+            commit_reservation(s3_client, S3_BUCKET, found['reservationId'])
+        except Exception as e:
+            print(f"Could not commit stock for paid order {order_id}: {e}")
+            found['inventoryError'] = str(e)
+            record_inventory_error(order_id, str(e))
+    return found
+
+def expire_pending_orders(event, context):
+    """Cancel orders left pending past PENDING_ORDER_TTL and give back their held stock.
+
+    Runs on a schedule, so checkouts that were abandoned or failed before
+    payment do not stay pending forever.
+    """
+    cutoff = (datetime.now() - timedelta(seconds=PENDING_ORDER_TTL)).isoformat()
+    expired = []
+    def apply_expiry(orders):
+        expired.clear()
+        for order in orders:
+            if order.get('status') == 'pending' and order.get('createdAt', '') < cutoff:
+                order['status'] = 'cancelled'
+                order['lastModified'] = datetime.now().isoformat()
+                order.setdefault('statusHistory', []).append({
+                    'status': 'cancelled',
+                    'timestamp': datetime.now().isoformat(),
+                    'updatedBy': 'expiry'
+                })
+                expired.append(order)
+        return bool(expired)
+    
+    update_orders_in_s3(apply_expiry)
+    
+    # Holds run out by themselves as well, so a failed release only delays the restock
+    for order in expired:
+        if order.get('reservationId'):
+            try:
+                release_reservation(s3_client, S3_BUCKET, order['reservationId'])
+            except Exception as e:
+                print(f"Could not release reservation for expired order {order['id']}: {e}")
+    print(f"Expired {len(expired)} pending orders")
+    return {'expired': [order['id'] for order in expired]}
+
 def update_order_status(event, headers):
-    """Update order status (admin only)"""
+    """Update order status (admin only, except that customers may cancel their own pending orders)"""
     try:
         # Check for admin authorization
         query_params = event.get('queryStringParameters') or {}
         user_email = get_user_email_from_token(event)
         is_admin = is_admin_user(user_email) or query_params.get('admin') == 'true'
         
-        if not is_admin:
+        # Parse request body
+        body = json.loads(event['body'])
+        new_status = body.get('status')
+        tracking_number = body.get('trackingNumber', '') if is_admin else ''
+        
+        # A customer abandoning checkout gives the held stock back now rather
+        # than when the order expires; nothing else is theirs to change
+        owner_id = None if is_admin else body.get('userId')
+        updated_by = user_email or ('admin' if is_admin else 'customer')
+        if not is_admin and (new_status != 'cancelled' or not owner_id):
             return {
                 'statusCode': 403,
                 'headers': headers,
@@ -249,11 +428,6 @@ def update_order_status(event, headers):
                 'body': json.dumps({'error': 'Order ID is required'})
             }
         
-        # Parse request body
-        body = json.loads(event['body'])
-        new_status = body.get('status')
-        tracking_number = body.get('trackingNumber', '')
-        
         if not new_status:
             return {
                 'statusCode': 400,
@@ -270,36 +444,53 @@ def update_order_status(event, headers):
                 'body': json.dumps({'error': f'Invalid status. Must be one of: {", ".join(valid_statuses)}'})
             }
         
-        # Get existing orders
-        existing_orders = get_orders_from_s3()
-        
-        # Find and update the order
+        # Find and update the order in the latest saved orders
         order_found = False
-        for order in existing_orders:
-            if order['id'] == order_id:
-                order_found = True
-                # Update status
-                order['status'] = new_status
-                
-                # Update tracking number if provided
-                if tracking_number:
-                    order['trackingNumber'] = tracking_number
-                
-                # Add to status history
-                if 'statusHistory' not in order:
-                    order['statusHistory'] = []
-                
-                order['statusHistory'].append({
-                    'status': new_status,
-                    'timestamp': datetime.now().isoformat(),
-                    'updatedBy': user_email or 'admin',
-                    'trackingNumber': tracking_number
-                })
-                
-                # Update last modified
-                order['lastModified'] = datetime.now().isoformat()
-                break
+        not_pending = False
+        def apply_status(orders):
+            nonlocal order_found, not_pending
+            order_found = False
+            not_pending = False
+            for order in orders:
+                if order['id'] == order_id:
+                    if owner_id is not None:
+                        if order.get('userId') != owner_id:
+                            return False
+                        if order.get('status') != 'pending':
+                            not_pending = True
+                            return False
+                    order_found = order
+                    # Update status
+                    order['status'] = new_status
+                    
+                    # Update tracking number if provided
+                    if tracking_number:
+                        order['trackingNumber'] = tracking_number
+                    
+                    # Add to status history
+                    if 'statusHistory' not in order:
+                        order['statusHistory'] = []
+                    
+                    order['statusHistory'].append({
+                        'status': new_status,
+                        'timestamp': datetime.now().isoformat(),
+                        'updatedBy': updated_by,
+                        'trackingNumber': tracking_number
+                    })
+                    
+                    # Update last modified
+                    order['lastModified'] = datetime.now().isoformat()
+                    return True
+            return False
         
+        update_orders_in_s3(apply_status)
+        
+        if not_pending:
+            return {
+                'statusCode': 409,
+                'headers': headers,
+                'body': json.dumps({'error': 'Only pending orders can be cancelled'})
+            }
         if not order_found:
             return {
                 'statusCode': 404,
@@ -307,10 +498,11 @@ def update_order_status(event, headers):
                 'body': json.dumps({'error': 'Order not found'})
             }
         
-        # Save updated orders
-        save_orders_to_s3(existing_orders)
+        # Abandoned orders give their held stock back; sold stock is not restocked
+        if new_status in ('cancelled', 'refunded') and order_found.get('reservationId'):
+            release_reservation(s3_client, S3_BUCKET, order_found['reservationId'])
         
-        print(f"Order {order_id} status updated to {new_status} by {user_email or 'admin'}")
+        print(f"Order {order_id} status updated to {new_status} by {updated_by}")
         
         return {
             'statusCode': 200,
@@ -323,6 +515,13 @@ def update_order_status(event, headers):
             })
         }
         
+    except ConflictError as e:
+        print(f"Order write conflict in update_order_status: {e}")
+        return {
+            'statusCode': 409,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
     except Exception as e:
         print(f"Error in update_order_status: {e}")
         import traceback
@@ -25,6 +25,15 @@ except ImportError as e:
 
 from datetime import datetime
 from secrets_manager import get_stripe_secret_key, get_google_credentials, get_google_sheets_id
+from compression import compressed_responses
+from catalog_prices import CURRENCY, PriceMismatchError, PricingError, from_cents, load_price_index, price_order
+from orders_new import PaymentError, mark_order_paid
+
+s3_client = boto3.client('s3') if boto3 else None
+S3_BUCKET = os.environ.get('S3_BUCKET', 'ecommerce-product-images')
+
+# Shipping options offered at checkout, in cents, keyed by option ID
+SHIPPING_RATES = {'free-shipping': 0, 'express-shipping': 500}
 
 # Initialize Stripe
 if stripe:
@@ -39,6 +48,7 @@ if stripe:
 else:
     print("Stripe not available")
 
+@compressed_responses
 def lambda_handler(event, context):
     print(f"Lambda invoked with event: {json.dumps(event)}")
     
@@ -111,14 +121,47 @@ def create_payment_intent(event, headers):
         print(f"Parsed body: {body}")
         
         amount = body.get('amount')  # Amount in cents
-        currency = body.get('currency', 'usd')
+        currency = (body.get('currency') or CURRENCY).lower()
         customer_email = body.get('customerEmail')
         order_details = body.get('orderDetails', {})
         
         print(f"Amount: {amount}, Currency: {currency}, Email: {customer_email}")
         
-        if not amount or amount <= 0:
-            print(f"Invalid amount: {amount}")
+        # Catalogue prices are in the store currency only
+        if currency != CURRENCY:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'Unsupported currency: {currency}'})
+            }
+        
+        # The charge is computed from catalogue prices; the client's amount must agree with it
+        try:
+            amount_cents = price_payment(order_details)
+        except PriceMismatchError as e:
+            return {
+                'statusCode': 409,
+                'headers': headers,
+                'body': json.dumps({'error': str(e), 'items': e.items, 'total': from_cents(e.total_cents)})
+            }
+        except PricingError as e:
+            print(f"Cannot price payment: {e}")
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        if amount is not None and amount != amount_cents:
+            print(f"Amount {amount} does not match order total {amount_cents}")
+            return {
+                'statusCode': 409,
+                'headers': headers,
+                'body': json.dumps({'error': 'Amount does not match the order total', 'amount': amount_cents})
+            }
+        
+        if amount_cents <= 0:
+            print(f"Invalid amount: {amount_cents}")
             return {
                 'statusCode': 400,
                 'headers': headers,
@@ -134,11 +177,11 @@ def create_payment_intent(event, headers):
                 'body': json.dumps({'error': 'Payment processing not configured properly'})
             }
         
-        print(f"Creating Stripe payment intent for amount: {amount}")
+        print(f"Creating Stripe payment intent for amount: {amount_cents}")
         
         # Create payment intent
         intent = stripe.PaymentIntent.create(
-            amount=int(amount),
+            amount=amount_cents,
             currency=currency,
             payment_method_types=['card'],
             metadata={
@@ -175,6 +218,15 @@ def create_payment_intent(event, headers):
             'body': json.dumps({'error': f'Server error: {str(e)}'})
         }
 
+def price_payment(order_details):
+    """Amount in cents to charge for an order's items and shipping option"""
+    _, subtotal_cents = price_order(order_details.get('items'), load_price_index(s3_client, S3_BUCKET))
+    shipping_option = order_details.get('shippingOption') or {}
+    shipping_id = shipping_option.get('id', 'free-shipping') if isinstance(shipping_option, dict) else shipping_option
+    if shipping_id not in SHIPPING_RATES:
+        raise PricingError(f'Unknown shipping option: {shipping_id}')
+    return subtotal_cents + SHIPPING_RATES[shipping_id]
+
 def confirm_payment(event, headers):
     """Confirm payment and create order record"""
     
@@ -203,18 +255,35 @@ def confirm_payment(event, headers):
                 })
             }
         
+        # A pending order created at checkout is marked paid and its held stock
+        # sold, but only if the intent from Stripe really paid for that order
+        try:
+            order = mark_order_paid(order_details['orderId'], intent) if order_details.get('orderId') else None
+        except PaymentError as e:
+            print(f"Refusing payment {intent.id} for order {order_details.get('orderId')}: {e}")
+            return {
+                'statusCode': 409,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
+        
         # Create order record in Google Sheets
         order_id = create_order_record(intent, order_details)
+        if order:
+            order_id = order['id']
         
+        response_body = {
+            'success': True,
+            'orderId': order_id,
+            'paymentStatus': intent.status,
+            'amountReceived': intent.amount_received
+        }
+        if order and order.get('inventoryError'):
+            response_body['inventoryError'] = order['inventoryError']
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps({
-                'success': True,
-                'orderId': order_id,
-                'paymentStatus': intent.status,
-                'amountReceived': intent.amount_received
-            })
+            'body': json.dumps(response_body)
         }
         
     except stripe.error.StripeError as e:
@@ -2,9 +2,25 @@ import json
 import boto3
 import uuid
 import base64
+import hashlib
 from datetime import datetime
 import os
+import time
+import shutil
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from s3_store import NOT_MODIFIED, ConflictError, is_missing, is_not_modified, read_json, update_json
+from catalog_index import CATALOG_MANIFEST_KEY, CatalogIndex, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SORT_FIELDS, decode_cursor, encode_cursor
+from search_index import PrefixIndex, QueryCache, SearchIndex, tokenize
+from facets import DEFAULT_BUCKETS, MAX_BUCKETS, FacetIndex
+from near_duplicates import add_to_buckets, find_duplicates, rebuild_buckets
+from related_products import RELATED_PRODUCTS_KEY, TOP_K as RELATED_TOP_K
+from catalog_snapshots import publish_snapshot
+from catalog_binary import BinaryCatalog, encode_catalog
+from compression import available_encodings, compress, compressed_responses, negotiate_encoding
+from cdn_invalidation import InvalidationBatcher
+from inventory import get_stock, set_stock
+from catalog_import import MAX_IMPORT_ROWS, ImportRowError, detect_format, iter_rows, parse_tags, product_fields
 
 s3_client = boto3.client('s3')
 S3_BUCKET = os.environ.get('S3_BUCKET', 'ecommerce-product-images')
@@ -12,13 +28,14 @@ S3_BUCKET = os.environ.get('S3_BUCKET', 'ecommerce-product-images')
 # Admin emails who can delete products (comma-separated)
 ADMIN_EMAILS = os.environ.get('ADMIN_EMAILS', 'admin@example.com').split(',')
 
+@compressed_responses
 def lambda_handler(event, context):
     http_method = event['httpMethod']
     
     headers = {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-        'Access-Control-Allow-Methods': 'GET,POST,DELETE,OPTIONS'
+        'Access-Control-Allow-Methods': 'GET,POST,PUT,PATCH,DELETE,OPTIONS'
     }
     
     if http_method == 'OPTIONS':
@@ -29,10 +46,33 @@ def lambda_handler(event, context):
         }
     
     try:
+        path = event.get('path') or ''
         if http_method == 'GET':
-            return get_products(headers)
+            if path.endswith('/products/search'):
+                return search_products(event, headers)
+            if path.endswith('/products/suggest'):
+                return suggest_products(event, headers)
+            if path.endswith('/products/facets'):
+                return get_product_facets(event, headers)
+            if (event.get('pathParameters') or {}).get('id'):
+                if path.endswith('/related'):
+                    return get_related_products(event, headers)
+                if path.endswith('/similar'):
+                    return get_similar_products(event, headers)
+                if path.endswith('/inventory'):
+                    return get_product_inventory(event, headers)
+                return get_product(event, headers)
+            return get_products(event, headers)
         elif http_method == 'POST':
+            if path.endswith('/products/import'):
+                return import_products(event, headers)
+            if path.endswith('/products/batch'):
+                return batch_update_products(event, headers)
             return add_product(event, headers)
+        elif http_method == 'PUT' and path.endswith('/inventory'):
+            return set_product_inventory(event, headers)
+        elif http_method == 'PATCH':
+            return patch_product(event, headers)
         elif http_method == 'DELETE':
             return delete_product(event, headers)
         else:
@@ -48,90 +88,915 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
-def get_products_from_s3():
-    """Get products from S3 JSON file"""
+# Catalogue layout: one object per product plus a small manifest that lists
+# every product's listing fields. The manifest version increases on each write.
+CATALOG_ITEM_PREFIX = 'products/catalog/items/'
+LEGACY_PRODUCTS_KEY = 'products/products.json'
+SEARCH_INDEX_KEY = 'products/catalog/search-index.json'
+CATALOG_BINARY_KEY = 'products/catalog/manifest.bin'
+IMAGE_FEATURES_KEY = 'products/catalog/image-features.bin'
+ENCODED_LISTING_KEYS = {'gzip': 'products/catalog/listing.json.gz', 'br': 'products/catalog/listing.json.br'}
+
+# Catalogue version the scheduled job last regenerated the derived documents
+# (binary catalogue, compressed listings, snapshot, persisted indexes) for
+CATALOG_ARTIFACTS_KEY = 'products/catalog/artifacts.json'
+
+# Clients opt in to pre-compressed listings by sending this as their first
+# Accept type; it is registered in the API's BinaryMediaTypes so API Gateway
+# passes the base64-encoded body through as raw bytes
+CATALOG_MEDIA_TYPE = 'application/vnd.lplivings.catalog+json'
+
+# Fields copied into the manifest; anything else lives on the product object only.
+# createdAt and tags stay because the default sort, cursors and tag browsing
+# index them; version is the catalogue version that last wrote the product.
+LISTING_FIELDS = ('id', 'name', 'price', 'category', 'image', 'createdAt', 'tags', 'version')
+
+# Parsed manifest kept across warm invocations. Within the TTL it is served
+# as-is; after that a conditional GET revalidates it, which costs a 304 and no
+# parse when the catalogue has not changed.
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', '5'))
+catalog_cache = {'manifest': None, 'etag': None, 'checkedAt': 0.0}
+
+# Lookup structures derived from the cached manifest, keyed by name. Each has
+# a version and apply_changes(); the container's own writes update them in
+# place and a version written elsewhere triggers a rebuild.
+derived_indexes = {}
+
+# Recent search responses keyed by (catalogue version, normalized query, limit)
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '256'))
+search_result_cache = QueryCache(SEARCH_CACHE_SIZE)
+
+# Serialized full listings keyed by (catalogue version, projected fields), so
+# repeat listing requests skip projection and json.dumps entirely
+listing_body_cache = QueryCache(8)
+
+# Materialized "frequently bought together" results, revalidated after the TTL
+RELATED_CACHE_TTL = float(os.environ.get('RELATED_CACHE_TTL_SECONDS', '300'))
+related_cache = {'document': None, 'etag': None, 'checkedAt': 0.0}
+
+# Image descriptor matrix built by the indexing job, revalidated after the TTL
+IMAGE_FEATURES_CACHE_TTL = float(os.environ.get('IMAGE_FEATURES_CACHE_TTL_SECONDS', '300'))
+image_features_cache = {'features': None, 'etag': None, 'checkedAt': 0.0}
+SIMILAR_LIMIT = 10
+MAX_SIMILAR_LIMIT = 50
+
+# Compressed full listings keyed by (catalogue version, encoding)
+encoded_listing_cache = QueryCache(4)
+
+# Recently served product objects and their S3 ETags, revalidated on every request
+PRODUCT_CACHE_SIZE = int(os.environ.get('PRODUCT_CACHE_SIZE', '512'))
+product_cache = QueryCache(PRODUCT_CACHE_SIZE)
+
+# Cold containers map the binary catalogue snapshot from here instead of
+# parsing the JSON manifest
+BINARY_CATALOG_ENABLED = os.environ.get('BINARY_CATALOG', 'true').lower() == 'true'
+BINARY_CATALOG_PATH = os.path.join(os.environ.get('CATALOG_BINARY_DIR', '/tmp'), 'catalog.bin')
+
+# CloudFront distribution in front of the bucket. Commits queue the changed
+# keys the CDN serves and refresh_catalog_artifacts submits the queue, so
+# there is at most one invalidation per run however many commits landed
+CLOUDFRONT_DISTRIBUTION_ID = os.environ.get('CLOUDFRONT_DISTRIBUTION_ID', '')
+cdn_invalidations = InvalidationBatcher(
+    CLOUDFRONT_DISTRIBUTION_ID,
+    path_prefix=os.environ.get('CLOUDFRONT_PATH_PREFIX', '')
+)
+CDN_INVALIDATION_QUEUE_KEY = 'products/catalog/cdn-invalidations.json'
+
+# What add_product does with a near-duplicate of an existing listing:
+# 'flag' saves it and reports the matches, 'reject' refuses it with a 409
+DUPLICATE_POLICY = os.environ.get('DUPLICATE_POLICY', 'flag')
+
+# Parallel S3 requests when a commit writes or deletes many product objects
+ITEM_WRITE_CONCURRENCY = int(os.environ.get('ITEM_WRITE_CONCURRENCY', '16'))
+
+# Most upserts plus deletes accepted by one POST /products/batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '1000'))
+
+# Deleted product IDs the manifest remembers for ?since= delta sync; changed
+# products are found by their per-product version instead of a change log
+TOMBSTONE_LIMIT = int(os.environ.get('CATALOG_TOMBSTONE_LIMIT', '1000'))
+
+# Publish static snapshot files for the CDN after every catalogue write
+PUBLISH_SNAPSHOTS = os.environ.get('PUBLISH_CATALOG_SNAPSHOTS', 'true').lower() == 'true'
+
+# Typeahead tolerates a slightly older catalogue so warm keystrokes never wait on S3
+SUGGEST_MAX_AGE = float(os.environ.get('SUGGEST_MAX_AGE_SECONDS', '60'))
+SUGGEST_LIMIT = 8
+MAX_SUGGEST_LIMIT = 20
+
+def product_key(product_id):
+    """S3 key of a single product object"""
+    return f"{CATALOG_ITEM_PREFIX}{product_id}.json"
+
+def listing_entry(product, version=None):
+    """Project a product record onto the manifest listing fields"""
+    entry = {field: product[field] for field in LISTING_FIELDS if field in product}
+    # Listings carry tag names only; confidences stay on the product object
+    tags = [tag['name'] if isinstance(tag, dict) else tag for tag in entry.pop('tags', None) or ()]
+    if tags:
+        entry['tags'] = tags
+    if version is not None:
+        entry['version'] = version
+    return entry
+
+def empty_manifest():
+    return {'version': 0, 'lastUpdated': None, 'products': []}
+
+def remember_catalog(manifest, etag):
+    """Store a manifest this container has just read or written"""
+    catalog_cache.update(manifest=manifest, etag=etag, checkedAt=time.monotonic())
+
+def clear_catalog_cache():
+    catalog_cache.update(manifest=None, etag=None, checkedAt=0.0)
+    derived_indexes.clear()
+    search_result_cache.clear()
+    listing_body_cache.clear()
+    encoded_listing_cache.clear()
+    product_cache.clear()
+    related_cache.update(document=None, etag=None, checkedAt=0.0)
+    image_features_cache.update(features=None, etag=None, checkedAt=0.0)
+
+def load_catalog(max_age=None):
+    """Get the catalogue manifest, from the warm-container cache when possible.
+
+    A cached manifest younger than max_age (default CATALOG_CACHE_TTL) is
+    returned without contacting S3. A cold container maps the binary snapshot
+    and only confirms its ETag against the manifest, instead of downloading
+    and parsing the JSON listing. Migrates the legacy products.json on first
+    use. Read errors propagate: an unreadable catalogue must never look empty,
+    or the next write would replace it. Callers must not mutate the returned
+    manifest.
+    """
+    cached = catalog_cache['manifest']
+    now = time.monotonic()
+    max_age = CATALOG_CACHE_TTL if max_age is None else max_age
+    if cached is not None and now - catalog_cache['checkedAt'] < max_age:
+        return cached
+    
+    if cached is None and BINARY_CATALOG_ENABLED:
+        cached, etag = load_binary_catalog()
+    else:
+        etag = catalog_cache['etag'] if cached is not None else None
+    manifest, etag = read_json(s3_client, S3_BUCKET, CATALOG_MANIFEST_KEY, if_none_match=etag)
+    if manifest is NOT_MODIFIED:
+        remember_catalog(cached, etag)
+        return cached
+    if manifest is None:
+        manifest, etag = migrate_legacy_catalog()
+    remember_catalog(manifest, etag)
+    return manifest
+
+def load_binary_catalog():
+    """Map the binary catalogue snapshot into a lazily decoded manifest.
+
+    Returns (manifest, manifest_etag), or (None, None) if there is no usable
+    snapshot. The caller revalidates the ETag against the JSON manifest, so a
+    stale snapshot is never served.
+    """
     try:
-        response = s3_client.get_object(Bucket=S3_BUCKET, Key='products/products.json')
-        products_data = json.loads(response['Body'].read().decode('utf-8'))
-        return products_data.get('products', [])
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=CATALOG_BINARY_KEY)
+        manifest_etag = (response.get('Metadata') or {}).get('manifest-etag')
+        if not manifest_etag:
+            return None, None
+        # Replace rather than overwrite, so a mapping of an older snapshot stays valid
+        temp_path = f"{BINARY_CATALOG_PATH}.{uuid.uuid4().hex}"
+        with open(temp_path, 'wb') as f:
+            shutil.copyfileobj(response['Body'], f)
+        os.replace(temp_path, BINARY_CATALOG_PATH)
+        listing = BinaryCatalog.open(BINARY_CATALOG_PATH)
+    except Exception as e:
+        if not is_missing(e):
+            print(f"Error loading binary catalogue snapshot: {e}")
+        return None, None
+    manifest = {**listing.meta, 'version': listing.version, 'products': listing}
+    return manifest, manifest_etag
+
+def save_binary_catalog(manifest, manifest_etag):
+    """Write the binary snapshot for a committed manifest; a stale copy is detected by ETag"""
+    if not BINARY_CATALOG_ENABLED:
+        return
+    meta = {key: value for key, value in manifest.items() if key not in ('version', 'products')}
+    s3_client.put_object(
+        Bucket=S3_BUCKET,
+        Key=CATALOG_BINARY_KEY,
+        Body=encode_catalog(manifest.get('products', []), manifest.get('version', 0), meta),
+        ContentType='application/octet-stream',
+        Metadata={'manifest-etag': manifest_etag}
+    )
+
+def get_product_from_s3(product_id):
+    """Get a single product record, or None if it does not exist"""
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=product_key(product_id))
+        return json.loads(response['Body'].read().decode('utf-8'))
     except s3_client.exceptions.NoSuchKey:
-        # File doesn't exist yet, return empty list
-        return []
+        return None
+
+def save_product_to_s3(product):
+    """Save a single product record to its own object"""
+    s3_client.put_object(
+        Bucket=S3_BUCKET,
+        Key=product_key(product['id']),
+        Body=json.dumps(product, separators=(',', ':')),
+        ContentType='application/json'
+    )
+
+def delete_product_from_s3(product_id):
+    """Remove a single product object"""
+    s3_client.delete_object(Bucket=S3_BUCKET, Key=product_key(product_id))
+
+def load_products(product_ids):
+    """Full product records for the given IDs, skipping any that no longer exist"""
+    return [product for product in for_each_item(get_product_from_s3, product_ids) if product is not None]
+
+def load_legacy_catalog():
+    """Build an unsaved manifest from the legacy products.json, writing its product objects"""
+    legacy_data, _ = read_json(s3_client, S3_BUCKET, LEGACY_PRODUCTS_KEY)
+    if not legacy_data:
+        return empty_manifest()
+    
+    legacy_products = legacy_data.get('products', [])
+    for product in legacy_products:
+        save_product_to_s3(product)
+    return {
+        'version': 0,
+        'lastUpdated': legacy_data.get('lastUpdated'),
+        'products': [listing_entry(p) for p in legacy_products]
+    }
+
+def migrate_legacy_catalog():
+    """Create the manifest from the legacy products/products.json if there is one.
+
+    Returns (manifest, etag).
+    """
+    def create_manifest(current):
+        if current is not None:
+            # Another invocation migrated first
+            return None
+        legacy = load_legacy_catalog()
+        if not legacy['products']:
+            return None
+        print(f"Migrating {len(legacy['products'])} products from {LEGACY_PRODUCTS_KEY}")
+        return dict(legacy, version=1, lastUpdated=datetime.now().isoformat())
+    
+    manifest, etag = update_json(s3_client, S3_BUCKET, CATALOG_MANIFEST_KEY, create_manifest)
+    return manifest or empty_manifest(), etag
+
+def get_derived_index(name, build, manifest=None):
+    """Derived index for the current (or the given) catalogue version, built on first use"""
+    manifest = manifest or load_catalog()
+    index = derived_indexes.get(name)
+    if index is None or index.version != manifest.get('version', 0):
+        index = build(manifest)
+        derived_indexes[name] = index
+    return index
+
+def update_derived_indexes(manifest, upserts, removed_ids):
+    """Patch the derived indexes this container has loaded to a version it just committed"""
+    version = manifest['version']
+    entries = [listing_entry(p, version) for p in upserts]
+    for name, index in list(derived_indexes.items()):
+        if index is not None and index.version == version - 1:
+            # Persisted indexes cover fields the listing leaves out, so they take full records
+            index.apply_changes(upserts if name in PERSISTED_INDEXES else entries, removed_ids, version)
+        else:
+            # Built from a version another container has since replaced
+            del derived_indexes[name]
+
+def get_catalog_index(manifest=None):
+    """CatalogIndex for the current (or the given) catalogue version"""
+    return get_derived_index(
+        'catalog',
+        lambda m: CatalogIndex(m.get('products', []), m.get('version', 0)),
+        manifest
+    )
+
+def get_search_index(manifest=None):
+    """SearchIndex for the current (or the given) catalogue version.
+
+    Descriptions are not in the manifest, so if the persisted index cannot be
+    caught up this indexes names and categories from the listing until
+    refresh_catalog_artifacts rebuilds it from the product objects.
+    """
+    def load(m):
+        index = load_persisted_index('search', m)
+        if index is None:
+            index = SearchIndex.build(m.get('products', []), m.get('version', 0))
+        return index
+    return get_derived_index('search', load, manifest)
+
+# Derived indexes that are expensive to build, stored next to the catalogue
+# so cold containers load them instead of rebuilding: name -> (key, class)
+PERSISTED_INDEXES = {
+    'search': (SEARCH_INDEX_KEY, SearchIndex),
+}
+
+def load_persisted_index(name, manifest):
+    """Load an index persisted next to the catalogue at the manifest's version.
+
+    A copy a few versions behind is caught up from the product objects
+    changed since its version; a missing copy counts as an empty index at
+    version 0. Returns None when the manifest's tombstones no longer reach
+    back that far.
+    """
+    key, index_class = PERSISTED_INDEXES[name]
+    version = manifest.get('version', 0)
+    try:
+        data, _ = read_json(s3_client, S3_BUCKET, key)
+    except Exception as e:
+        print(f"Error reading {name} index from S3: {e}")
+        data = None
+    index = index_class.from_dict(data) if data else index_class(0)
+    if index.version != version:
+        changes = catalog_changes_since(manifest, index.version)
+        if changes is None:
+            print(f"Persisted {name} index at version {index.version} is too far behind {version}")
+            return None
+        changed, deleted = changes
+        index.apply_changes(load_products(entry['id'] for entry in changed), deleted, version)
+    return index
+
+def save_persisted_index(name, index):
+    """Persist a derived index; a stale copy is detected by version and caught up"""
+    s3_client.put_object(
+        Bucket=S3_BUCKET,
+        Key=PERSISTED_INDEXES[name][0],
+        Body=json.dumps(index.to_dict(), separators=(',', ':')),
+        ContentType='application/json'
+    )
+
+def refresh_persisted_index(name, manifest):
+    """Bring one persisted index to the manifest's version; True if it had to be rebuilt"""
+    index = load_persisted_index(name, manifest)
+    rebuilt = index is None
+    if rebuilt:
+        index_class = PERSISTED_INDEXES[name][1]
+        index = index_class.build(load_products(entry['id'] for entry in manifest.get('products', [])),
+                                  manifest.get('version', 0))
+    save_persisted_index(name, index)
+    return rebuilt
+
+def refresh_duplicate_buckets(manifest, since):
+    """Add products changed after version since to the duplicate buckets; True if rebuilt.
+
+    Rebuilding (no earlier run, or tombstones compacted past since) also
+    drops memberships of edited and deleted products.
+    """
+    changes = catalog_changes_since(manifest, since) if since is not None else None
+    if changes is None:
+        rebuild_buckets(s3_client, S3_BUCKET, load_products(entry['id'] for entry in manifest.get('products', [])))
+        return True
+    add_to_buckets(s3_client, S3_BUCKET, load_products(entry['id'] for entry in changes[0]))
+    return False
+
+def find_product_duplicates(product):
+    """Likely duplicates of a product as [(product_id, similarity)]; [] if the buckets cannot be read"""
+    try:
+        return find_duplicates(s3_client, S3_BUCKET, product, load_products)
     except Exception as e:
-        print(f"Error reading products from S3: {e}")
+        print(f"Error checking {product['id']} for duplicates: {e}")
         return []
 
-def save_products_to_s3(products):
-    """Save products to S3 JSON file"""
+def add_duplicate_candidates(products):
+    """Make new listings findable by the next duplicate check; the schedule catches up a failure"""
     try:
-        products_data = {'products': products, 'lastUpdated': datetime.now().isoformat()}
+        add_to_buckets(s3_client, S3_BUCKET, products)
+    except Exception as e:
+        print(f"Error updating duplicate buckets: {e}")
+
+def refresh_catalog_artifacts(event, context):
+    """Scheduled job: regenerate the documents derived from the catalogue manifest.
+
+    Commits write only the changed product objects and the manifest; the
+    binary catalogue, compressed listings, CDN snapshot and persisted indexes
+    are rebuilt here, once per catalogue version however many commits landed
+    since the last run. Readers detect a stale copy and fall back until then.
+    Queued CDN invalidations are submitted on every run. A failed step is
+    retried on the next run.
+    """
+    manifest = load_catalog(max_age=0)
+    manifest_etag = catalog_cache['etag']
+    version = manifest.get('version', 0)
+    state, _ = read_json(s3_client, S3_BUCKET, CATALOG_ARTIFACTS_KEY)
+    steps = {}
+    if version and (state or {}).get('version') != version:
+        steps.update({
+            'binary': lambda: save_binary_catalog(manifest, manifest_etag),
+            'listings': lambda: save_encoded_listings(manifest),
+            'snapshot': lambda: publish_catalog_snapshot(manifest),
+            **{name: (lambda name=name: refresh_persisted_index(name, manifest)) for name in PERSISTED_INDEXES},
+            'duplicates': lambda: refresh_duplicate_buckets(manifest, (state or {}).get('version')),
+        })
+    # Commits queue keys after writing the manifest, so this is not tied to a new version
+    steps['invalidations'] = flush_cdn_invalidations
+    rebuilt = []
+    failed = []
+    for name, step in steps.items():
+        try:
+            if step() is True:
+                rebuilt.append(name)
+        except Exception as e:
+            print(f"Error refreshing catalogue {name}: {e}")
+            failed.append(name)
+    if len(steps) > 1 and not failed:
+        update_json(s3_client, S3_BUCKET, CATALOG_ARTIFACTS_KEY,
+                    lambda current: None if (current or {}).get('version', 0) >= version else {'version': version})
+    print(f"Catalogue artifacts at version {version}, rebuilt: {rebuilt or 'none'}, failed: {failed or 'none'}")
+    return {'version': version, 'rebuilt': rebuilt, 'failed': failed}
+
+def get_suggest_index(manifest=None):
+    """PrefixIndex for the current (or the given) catalogue version"""
+    return get_derived_index(
+        'suggest',
+        lambda m: PrefixIndex.build(m.get('products', []), m.get('version', 0)),
+        manifest
+    )
+
+def get_facet_index(manifest=None):
+    """FacetIndex for the current (or the given) catalogue version"""
+    return get_derived_index(
+        'facets',
+        lambda m: FacetIndex.build(m.get('products', []), m.get('version', 0)),
+        manifest
+    )
+
+def get_products_from_s3():
+    """Get the product listing from the catalogue manifest"""
+    return load_catalog().get('products', [])
+
+def apply_catalog_changes(manifest, upserts=(), deletes=()):
+    """Return (new_manifest, removed_ids) with products upserted and IDs removed.
+
+    Existing products keep their position; new products are appended and
+    upserted ones are stamped with the new version. Removed IDs are kept as
+    {id: version} tombstones, the oldest compacted away past TOMBSTONE_LIMIT.
+    """
+    version = manifest.get('version', 0) + 1
+    replacements = {p['id']: listing_entry(p, version) for p in upserts}
+    delete_ids = set(deletes)
+    products = []
+    removed_ids = []
+    for entry in manifest.get('products', []):
+        entry_id = entry.get('id')
+        if entry_id in delete_ids:
+            removed_ids.append(entry_id)
+        elif entry_id in replacements:
+            products.append(replacements.pop(entry_id))
+        else:
+            products.append(entry)
+    products.extend(replacements.values())
+    
+    # A manifest without tombstones has no delete history before its own version
+    deletes_since = manifest.get('deletesSince', manifest.get('version', 0))
+    upsert_ids = {p['id'] for p in upserts}
+    tombstones = {product_id: deleted_at for product_id, deleted_at in manifest.get('deleted', {}).items()
+                  if product_id not in upsert_ids}
+    tombstones.update((product_id, version) for product_id in removed_ids)
+    if len(tombstones) > TOMBSTONE_LIMIT:
+        # Clients from before the newest dropped tombstone get a full listing
+        ordered = sorted(tombstones.items(), key=lambda item: item[1])
+        dropped = ordered[:len(ordered) - TOMBSTONE_LIMIT]
+        deletes_since = max(deletes_since, dropped[-1][1])
+        tombstones = dict(ordered[len(dropped):])
+    new_manifest = {
+        'version': version,
+        'lastUpdated': datetime.now().isoformat(),
+        'products': products,
+        'deleted': tombstones,
+        'deletesSince': deletes_since
+    }
+    return new_manifest, removed_ids
+
+def catalog_changes_since(manifest, since):
+    """Return (changed_entries, deleted_ids) between version since and the manifest.
+
+    Changed products are those whose listing entry carries a later version.
+    Returns None when tombstones older than since were compacted away (or
+    since is ahead of the catalogue), in which case the client needs a full
+    listing.
+    """
+    version = manifest.get('version', 0)
+    if since > version or since < manifest.get('deletesSince', version):
+        return None
+    
+    by_id = get_catalog_index(manifest).by_id
+    changed = [by_id[product_id] for product_id in sorted(by_id) if by_id[product_id].get('version', 0) > since]
+    deleted = sorted(product_id for product_id, deleted_at in manifest.get('deleted', {}).items() if deleted_at > since)
+    return changed, deleted
+
+def for_each_item(action, items):
+    """Run a per-product S3 request for each item, in parallel for bulk changes.
+
+    Returns the results in item order; the first failure is raised.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [action(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(ITEM_WRITE_CONCURRENCY, len(items))) as pool:
+        return list(pool.map(action, items))
+
+def commit_catalog_changes(upserts=(), deletes=(), save_upserts=True):
+    """Write changed product objects, then commit a new manifest.
+
+    The manifest is replaced with a conditional write. If another invocation
+    commits first, these changes are re-applied on top of its manifest, so
+    concurrent writers never drop each other's products. Costs one put per
+    changed product plus one manifest put, independent of catalogue size;
+    the documents derived from the manifest are left to the scheduled
+    refresh_catalog_artifacts job. Pass save_upserts=False when the product objects were already written.
+    Returns (manifest, removed_ids).
+    """
+    if save_upserts:
+        for_each_item(save_product_to_s3, upserts)
+    
+    removed_ids = []
+    replaced_images = set()
+    def merge(current):
+        if current is None:
+            current = load_legacy_catalog()
+        new_manifest, removed = apply_catalog_changes(current, upserts, deletes)
+        removed_ids[:] = removed
+        changed_ids = set(removed) | {p['id'] for p in upserts}
+        replaced_images.clear()
+        replaced_images.update(e.get('image') for e in current.get('products', []) if e.get('id') in changed_ids)
+        if not upserts and not removed:
+            return None
+        return new_manifest
+    
+    manifest, etag = update_json(s3_client, S3_BUCKET, CATALOG_MANIFEST_KEY, merge)
+    manifest = manifest or empty_manifest()
+    # Later reads in this container see the write immediately
+    remember_catalog(manifest, etag)
+    update_derived_indexes(manifest, upserts, removed_ids)
+    for_each_item(delete_product_from_s3, removed_ids)
+    if upserts or removed_ids:
+        images = {p.get('image') for p in upserts} | replaced_images
+        queue_cdn_invalidations(image_key(url) for url in images)
+    return manifest, removed_ids
+
+def image_key(image_url):
+    """S3 key of an image URL in this bucket, or None for external images"""
+    prefix = f"https://{S3_BUCKET}.s3.amazonaws.com/"
+    if image_url and image_url.startswith(prefix):
+        return urllib.parse.unquote(image_url[len(prefix):])
+    return None
+
+def queue_cdn_invalidations(keys):
+    """Queue S3 keys for the next scheduled invalidation; a failure never fails the write"""
+    keys = sorted({key for key in keys if key})
+    if not cdn_invalidations.enabled or not keys:
+        return
+    def enqueue(current):
+        current = current or {'batch': 0, 'keys': []}
+        queued = set(current['keys'])
+        if queued.issuperset(keys):
+            return None
+        return dict(current, keys=sorted(queued.union(keys)))
+    try:
+        update_json(s3_client, S3_BUCKET, CDN_INVALIDATION_QUEUE_KEY, enqueue)
+    except Exception as e:
+        print(f"Error queueing CDN invalidations: {e}")
+
+def flush_cdn_invalidations():
+    """Submit the queued keys as one invalidation, then drain the queue.
+
+    Only images are queued: the manifest, compressed listings and product
+    objects are read through the API, content-hashed snapshot files never
+    change, and the snapshot pointer expires from edge caches within its
+    short max-age. Each drained batch gets its own CallerReference, so a
+    retry after a failed drain is not billed twice.
+    """
+    if not cdn_invalidations.enabled:
+        return
+    queue, _ = read_json(s3_client, S3_BUCKET, CDN_INVALIDATION_QUEUE_KEY)
+    if not queue or not queue['keys']:
+        return
+    cdn_invalidations.add(*queue['keys'])
+    cdn_invalidations.flush(reference=f"batch-{queue['batch']}")
+    if cdn_invalidations.pending:
+        raise RuntimeError('CloudFront invalidation failed; the queue is kept for the next run')
+    
+    submitted = set(queue['keys'])
+    def drain(current):
+        if current is None:
+            return None
+        return {'batch': current['batch'] + 1, 'keys': [key for key in current['keys'] if key not in submitted]}
+    update_json(s3_client, S3_BUCKET, CDN_INVALIDATION_QUEUE_KEY, drain)
+
+def publish_catalog_snapshot(manifest):
+    """Publish the static catalogue snapshot for the CDN"""
+    if not PUBLISH_SNAPSHOTS:
+        return
+    publish_snapshot(s3_client, S3_BUCKET, manifest, get_listing_body(manifest, None))
+
+def conflict_response(headers, error):
+    """409 for a write that kept losing to concurrent catalogue updates"""
+    print(f"Catalogue write conflict: {error}")
+    return {
+        'statusCode': 409,
+        'headers': headers,
+        'body': json.dumps({'error': str(error)})
+    }
+
+def get_default_products():
+    """Demo products used to seed an empty catalogue"""
+    return [
+        {
+            'id': 'demo-001',
+            'name': 'Sample T-Shirt',
+            'description': 'Comfortable cotton t-shirt',
+            'price': 19.99,
+            'category': 'Clothing',
+            'image': 'https://picsum.photos/300/300?random=1',
+            'userId': 'demo',
+            'createdAt': datetime.now().isoformat()
+        },
+        {
+            'id': 'demo-002',
+            'name': 'Coffee Mug',
+            'description': 'Ceramic coffee mug',
+            'price': 12.99,
+            'category': 'Kitchen',
+            'image': 'https://picsum.photos/300/300?random=2',
+            'userId': 'demo',
+            'createdAt': datetime.now().isoformat()
+        },
+        {
+            'id': 'demo-003',
+            'name': 'Tech Book',
+            'description': 'Learn programming basics',
+            'price': 29.99,
+            'category': 'Books',
+            'image': 'https://picsum.photos/300/300?random=3',
+            'userId': 'demo',
+            'createdAt': datetime.now().isoformat()
+        },
+        {
+            'id': 'demo-004',
+            'name': 'Wireless Headphones',
+            'description': 'High-quality wireless headphones',
+            'price': 89.99,
+            'category': 'Electronics',
+            'image': 'https://picsum.photos/300/300?random=4',
+            'userId': 'demo',
+            'createdAt': datetime.now().isoformat()
+        }
+    ]
+
+def get_request_header(event, name):
+    """Case-insensitive request header lookup"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def catalog_etag(manifest, variant=None):
+    """Strong ETag for a catalogue listing, derived from the manifest version.
+
+    variant distinguishes different representations of the same version,
+    such as individual pages.
+    """
+    tag = f'catalog-v{manifest.get("version", 0)}'
+    if variant:
+        tag += '-' + hashlib.sha1(json.dumps(variant, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return f'"{tag}"'
+
+def etag_matches(event, etag):
+    """True if the request's If-None-Match covers the given ETag"""
+    if_none_match = get_request_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        # If-None-Match uses weak comparison, so W/"x" matches "x"
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag == etag:
+            return True
+    return False
+
+def not_modified_response(headers):
+    return {
+        'statusCode': 304,
+        'headers': headers,
+        'body': ''
+    }
+
+# Query parameters that select the paginated {products, nextCursor, total} response
+LISTING_QUERY_PARAMS = ('limit', 'cursor', 'category', 'tag', 'minPrice', 'maxPrice', 'sort')
+
+def parse_listing_params(query_params):
+    """Validate listing query parameters into CatalogIndex.query arguments; ValueError if invalid"""
+    limit = query_params.get('limit') or DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    
+    sort = query_params.get('sort') or 'createdAt'
+    if sort not in SORT_FIELDS:
+        raise ValueError(f'sort must be one of: {", ".join(SORT_FIELDS)}')
+    
+    prices = {}
+    for param in ('minPrice', 'maxPrice'):
+        value = query_params.get(param)
+        if value in (None, ''):
+            prices[param] = None
+            continue
+        try:
+            prices[param] = float(value)
+        except ValueError:
+            raise ValueError(f'{param} must be a number')
+    
+    after = None
+    if query_params.get('cursor'):
+        cursor_sort, after = decode_cursor(query_params['cursor'])
+        if cursor_sort != sort:
+            raise ValueError('Cursor does not match sort order')
+    
+    return {
+        'category': query_params.get('category') or None,
+        'tag': query_params.get('tag') or None,
+        'min_price': prices['minPrice'],
+        'max_price': prices['maxPrice'],
+        'sort': sort,
+        'after': after,
+        'limit': limit
+    }
+
+def parse_fields_param(query_params):
+    """Fields requested with ?fields=a,b in LISTING_FIELDS order (id always included), or None"""
+    value = query_params.get('fields')
+    if not value:
+        return None
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested - set(LISTING_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}. Allowed: {", ".join(LISTING_FIELDS)}')
+    requested.add('id')
+    return tuple(field for field in LISTING_FIELDS if field in requested)
+
+def project(product, fields):
+    return {field: product[field] for field in fields if field in product}
+
+def get_listing_body(manifest, fields):
+    """Serialized full listing, projected onto fields, memoized per catalogue version"""
+    cache_key = (manifest.get('version', 0), fields)
+    body = listing_body_cache.get(cache_key)
+    if body is None:
+        # Compact like the binary catalogue's records, so both paths send
+        # identical bytes under the same ETag
+        if fields is None and isinstance(manifest['products'], BinaryCatalog):
+            body = manifest['products'].to_json()
+        else:
+            listing = manifest['products'] if fields is None else [project(p, fields) for p in manifest['products']]
+            body = json.dumps(listing, separators=(',', ':'))
+        listing_body_cache.put(cache_key, body)
+    return body
+
+def save_encoded_listings(manifest):
+    """Compress the full listing once per version and store each encoding next to the manifest"""
+    version = manifest.get('version', 0)
+    for encoding in available_encodings():
+        encoded = compress(get_listing_body(manifest, None), encoding)
+        encoded_listing_cache.put((version, encoding), encoded)
         s3_client.put_object(
             Bucket=S3_BUCKET,
-            Key='products/products.json',
-            Body=json.dumps(products_data, indent=2),
-            ContentType='application/json'
+            Key=ENCODED_LISTING_KEYS[encoding],
+            Body=encoded,
+            ContentType='application/json',
+            ContentEncoding=encoding,
+            Metadata={'catalog-version': str(version)}
         )
-        return True
+
+def get_encoded_listing(manifest, encoding):
+    """Compressed full listing for the manifest's version: from memory, S3, or compressed now"""
+    version = manifest.get('version', 0)
+    encoded = encoded_listing_cache.get((version, encoding))
+    if encoded is not None:
+        return encoded
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=ENCODED_LISTING_KEYS[encoding])
+        if (response.get('Metadata') or {}).get('catalog-version') == str(version):
+            encoded = response['Body'].read()
     except Exception as e:
-        print(f"Error saving products to S3: {e}")
-        return False
+        if not is_missing(e):
+            print(f"Error reading {encoding} listing: {e}")
+    if encoded is None:
+        encoded = compress(get_listing_body(manifest, None), encoding)
+    encoded_listing_cache.put((version, encoding), encoded)
+    return encoded
+
+def listing_encoding(event):
+    """Content-Encoding to serve the full listing with, or None for plain JSON"""
+    accept = (get_request_header(event, 'Accept') or '').split(',')[0].split(';')[0].strip().lower()
+    if accept != CATALOG_MEDIA_TYPE:
+        return None
+    return negotiate_encoding(get_request_header(event, 'Accept-Encoding'))
+
+def parse_since_param(query_params):
+    """Catalogue version from ?since=, or None if absent; ValueError if invalid"""
+    value = query_params.get('since')
+    if value is None:
+        return None
+    try:
+        since = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('since must be a catalogue version number')
+    if since < 0:
+        raise ValueError('since must be a catalogue version number')
+    return since
+
+def get_product_changes(event, headers, manifest, since, fields):
+    """Delta response for ?since=: products changed and deleted after that version"""
+    etag = catalog_etag(manifest, {'since': since, 'fields': fields})
+    headers = {**headers, 'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(event, etag):
+        return not_modified_response(headers)
+    
+    delta = catalog_changes_since(manifest, since)
+    if delta is None:
+        changed, deleted = manifest.get('products', []), []
+    else:
+        changed, deleted = delta
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'version': manifest.get('version', 0),
+            'since': since,
+            'full': delta is None,
+            'products': changed if fields is None else [project(p, fields) for p in changed],
+            'deleted': deleted
+        })
+    }
 
-def get_products(headers):
+def get_products(event, headers):
     try:
+        query_params = event.get('queryStringParameters') or {}
+        paginated = any(param in query_params for param in LISTING_QUERY_PARAMS)
+        try:
+            fields = parse_fields_param(query_params)
+            since = parse_since_param(query_params)
+            listing_params = parse_listing_params(query_params) if paginated else None
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
+        
         # Get products from S3
-        products = get_products_from_s3()
+        manifest = load_catalog()
         
         # If no products found, add default ones
-        if not products:
-            default_products = [
-                {
-                    'id': 'demo-001',
-                    'name': 'Sample T-Shirt',
-                    'description': 'Comfortable cotton t-shirt',
-                    'price': 19.99,
-                    'category': 'Clothing',
-                    'image': 'https://picsum.photos/300/300?random=1',
-                    'userId': 'demo',
-                    'createdAt': datetime.now().isoformat()
-                },
-                {
-                    'id': 'demo-002',
-                    'name': 'Coffee Mug',
-                    'description': 'Ceramic coffee mug',
-                    'price': 12.99,
-                    'category': 'Kitchen',
-                    'image': 'https://picsum.photos/300/300?random=2',
-                    'userId': 'demo',
-                    'createdAt': datetime.now().isoformat()
-                },
-                {
-                    'id': 'demo-003',
-                    'name': 'Tech Book',
-                    'description': 'Learn programming basics',
-                    'price': 29.99,
-                    'category': 'Books',
-                    'image': 'https://picsum.photos/300/300?random=3',
-                    'userId': 'demo',
-                    'createdAt': datetime.now().isoformat()
-                },
-                {
-                    'id': 'demo-004',
-                    'name': 'Wireless Headphones',
-                    'description': 'High-quality wireless headphones',
-                    'price': 89.99,
-                    'category': 'Electronics',
-                    'image': 'https://picsum.photos/300/300?random=4',
-                    'userId': 'demo',
-                    'createdAt': datetime.now().isoformat()
-                }
-            ]
-            save_products_to_s3(default_products)
-            products = default_products
+        if not manifest.get('products'):
+            manifest, _ = commit_catalog_changes(upserts=get_default_products())
+        
+        if since is not None:
+            return get_product_changes(event, headers, manifest, since, fields)
+        
+        encoding = listing_encoding(event) if not paginated and fields is None else None
+        
+        # Clients revalidate with If-None-Match and get a bodyless 304 while
+        # the catalogue version is unchanged
+        variant = {**listing_params, 'fields': fields} if paginated else ({'fields': fields} if fields else None)
+        if encoding:
+            variant = {'encoding': encoding}
+        etag = catalog_etag(manifest, variant)
+        headers = {**headers, 'ETag': etag, 'Cache-Control': 'no-cache'}
+        if not paginated:
+            headers['Vary'] = 'Accept, Accept-Encoding'
+        if etag_matches(event, etag):
+            return not_modified_response(headers)
+        
+        if encoding:
+            # Stored compressed bytes are returned as-is
+            return {
+                'statusCode': 200,
+                'headers': {**headers, 'Content-Type': 'application/json', 'Content-Encoding': encoding},
+                'body': base64.b64encode(get_encoded_listing(manifest, encoding)).decode('ascii'),
+                'isBase64Encoded': True
+            }
+        
+        if not paginated:
+            # Unpaginated requests keep returning the bare list
+            body = get_listing_body(manifest, fields)
+        else:
+            page, next_key, total = get_catalog_index(manifest).query(**listing_params)
+            body = json.dumps({
+                'products': page if fields is None else [project(p, fields) for p in page],
+                'nextCursor': encode_cursor(listing_params['sort'], next_key) if next_key else None,
+                'total': total
+            })
         
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps(products)
+            'body': body
         }
     except Exception as e:
         print(f"Error in get_products: {e}")
@@ -141,6 +1006,344 @@ def get_products(headers):
             'body': json.dumps({'error': str(e)})
         }
 
+def search_products(event, headers):
+    """Full-text search over product name, category and description"""
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        query = (query_params.get('q') or '').strip()
+        try:
+            limit = int(query_params.get('limit') or DEFAULT_PAGE_SIZE)
+        except ValueError:
+            limit = 0
+        if not query or not 1 <= limit <= MAX_PAGE_SIZE:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'q is required and limit must be between 1 and {MAX_PAGE_SIZE}'})
+            }
+        
+        manifest = load_catalog()
+        terms = ' '.join(tokenize(query))
+        etag = catalog_etag(manifest, {'search': terms, 'limit': limit})
+        headers = {**headers, 'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(event, etag):
+            return not_modified_response(headers)
+        
+        cache_key = (manifest.get('version', 0), terms, limit)
+        body = search_result_cache.get(cache_key)
+        if body is None:
+            ranked, total = get_search_index(manifest).search(query, limit)
+            by_id = get_catalog_index(manifest).by_id
+            body = json.dumps({
+                'products': [{**by_id[product_id], 'score': round(score, 4)} for product_id, score in ranked],
+                'total': total
+            })
+            search_result_cache.put(cache_key, body)
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': body
+        }
+    except Exception as e:
+        print(f"Error in search_products: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def suggest_products(event, headers):
+    """Typeahead suggestions for product names and categories starting with a prefix"""
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        prefix = (query_params.get('prefix') or '').strip()
+        try:
+            limit = int(query_params.get('limit') or SUGGEST_LIMIT)
+        except ValueError:
+            limit = 0
+        if not prefix or not 1 <= limit <= MAX_SUGGEST_LIMIT:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'prefix is required and limit must be between 1 and {MAX_SUGGEST_LIMIT}'})
+            }
+        
+        manifest = load_catalog(max_age=SUGGEST_MAX_AGE)
+        suggestions = get_suggest_index(manifest).suggest(prefix, limit)
+        return {
+            'statusCode': 200,
+            'headers': {**headers, 'Cache-Control': f'public, max-age={int(SUGGEST_MAX_AGE)}'},
+            'body': json.dumps({'suggestions': suggestions})
+        }
+    except Exception as e:
+        print(f"Error in suggest_products: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def get_product_facets(event, headers):
+    """Category counts, price percentiles and a price histogram for filter UIs"""
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            buckets = int(query_params.get('buckets') or DEFAULT_BUCKETS)
+        except ValueError:
+            buckets = 0
+        if not 1 <= buckets <= MAX_BUCKETS:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'buckets must be between 1 and {MAX_BUCKETS}'})
+            }
+        category = query_params.get('category') or None
+        
+        manifest = load_catalog()
+        etag = catalog_etag(manifest, {'facets': category, 'buckets': buckets})
+        headers = {**headers, 'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(event, etag):
+            return not_modified_response(headers)
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps(get_facet_index(manifest).summary(category, buckets))
+        }
+    except Exception as e:
+        print(f"Error in get_product_facets: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def get_product(event, headers):
+    """Return a single product from its own object, with that object's ETag.
+
+    The client's If-None-Match (or this container's cached copy's ETag) is
+    forwarded to S3, so an unchanged product costs a bodyless conditional GET.
+    """
+    try:
+        product_id = event['pathParameters']['id']
+        client_etag = (get_request_header(event, 'If-None-Match') or '').strip()
+        if ',' in client_etag or client_etag == '*':
+            client_etag = ''
+        if client_etag.startswith('W/'):
+            client_etag = client_etag[2:]
+        cached = product_cache.get(product_id)
+        
+        product, etag = read_json(
+            s3_client, S3_BUCKET, product_key(product_id),
+            if_none_match=client_etag or (cached[1] if cached else None)
+        )
+        if product is None:
+            product_cache.discard(product_id)
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': 'Product not found'})
+            }
+        
+        headers = {**headers, 'ETag': etag, 'Cache-Control': 'no-cache'}
+        if product is NOT_MODIFIED:
+            if etag == client_etag:
+                return not_modified_response(headers)
+            product = cached[0]
+        else:
+            product_cache.put(product_id, (product, etag))
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps(product)
+        }
+    except Exception as e:
+        print(f"Error in get_product: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def load_related_products():
+    """The recommendations document built by the scheduled job, cached per container"""
+    cached = related_cache['document']
+    now = time.monotonic()
+    if cached is not None and now - related_cache['checkedAt'] < RELATED_CACHE_TTL:
+        return cached
+    document, etag = read_json(s3_client, S3_BUCKET, RELATED_PRODUCTS_KEY, if_none_match=related_cache['etag'])
+    if document is NOT_MODIFIED:
+        document = cached
+    related_cache.update(document=document or {'related': {}}, etag=etag, checkedAt=now)
+    return related_cache['document']
+
+def get_related_products(event, headers):
+    """Products most often bought together with this one"""
+    try:
+        product_id = event['pathParameters']['id']
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            limit = int(query_params.get('limit') or RELATED_TOP_K)
+            if not 1 <= limit <= RELATED_TOP_K:
+                raise ValueError
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'limit must be between 1 and {RELATED_TOP_K}'})
+            }
+        
+        manifest = load_catalog()
+        by_id = get_catalog_index(manifest).by_id
+        if product_id not in by_id:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': 'Product not found'})
+            }
+        
+        document = load_related_products()
+        related = []
+        # Recommendations can predate deletions, so only live products are returned
+        for match in document.get('related', {}).get(product_id, []):
+            if match['id'] in by_id:
+                related.append({**by_id[match['id']], 'count': match['count'], 'confidence': match['confidence']})
+            if len(related) == limit:
+                break
+        
+        return {
+            'statusCode': 200,
+            'headers': {**headers, 'Cache-Control': f'public, max-age={int(RELATED_CACHE_TTL)}'},
+            'body': json.dumps({
+                'productId': product_id,
+                'related': related,
+                'generatedAt': document.get('generatedAt')
+            })
+        }
+    except Exception as e:
+        print(f"Error in get_related_products: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def load_image_features(max_age=None):
+    """The stored image descriptor matrix, cached per container"""
+    # numpy is only loaded by the functions that use image features
+    from image_features import FeatureMatrix
+    cached = image_features_cache['features']
+    now = time.monotonic()
+    max_age = IMAGE_FEATURES_CACHE_TTL if max_age is None else max_age
+    if cached is not None and now - image_features_cache['checkedAt'] < max_age:
+        return cached
+    etag = image_features_cache['etag'] if cached is not None else None
+    condition = {'IfNoneMatch': etag} if etag else {}
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=IMAGE_FEATURES_KEY, **condition)
+        features, etag = FeatureMatrix.from_bytes(response['Body'].read()), response.get('ETag')
+    except Exception as e:
+        if is_not_modified(e):
+            features = cached
+        elif is_missing(e):
+            features, etag = FeatureMatrix(), None
+        else:
+            raise
+    image_features_cache.update(features=features, etag=etag, checkedAt=now)
+    return features
+
+def describe_stored_image(key):
+    """Descriptor of an image in the bucket, or None if it cannot be read"""
+    from image_features import describe_image
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
+        return describe_image(response['Body'].read())
+    except Exception as e:
+        print(f"Error describing image {key}: {e}")
+        return None
+
+def index_product_images(event, context):
+    """Scheduled job: describe new and replaced product images and store the matrix.
+
+    Only images that changed since the last run are downloaded; products
+    whose image is hosted elsewhere are not indexed.
+    """
+    manifest = load_catalog(max_age=0)
+    previous = load_image_features(max_age=0)
+    entries = []
+    for product in manifest.get('products', []):
+        key = image_key(product.get('image'))
+        if key:
+            entries.append((product['id'], key))
+    known = previous.image_keys()
+    changed = sorted({key for product_id, key in entries if known.get(product_id) != key})
+    descriptors = dict(zip(changed, for_each_item(describe_stored_image, changed)))
+    features = previous.refresh(entries, descriptors.get)
+    
+    response = s3_client.put_object(
+        Bucket=S3_BUCKET,
+        Key=IMAGE_FEATURES_KEY,
+        Body=features.to_bytes(),
+        ContentType='application/octet-stream',
+        Metadata={'catalog-version': str(manifest.get('version', 0))}
+    )
+    image_features_cache.update(features=features, etag=response.get('ETag'), checkedAt=time.monotonic())
+    print(f"Indexed {len(features)} product images, {len(changed)} described this run")
+    return {'products': len(features), 'described': len(changed)}
+
+def get_similar_products(event, headers):
+    """Products whose images look most like this one's"""
+    try:
+        product_id = event['pathParameters']['id']
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            limit = int(query_params.get('limit') or SIMILAR_LIMIT)
+            if not 1 <= limit <= MAX_SIMILAR_LIMIT:
+                raise ValueError
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'limit must be between 1 and {MAX_SIMILAR_LIMIT}'})
+            }
+        
+        manifest = load_catalog()
+        by_id = get_catalog_index(manifest).by_id
+        if product_id not in by_id:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': 'Product not found'})
+            }
+        
+        features = load_image_features()
+        # The matrix can predate deletions; ask for enough extra rows to skip them
+        stale = len(features.positions.keys() - by_id.keys())
+        similar = [
+            {**by_id[match_id], 'score': score}
+            for match_id, score in features.nearest(product_id, limit + stale)
+            if match_id in by_id
+        ][:limit]
+        
+        return {
+            'statusCode': 200,
+            'headers': {**headers, 'Cache-Control': f'public, max-age={int(IMAGE_FEATURES_CACHE_TTL)}'},
+            'body': json.dumps({
+                'productId': product_id,
+                'indexed': product_id in features,
+                'similar': similar
+            })
+        }
+    except Exception as e:
+        print(f"Error in get_similar_products: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
 def parse_multipart_data(body, boundary):
     """Parse multipart form data"""
     parts = body.split(f'--{boundary}')
@@ -213,6 +1416,7 @@ def add_product(event, headers):
             category = body.get('category', '')
             user_id = body.get('userId', '')
             image_url = body.get('imageUrl', '')  # Pre-uploaded via pre-signed URL
+            tags = body.get('tags')  # Labels from /analyze-image, with confidences
         elif 'multipart/form-data' in content_type:
             boundary = content_type.split('boundary=')[1] if 'boundary=' in content_type else None
             print(f"Boundary: {boundary}")
@@ -231,6 +1435,7 @@ def add_product(event, headers):
                 price = fields.get('price', '0')
                 category = fields.get('category', '')
                 user_id = fields.get('userId', '')
+                tags = fields.get('tags')
                 
                 print(f"Extracted values - name: {name}, description: {description}, price: {price}, category: {category}, userId: {user_id}")
                 
@@ -262,44 +1467,71 @@ def add_product(event, headers):
             category = body.get('category', '')
             user_id = body.get('userId', '')
             image_url = ''
+            tags = body.get('tags')
         
-        # Add product to S3 storage
         try:
-            # Get existing products
-            existing_products = get_products_from_s3()
-            
-            # Create new product
-            new_product = {
-                'id': product_id,
-                'name': name,
-                'description': description,
-                'price': float(price) if isinstance(price, (int, float)) or (isinstance(price, str) and price.replace('.','').isdigit()) else 0.0,
-                'category': category,
-                'image': image_url,
-                'userId': user_id,
-                'createdAt': datetime.now().isoformat()
+            # Form fields carry tags as a JSON array or a comma-separated string
+            if isinstance(tags, str) and tags.lstrip().startswith('['):
+                tags = json.loads(tags)
+            tags = parse_tags(tags)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
             }
-            
-            # Add to list and save
-            existing_products.append(new_product)
-            save_products_to_s3(existing_products)
-            
-            print(f"Product {product_id} saved to S3 successfully")
-            
-        except Exception as storage_error:
-            print(f"Failed to save product to S3: {storage_error}")
-            # Continue anyway - at least we tried
         
+        # Create new product
+        new_product = {
+            'id': product_id,
+            'name': name,
+            'description': description,
+            'price': float(price) if isinstance(price, (int, float)) or (isinstance(price, str) and price.replace('.','').isdigit()) else 0.0,
+            'category': category,
+            'image': image_url,
+            'userId': user_id,
+            'createdAt': datetime.now().isoformat(),
+            'tags': tags
+        }
+        
+        # Compare against listings sharing a MinHash band rather than the whole catalogue
+        duplicates = [{'id': match_id, 'similarity': score}
+                      for match_id, score in find_product_duplicates(new_product)]
+        if duplicates and DUPLICATE_POLICY == 'reject':
+            return {
+                'statusCode': 409,
+                'headers': headers,
+                'body': json.dumps({
+                    'error': 'This product looks like a duplicate of an existing listing',
+                    'duplicates': duplicates
+                })
+            }
+        if duplicates:
+            new_product['possibleDuplicateOf'] = [match['id'] for match in duplicates]
+            print(f"Product {product_id} looks like a duplicate of {new_product['possibleDuplicateOf']}")
+        
+        # Write the product object and add it to the manifest. Storage errors
+        # propagate so the client never sees a 201 for a product that was lost.
+        commit_catalog_changes(upserts=[new_product])
+        print(f"Product {product_id} saved to S3 successfully")
+        # Imports and edits reach the buckets through the scheduled job
+        add_duplicate_candidates([new_product])
+        
+        response_body = {
+            'id': product_id,
+            'name': name,
+            'image': image_url,
+            'message': 'Product added successfully'
+        }
+        if duplicates:
+            response_body['possibleDuplicates'] = duplicates
         return {
             'statusCode': 201,
             'headers': headers,
-            'body': json.dumps({
-                'id': product_id,
-                'name': name,
-                'image': image_url,
-                'message': 'Product added successfully'
-            })
+            'body': json.dumps(response_body)
         }
+    except ConflictError as e:
+        return conflict_response(headers, e)
     except Exception as e:
         import traceback
         print(f"ERROR in add_product: {str(e)}")
@@ -310,6 +1542,326 @@ def add_product(event, headers):
             'body': json.dumps({'error': f'Failed to add product: {str(e)}'})
         }
 
+def import_products(event, headers):
+    """Bulk import products from an NDJSON or CSV body (admin only).
+
+    Rows are validated one at a time and every valid row is committed in a
+    single catalogue write. The response reports the outcome of each row.
+    """
+    try:
+        allowed, user_email = is_admin_request(event)
+        if not allowed:
+            return forbidden_response(headers)
+        
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            import_format = detect_format(get_request_header(event, 'Content-Type'), query_params.get('format'))
+        except ValueError as e:
+            return {
+                'statusCode': 415,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        body = event.get('body') or ''
+        if event.get('isBase64Encoded'):
+            body = base64.b64decode(body).decode('utf-8')
+        
+        created_at = datetime.now().isoformat()
+        new_products = []
+        results = []
+        for row_number, row in iter_rows(body, import_format):
+            if row_number > MAX_IMPORT_ROWS:
+                return {
+                    'statusCode': 413,
+                    'headers': headers,
+                    'body': json.dumps({'error': f'Imports are limited to {MAX_IMPORT_ROWS} rows'})
+                }
+            try:
+                if isinstance(row, ImportRowError):
+                    raise row
+                product = {'id': str(uuid.uuid4()), **product_fields(row), 'createdAt': created_at}
+            except ImportRowError as e:
+                results.append({'row': row_number, 'error': str(e)})
+                continue
+            new_products.append(product)
+            results.append({'row': row_number, 'id': product['id']})
+        
+        if not new_products:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'No valid rows to import', 'imported': 0, 'failed': len(results), 'results': results})
+            }
+        
+        manifest, _ = commit_catalog_changes(upserts=new_products)
+        print(f"Imported {len(new_products)} products ({len(results) - len(new_products)} rejected) by {user_email}")
+        
+        return {
+            'statusCode': 201,
+            'headers': headers,
+            'body': json.dumps({
+                'imported': len(new_products),
+                'failed': len(results) - len(new_products),
+                'version': manifest['version'],
+                'results': results
+            })
+        }
+    except ConflictError as e:
+        return conflict_response(headers, e)
+    except Exception as e:
+        print(f"Error in import_products: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to import products: {str(e)}'})
+        }
+
+def forbidden_response(headers):
+    return {
+        'statusCode': 403,
+        'headers': headers,
+        'body': json.dumps({'error': 'Unauthorized. Admin access required.'})
+    }
+
+def parse_json_body(event):
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return json.loads(body) if body else {}
+
+def get_product_inventory(event, headers):
+    """Stock totals of a product; tracked is False when it has no stock count"""
+    try:
+        product_id = event['pathParameters']['id']
+        if product_id not in get_catalog_index().by_id:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': 'Product not found'})
+            }
+        stock = get_stock(s3_client, S3_BUCKET, product_id)
+        return {
+            'statusCode': 200,
+            'headers': {**headers, 'Cache-Control': 'no-store'},
+            'body': json.dumps({'productId': product_id, 'tracked': stock is not None, **(stock or {})})
+        }
+    except Exception as e:
+        print(f"Error in get_product_inventory: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def set_product_inventory(event, headers):
+    """Set the units available to sell (admin only)"""
+    try:
+        allowed, user_email = is_admin_request(event)
+        if not allowed:
+            return forbidden_response(headers)
+        product_id = event['pathParameters']['id']
+        try:
+            stock = parse_json_body(event).get('stock')
+        except ValueError:
+            stock = None
+        if isinstance(stock, bool) or not isinstance(stock, int) or stock < 0:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'stock must be a non-negative whole number'})
+            }
+        if product_id not in get_catalog_index(load_catalog(max_age=0)).by_id:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': 'Product not found'})
+            }
+        
+        set_stock(s3_client, S3_BUCKET, product_id, stock)
+        print(f"Stock of {product_id} set to {stock} by {user_email or 'admin'}")
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({'productId': product_id, 'tracked': True, **get_stock(s3_client, S3_BUCKET, product_id)})
+        }
+    except Exception as e:
+        print(f"Error in set_product_inventory: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def patch_product(event, headers):
+    """Partially update one product (admin only)"""
+    try:
+        allowed, user_email = is_admin_request(event)
+        if not allowed:
+            return forbidden_response(headers)
+        
+        product_id = (event.get('pathParameters') or {}).get('id')
+        if not product_id:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'Product ID is required'})
+            }
+        try:
+            changes = parse_json_body(event)
+            if not isinstance(changes, dict) or not changes:
+                raise ValueError('Body must be a JSON object of fields to update')
+            changes = product_fields(changes, partial=True)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        # Conditional write on the product object, so concurrent patches to
+        # different fields of the same product both survive
+        def apply_patch(current):
+            if current is None:
+                return None
+            return {**current, **changes, 'updatedAt': datetime.now().isoformat()}
+        
+        product, _ = update_json(s3_client, S3_BUCKET, product_key(product_id), apply_patch)
+        if product is None:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': 'Product not found'})
+            }
+        commit_catalog_changes(upserts=[product], save_upserts=False)
+        print(f"Product {product_id} updated by {user_email}: {sorted(changes)}")
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps(product)
+        }
+    except ConflictError as e:
+        return conflict_response(headers, e)
+    except Exception as e:
+        print(f"Error in patch_product: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to update product: {str(e)}'})
+        }
+
+def batch_update_products(event, headers):
+    """Apply many creates, partial updates and deletes as one catalogue commit (admin only).
+
+    Body: {"upserts": [{...fields, optional "id"}], "deletes": [id, ...]}.
+    Upserts with an id update that existing product; the others create new
+    products. Every item is validated before anything is written, so an
+    invalid item rejects the whole batch. Updates are merged onto the latest
+    product objects with conditional writes, like PATCH, and the manifest is
+    committed last. A storage error part-way can leave some product objects
+    updated before the listing is; the batch is safe to retry.
+    """
+    try:
+        allowed, user_email = is_admin_request(event)
+        if not allowed:
+            return forbidden_response(headers)
+        
+        try:
+            batch = parse_json_body(event)
+            if not isinstance(batch, dict):
+                raise ValueError('Body must be a JSON object')
+            upserts = batch.get('upserts') or []
+            deletes = batch.get('deletes') or []
+            if not isinstance(upserts, list) or not isinstance(deletes, list):
+                raise ValueError('upserts and deletes must be lists')
+            if not all(isinstance(product_id, str) and product_id for product_id in deletes):
+                raise ValueError('deletes must be product IDs')
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
+        if not upserts and not deletes:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'Nothing to change'})
+            }
+        if len(upserts) + len(deletes) > MAX_BATCH_SIZE:
+            return {
+                'statusCode': 413,
+                'headers': headers,
+                'body': json.dumps({'error': f'Batches are limited to {MAX_BATCH_SIZE} changes'})
+            }
+        
+        errors = []
+        delete_ids = set(deletes)
+        creates, updates = [], {}
+        for position, item in enumerate(upserts):
+            try:
+                if not isinstance(item, dict):
+                    raise ImportRowError('Each upsert must be a JSON object')
+                fields = {key: value for key, value in item.items() if key != 'id'}
+                if 'id' in item and not (isinstance(item['id'], str) and item['id']):
+                    raise ImportRowError('id must be a product ID')
+                if item.get('id') in delete_ids:
+                    raise ImportRowError('Cannot update and delete the same product')
+                if item.get('id'):
+                    updates[item['id']] = {**updates.get(item['id'], {}), **product_fields(fields, partial=True)}
+                else:
+                    creates.append(product_fields(fields))
+            except ImportRowError as e:
+                errors.append({'upsert': position, 'error': str(e)})
+        
+        listed = get_catalog_index().by_id
+        errors.extend({'id': product_id, 'error': 'Product not found'} for product_id in updates if product_id not in listed)
+        if errors:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'Batch rejected, nothing was changed', 'errors': errors})
+            }
+        
+        now = datetime.now().isoformat()
+        created = [{'id': str(uuid.uuid4()), **fields, 'createdAt': now} for fields in creates]
+        for_each_item(save_product_to_s3, created)
+        
+        def apply_update(product_id):
+            def merge(current):
+                if current is None:
+                    # Deleted since validation
+                    return None
+                return {**current, **updates[product_id], 'updatedAt': now}
+            product, _ = update_json(s3_client, S3_BUCKET, product_key(product_id), merge)
+            return product
+        
+        updated = [product for product in for_each_item(apply_update, list(updates)) if product is not None]
+        manifest, removed_ids = commit_catalog_changes(upserts=created + updated, deletes=deletes, save_upserts=False)
+        print(f"Batch by {user_email}: {len(creates)} created, {len(updates)} updated, {len(removed_ids)} deleted")
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({
+                'version': manifest['version'],
+                'created': [product['id'] for product in created],
+                'updated': [product['id'] for product in updated],
+                'deleted': removed_ids,
+                'notFound': sorted(delete_ids - set(removed_ids))
+            })
+        }
+    except ConflictError as e:
+        return conflict_response(headers, e)
+    except Exception as e:
+        print(f"Error in batch_update_products: {e}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to apply batch: {str(e)}'})
+        }
+
 def get_user_email_from_token(event):
     """Extract user email from JWT token in Authorization header"""
     try:
@@ -342,18 +1894,23 @@ def is_admin_user(email):
         return False
     return email.strip().lower() in [admin.strip().lower() for admin in ADMIN_EMAILS]
 
+def is_admin_request(event):
+    """Return (allowed, user_email) for an admin-only request"""
+    # Check for admin URL parameter first
+    query_params = event.get('queryStringParameters') or {}
+    is_admin_via_url = query_params.get('admin') == 'true'
+    
+    # Extract user email from token
+    user_email = get_user_email_from_token(event)
+    
+    # Allow access if admin URL parameter is set OR user is in admin email list
+    return is_admin_via_url or is_admin_user(user_email), user_email
+
 def delete_product(event, headers):
     """Delete a product (admin only)"""
     try:
-        # Check for admin URL parameter first
-        query_params = event.get('queryStringParameters') or {}
-        is_admin_via_url = query_params.get('admin') == 'true'
-        
-        # Extract user email from token
-        user_email = get_user_email_from_token(event)
-        
-        # Allow access if admin URL parameter is set OR user is in admin email list
-        if not (is_admin_via_url or is_admin_user(user_email)):
+        allowed, user_email = is_admin_request(event)
+        if not allowed:
             return {
                 'statusCode': 403,
                 'headers': headers,
@@ -371,23 +1928,16 @@ def delete_product(event, headers):
                 'body': json.dumps({'error': 'Product ID is required'})
             }
         
-        # Get existing products
-        existing_products = get_products_from_s3()
-        
-        # Find and remove the product
-        original_count = len(existing_products)
-        existing_products = [p for p in existing_products if p.get('id') != product_id]
+        # Remove the product from the manifest and delete its object
+        _, removed_ids = commit_catalog_changes(deletes=[product_id])
         
-        if len(existing_products) == original_count:
+        if not removed_ids:
             return {
                 'statusCode': 404,
                 'headers': headers,
                 'body': json.dumps({'error': 'Product not found'})
             }
         
-        # Save updated products list
-        save_products_to_s3(existing_products)
-        
         print(f"Product {product_id} deleted by admin user {user_email}")
         
         return {
@@ -396,6 +1946,8 @@ def delete_product(event, headers):
             'body': json.dumps({'message': f'Product {product_id} deleted successfully'})
         }
         
+    except ConflictError as e:
+        return conflict_response(headers, e)
     except Exception as e:
         print(f"Error in delete_product: {e}")
         import traceback
@@ -0,0 +1,132 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+import boto3
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError as e:
+    print(f"Failed to import numpy/scipy: {e}")
+    np = None
+    sparse = None
+
+from orders_new import ORDERS_KEY
+from related_products import RELATED_PRODUCTS_KEY, TOP_K
+from s3_store import read_json
+
+# "Frequently bought together" recommendations.
+#
+# A scheduled job turns order history into a basket x product incidence
+# matrix B; B.T @ B is the sparse product co-occurrence matrix, whose rows
+# give, for each product, how many orders also contained every other
+# product. The top related products per item are written to one S3 document
+# that GET /products/{id}/related serves with a dictionary lookup.
+
+s3_client = boto3.client('s3')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'ecommerce-product-images')
+
+# Orders in these states never completed, so they say nothing about what sells together
+EXCLUDED_STATUSES = ('cancelled', 'canceled', 'failed', 'refunded')
+
+
+def order_baskets(orders):
+    """Distinct product IDs of each completed order that has at least two"""
+    baskets = []
+    for order in orders:
+        if (order.get('status') or '').lower() in EXCLUDED_STATUSES:
+            continue
+        basket = set()
+        for item in order.get('items') or []:
+            product_id = item.get('productId') or item.get('id')
+            if product_id:
+                basket.add(str(product_id))
+        if len(basket) > 1:
+            baskets.append(basket)
+    return baskets
+
+
+def _top_related(product_ids, rows, basket_counts, top_k):
+    """Materialize [{'id', 'count', 'confidence'}] lists from (column, count) rows"""
+    related = {}
+    for product_id, row in zip(product_ids, rows):
+        ranked = sorted(row, key=lambda entry: (-entry[1], product_ids[entry[0]]))[:top_k]
+        if ranked:
+            related[product_id] = [
+                {
+                    'id': product_ids[column],
+                    'count': int(count),
+                    'confidence': round(int(count) / basket_counts[product_id], 3)
+                }
+                for column, count in ranked
+            ]
+    return related
+
+
+def build_related(orders, top_k=TOP_K):
+    """Return {product_id: top related products} from order history"""
+    baskets = order_baskets(orders)
+    basket_counts = Counter(product_id for basket in baskets for product_id in basket)
+    product_ids = sorted(basket_counts)
+    if not product_ids:
+        return {}
+    columns = {product_id: column for column, product_id in enumerate(product_ids)}
+
+    if sparse is not None:
+        row_indices = [row for row, basket in enumerate(baskets) for _ in basket]
+        column_indices = [columns[product_id] for basket in baskets for product_id in basket]
+        incidence = sparse.csr_matrix(
+            (np.ones(len(column_indices), dtype=np.int32), (row_indices, column_indices)),
+            shape=(len(baskets), len(product_ids))
+        )
+        cooccurrence = (incidence.T @ incidence).tocsr()
+        cooccurrence.setdiag(0)
+        cooccurrence.eliminate_zeros()
+        rows = []
+        for row in range(len(product_ids)):
+            start, end = cooccurrence.indptr[row], cooccurrence.indptr[row + 1]
+            counts = cooccurrence.data[start:end]
+            indices = cooccurrence.indices[start:end]
+            if len(counts) > top_k:
+                # Only the candidates that can make the top K need sorting
+                keep = np.argpartition(-counts, top_k - 1)[:top_k]
+                cutoff = counts[keep].min()
+                keep = np.flatnonzero(counts >= cutoff)
+                counts, indices = counts[keep], indices[keep]
+            rows.append(list(zip(indices.tolist(), counts.tolist())))
+    else:
+        pairs = [Counter() for _ in product_ids]
+        for basket in baskets:
+            basket_columns = [columns[product_id] for product_id in basket]
+            for column in basket_columns:
+                pairs[column].update(other for other in basket_columns if other != column)
+        rows = [list(counter.items()) for counter in pairs]
+
+    return _top_related(product_ids, rows, basket_counts, top_k)
+
+
+def rebuild_related_products(top_k=TOP_K):
+    """Recompute recommendations from all orders and store them; returns the document"""
+    orders_data, _ = read_json(s3_client, S3_BUCKET, ORDERS_KEY)
+    orders = (orders_data or {}).get('orders', [])
+    document = {
+        'generatedAt': datetime.now().isoformat(),
+        'orderCount': len(orders),
+        'related': build_related(orders, top_k)
+    }
+    s3_client.put_object(
+        Bucket=S3_BUCKET,
+        Key=RELATED_PRODUCTS_KEY,
+        Body=json.dumps(document, separators=(',', ':')),
+        ContentType='application/json'
+    )
+    return document
+
+
+def lambda_handler(event, context):
+    """Scheduled job entry point"""
+    document = rebuild_related_products()
+    print(f"Built recommendations for {len(document['related'])} products from {document['orderCount']} orders")
+    return {'products': len(document['related']), 'orders': document['orderCount']}
@@ -0,0 +1,9 @@
+import os
+
+# Where the scheduled recommendations job stores "frequently bought together"
+# lists, and how many it keeps per product. Kept apart from recommendations.py
+# so the products API can serve them without importing numpy/scipy or the
+# orders module.
+
+RELATED_PRODUCTS_KEY = 'products/recommendations/related.json'
+TOP_K = int(os.environ.get('RELATED_TOP_K', '10'))
@@ -0,0 +1,157 @@
+import json
+import os
+import random
+import time
+
+from botocore.exceptions import ClientError
+
+from metrics import put_metrics
+
+# Optimistic concurrency for JSON documents kept in S3.
+#
+# Every write is conditional: updates send If-Match with the ETag that was
+# read, creates send If-None-Match: *. When another invocation wins the race
+# S3 rejects the put and the update is re-applied to the fresh document, so
+# concurrent writers never overwrite each other.
+
+MAX_ATTEMPTS = int(os.environ.get('S3_WRITE_MAX_ATTEMPTS', '6'))
+RETRY_BASE_DELAY = float(os.environ.get('S3_WRITE_RETRY_BASE_DELAY', '0.05'))
+
+# S3 answers a lost conditional write with 412, or 409 when two conditional
+# writes to the same key are in flight at once
+CONFLICT_ERROR_CODES = ('PreconditionFailed', 'ConditionalRequestConflict')
+
+# Per-container counters for tests and benchmarks; each contended write is
+# also recorded as a CloudWatch metric (see record_contention)
+write_stats = {
+    'writes': 0,
+    'retries': 0,
+    'conflicts': 0,
+    'exhausted': 0,
+    'retryDelaySeconds': 0.0,
+}
+
+
+# Returned by read_json in place of a document when If-None-Match matched
+NOT_MODIFIED = object()
+
+
+class ConflictError(Exception):
+    """Raised when a conditional update keeps losing to concurrent writers"""
+
+
+def is_conflict(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in CONFLICT_ERROR_CODES
+
+
+def is_missing(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in ('NoSuchKey', '404')
+
+
+def is_not_modified(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in ('304', 'NotModified')
+
+
+def get_write_stats():
+    """Snapshot of the write/retry/conflict counters for this container"""
+    return dict(write_stats)
+
+
+def reset_write_stats():
+    for name in write_stats:
+        write_stats[name] = 0.0 if name == 'retryDelaySeconds' else 0
+
+
+def record_contention(key, conflicts, delay, exhausted):
+    """Emit a metric for one update_json call that hit conflicts.
+
+    Uncontended writes are not recorded, so the log only grows with contention.
+    """
+    put_metrics(
+        # The first two path segments keep per-product keys from multiplying dimensions
+        {'Document': '/'.join(key.split('/')[:2])},
+        {
+            'WriteConflicts': conflicts,
+            'WriteRetryDelayMilliseconds': round(delay * 1000, 1),
+            'WritesExhausted': int(exhausted)
+        },
+        {'WriteConflicts': 'Count', 'WriteRetryDelayMilliseconds': 'Milliseconds', 'WritesExhausted': 'Count'}
+    )
+
+
+def read_json(s3_client, bucket, key, if_none_match=None):
+    """Return (document, etag), or (None, None) if the key does not exist.
+
+    With if_none_match, an unchanged object returns (NOT_MODIFIED, etag)
+    without transferring the body. Any other error propagates so callers
+    never mistake a failed read for an empty document.
+    """
+    condition = {'IfNoneMatch': if_none_match} if if_none_match else {}
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key, **condition)
+    except ClientError as e:
+        if is_missing(e):
+            return None, None
+        if is_not_modified(e):
+            return NOT_MODIFIED, if_none_match
+        raise
+    return json.loads(response['Body'].read().decode('utf-8')), response.get('ETag')
+
+
+def write_json(s3_client, bucket, key, document, etag=None, **put_kwargs):
+    """Conditionally write a document and return its new ETag.
+
+    With an ETag the write only succeeds if the object is unchanged; without
+    one it only succeeds if the object does not exist yet. A lost race raises
+    the ClientError from S3 (see is_conflict).
+    """
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    response = s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(document, separators=(',', ':')),
+        ContentType='application/json',
+        **condition,
+        **put_kwargs
+    )
+    write_stats['writes'] += 1
+    return response.get('ETag')
+
+
+def update_json(s3_client, bucket, key, mutate, max_attempts=None, **put_kwargs):
+    """Read-modify-write a JSON document with optimistic concurrency.
+
+    mutate(current) receives the latest document (None if missing) and returns
+    the new document, or None to leave it unchanged. On a conflict the document
+    is re-read and mutate is applied again, which merges this change on top of
+    whatever the competing writer stored. Returns (document, etag) as stored.
+    """
+    max_attempts = max_attempts or MAX_ATTEMPTS
+    total_delay = 0.0
+    for attempt in range(max_attempts):
+        current, etag = read_json(s3_client, bucket, key)
+        updated = mutate(current)
+        if updated is None:
+            if attempt:
+                record_contention(key, attempt, total_delay, False)
+            return current, etag
+        try:
+            new_etag = write_json(s3_client, bucket, key, updated, etag, **put_kwargs)
+            if attempt:
+                record_contention(key, attempt, total_delay, False)
+            return updated, new_etag
+        except ClientError as e:
+            if not is_conflict(e):
+                raise
+            write_stats['conflicts'] += 1
+            if attempt + 1 < max_attempts:
+                delay = random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt))
+                write_stats['retries'] += 1
+                write_stats['retryDelaySeconds'] += delay
+                total_delay += delay
+                time.sleep(delay)
+
+    write_stats['exhausted'] += 1
+    record_contention(key, max_attempts, total_delay, True)
+    print(f"Conditional write to {key} gave up after {max_attempts} attempts: {json.dumps(get_write_stats())}")
+    raise ConflictError(f"Too many concurrent updates to {key}, please retry")
@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import math
+import re
+from collections import Counter, OrderedDict
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Name matches count for more than description or category matches
+FIELD_WEIGHTS = (('name', 2), ('category', 1), ('description', 1))
+
+STOPWORDS = frozenset(('a', 'an', 'and', 'the', 'of', 'for', 'with', 'in', 'on', 'to', 'is', 'by', 'or'))
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Sorts after any normalized text, so (prefix + ID_SENTINEL,) bounds a prefix range
+ID_SENTINEL = '\U0010ffff'
+
+
+def tokenize(text):
+    """Lowercased alphanumeric tokens with stopwords dropped and plural 's' stripped"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or '').lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def document_terms(product):
+    """Weighted term frequencies for a product's searchable fields"""
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for token in tokenize(product.get(field)):
+            terms[token] += weight
+    return terms
+
+
+class SearchIndex:
+    """Inverted index over product name, category and description.
+
+    Scoring only touches the postings of the query's terms, so search cost
+    depends on how many products match rather than on catalogue size.
+    """
+
+    def __init__(self, version=0):
+        self.version = version
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.postings = {}
+        self.total_length = 0
+
+    @classmethod
+    def build(cls, products, version):
+        index = cls(version)
+        for product in products:
+            index.add(product)
+        return index
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, product):
+        self.remove(product['id'])
+        self._add_terms(product['id'], document_terms(product))
+
+    def _add_terms(self, product_id, terms):
+        self.doc_terms[product_id] = terms
+        self.doc_lengths[product_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[product_id]
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[product_id] = frequency
+
+    def remove(self, product_id):
+        terms = self.doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(product_id)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(product_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def apply_changes(self, upserts, removed_ids, version):
+        """Incrementally move the index to a new catalogue version"""
+        for product_id in removed_ids:
+            self.remove(product_id)
+        for product in upserts:
+            self.add(product)
+        self.version = version
+
+    def search(self, query, limit=20):
+        """Return (ranked [(product_id, score)], total_matches) using BM25"""
+        query_terms = set(tokenize(query))
+        count = len(self.doc_terms)
+        if not query_terms or not count:
+            return [], 0
+        average_length = self.total_length / count
+        scores = {}
+        for term in query_terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for product_id, frequency in posting.items():
+                length = self.doc_lengths[product_id]
+                norm = frequency + K1 * (1 - B + B * length / average_length)
+                scores[product_id] = scores.get(product_id, 0.0) + idf * frequency * (K1 + 1) / norm
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return ranked, len(scores)
+
+    def to_dict(self):
+        """Persistable form; postings are rebuilt from the per-product terms on load"""
+        return {'version': self.version, 'documents': self.doc_terms}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls(data.get('version', 0))
+        for product_id, terms in data.get('documents', {}).items():
+            index._add_terms(product_id, Counter(terms))
+        return index
+
+
+class QueryCache:
+    """Small LRU of recent search results"""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def normalize_prefix(text):
+    return ' '.join(TOKEN_PATTERN.findall((text or '').lower()))
+
+
+def _remove_entry(entries, entry):
+    position = bisect.bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
+
+
+class PrefixIndex:
+    """Sorted-array prefix index over product names and categories for typeahead.
+
+    Every word-start suffix of a name is a key ("coffee mug", "mug"), so a
+    prefix matches the start of any word. Matching keys form one contiguous
+    run of the sorted array, found with two binary searches.
+    """
+
+    def __init__(self, version=0):
+        self.version = version
+        self.entries = []
+        self.names = {}
+        self.categories = {}
+
+    @classmethod
+    def build(cls, products, version):
+        index = cls(version)
+        for product in products:
+            index._add(product, keep_sorted=False)
+        index.entries.sort()
+        return index
+
+    def _name_keys(self, name):
+        words = normalize_prefix(name).split()
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    def _add(self, product, keep_sorted=True):
+        insert = (lambda entry: bisect.insort(self.entries, entry)) if keep_sorted else self.entries.append
+        name = product.get('name') or ''
+        self.names[product['id']] = (name, product.get('category') or '')
+        for key in self._name_keys(name):
+            insert((key, 'product', product['id']))
+        category = normalize_prefix(product.get('category'))
+        if category:
+            display, count = self.categories.get(category, (product['category'], 0))
+            if not count:
+                insert((category, 'category', category))
+            self.categories[category] = (display, count + 1)
+
+    def _remove(self, product_id):
+        if product_id not in self.names:
+            return
+        name, category = self.names.pop(product_id)
+        for key in self._name_keys(name):
+            _remove_entry(self.entries, (key, 'product', product_id))
+        category = normalize_prefix(category)
+        if category in self.categories:
+            display, count = self.categories[category]
+            if count <= 1:
+                del self.categories[category]
+                _remove_entry(self.entries, (category, 'category', category))
+            else:
+                self.categories[category] = (display, count - 1)
+
+    def apply_changes(self, upserts, removed_ids, version):
+        """Incrementally move the index to a new catalogue version"""
+        for product_id in removed_ids:
+            self._remove(product_id)
+        for product in upserts:
+            self._remove(product['id'])
+            self._add(product)
+        self.version = version
+
+    def suggest(self, prefix, limit=8):
+        """Return up to limit suggestions for names or categories starting with prefix"""
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.entries, (prefix,))
+        end = bisect.bisect_left(self.entries, (prefix + ID_SENTINEL,), start)
+        # Rank the first few matches: categories, then whole-name matches, then shorter names
+        candidates = {}
+        for key, kind, ref in self.entries[start:min(end, start + limit * 8)]:
+            if kind == 'category':
+                display = self.categories[ref][0]
+                candidates[('category', ref)] = (0, len(display), display, {'text': display, 'type': 'category'})
+            else:
+                display = self.names[ref][0]
+                rank = 1 if normalize_prefix(display).startswith(prefix) else 2
+                previous = candidates.get(('product', ref))
+                if previous is None or rank < previous[0]:
+                    candidates[('product', ref)] = (rank, len(display), display, {'text': display, 'type': 'product', 'id': ref})
+        return [suggestion for *_, suggestion in sorted(candidates.values(), key=lambda c: c[:3])][:limit]
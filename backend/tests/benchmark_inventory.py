@@ -0,0 +1,85 @@
+"""Reservation throughput for one hot product under parallel checkouts.
+
+Runs against FakeS3 with a simulated per-request latency, once with all
+stock in a single shard and once with the default sharding:
+
+    cd backend && python -m tests.benchmark_inventory [--threads 32] [--checkouts 400]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+import inventory
+from s3_store import ConflictError
+from tests.fake_s3 import FakeS3
+
+BUCKET = 'benchmark-bucket'
+
+
+class SlowS3(FakeS3):
+    """FakeS3 that takes roughly an S3 round trip per request, outside its lock"""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+
+    def get_object(self, **kwargs):
+        time.sleep(self.latency)
+        return super().get_object(**kwargs)
+
+    def put_object(self, **kwargs):
+        time.sleep(self.latency)
+        return super().put_object(**kwargs)
+
+
+def run(shards, threads, checkouts, latency):
+    s3 = SlowS3(latency)
+    results = []
+    with patch('inventory.SHARDS', shards):
+        inventory.set_stock(s3, BUCKET, 'hot', checkouts)
+        inventory.reset_inventory_stats()
+
+        def checkout(_):
+            try:
+                inventory.reserve(s3, BUCKET, [('hot', 1)])
+                results.append('reserved')
+            except inventory.OutOfStockError:
+                results.append('outOfStock')
+            except ConflictError:
+                results.append('gaveUp')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(checkout, range(checkouts)))
+        elapsed = time.perf_counter() - started
+
+        stock = inventory.get_stock(s3, BUCKET, 'hot')
+    outcomes = {outcome: results.count(outcome) for outcome in ('reserved', 'outOfStock', 'gaveUp')}
+    assert stock['held'] == outcomes['reserved'], 'oversold'
+    return {**outcomes, **inventory.get_inventory_stats(), 'seconds': elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--checkouts', type=int, default=400)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{args.checkouts} checkouts of one product, {args.threads} threads, {args.latency_ms}ms per S3 request')
+    for shards in sorted({1, inventory.SHARDS}):
+        result = run(shards, args.threads, args.checkouts, args.latency_ms / 1000)
+        print(
+            f"shards={shards:<3} {result['reserved'] / result['seconds']:8.1f} reservations/s  "
+            f"reserved={result['reserved']} gaveUp={result['gaveUp']} "
+            f"busyShards={result['busyShards']} shardWrites={result['shardWrites']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
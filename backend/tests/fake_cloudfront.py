@@ -0,0 +1,36 @@
+import threading
+
+
+class RecordingCloudFront:
+    """Local stand-in for the CloudFront client that records invalidations.
+
+    Like CloudFront, a repeated CallerReference returns the existing
+    invalidation instead of creating (and billing) a new one.
+    """
+
+    def __init__(self, fail=False):
+        self.invalidations = []
+        self.requests = []
+        self.fail = fail
+        self._by_reference = {}
+        self._lock = threading.Lock()
+
+    def create_invalidation(self, DistributionId, InvalidationBatch):
+        with self._lock:
+            self.requests.append((DistributionId, InvalidationBatch))
+            if self.fail:
+                raise RuntimeError('CloudFront unavailable')
+            reference = (DistributionId, InvalidationBatch['CallerReference'])
+            if reference not in self._by_reference:
+                invalidation_id = f'I{len(self.invalidations) + 1}'
+                self.invalidations.append({
+                    'Id': invalidation_id,
+                    'DistributionId': DistributionId,
+                    'Paths': list(InvalidationBatch['Paths']['Items'])
+                })
+                self._by_reference[reference] = invalidation_id
+            return {'Invalidation': {'Id': self._by_reference[reference], 'Status': 'InProgress'}}
+
+    def paths(self):
+        """Every path invalidated so far"""
+        return [path for invalidation in self.invalidations for path in invalidation['Paths']]
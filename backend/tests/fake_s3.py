@@ -0,0 +1,96 @@
+"""In-memory stand-in for the subset of the boto3 S3 client used by the Lambdas"""
+import hashlib
+import io
+import threading
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+
+def precondition_failed(operation='PutObject'):
+    return ClientError(
+        {'Error': {'Code': 'PreconditionFailed',
+                   'Message': 'At least one of the pre-conditions you specified did not hold'},
+         'ResponseMetadata': {'HTTPStatusCode': 412}},
+        operation
+    )
+
+
+def not_modified(operation='GetObject'):
+    return ClientError(
+        {'Error': {'Code': '304', 'Message': 'Not Modified'},
+         'ResponseMetadata': {'HTTPStatusCode': 304}},
+        operation
+    )
+
+
+class NoSuchKey(ClientError):
+    def __init__(self, operation='GetObject'):
+        super().__init__(
+            {'Error': {'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'},
+             'ResponseMetadata': {'HTTPStatusCode': 404}},
+            operation
+        )
+
+
+class FakeS3:
+    """Thread-safe fake S3 client keyed by (bucket, key)"""
+
+    exceptions = SimpleNamespace(NoSuchKey=NoSuchKey, ClientError=ClientError)
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _record(self, operation, **kwargs):
+        self.calls.append((operation, kwargs.get('Key')))
+
+    def calls_for(self, operation):
+        return [key for op, key in self.calls if op == operation]
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        with self._lock:
+            self._record('PutObject', Key=Key)
+            existing = self.objects.get((Bucket, Key))
+            if 'IfNoneMatch' in kwargs and existing is not None:
+                raise precondition_failed()
+            if 'IfMatch' in kwargs and (existing is None or existing['ETag'] != kwargs['IfMatch']):
+                raise precondition_failed()
+            data = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+            etag = '"%s"' % hashlib.md5(data).hexdigest()
+            self.objects[(Bucket, Key)] = {
+                'Body': data,
+                'ETag': etag,
+                'ContentType': kwargs.get('ContentType', 'binary/octet-stream'),
+                'ContentEncoding': kwargs.get('ContentEncoding'),
+                'CacheControl': kwargs.get('CacheControl'),
+                'Metadata': dict(kwargs.get('Metadata') or {}),
+            }
+            return {'ETag': etag}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self._record('GetObject', Key=Key)
+            obj = self.objects.get((Bucket, Key))
+            if obj is None:
+                raise NoSuchKey()
+            if kwargs.get('IfNoneMatch') == obj['ETag']:
+                raise not_modified()
+            return {
+                'Body': io.BytesIO(obj['Body']),
+                'ETag': obj['ETag'],
+                'ContentLength': len(obj['Body']),
+                'ContentType': obj['ContentType'],
+                'Metadata': dict(obj['Metadata']),
+            }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self._record('DeleteObject', Key=Key)
+            self.objects.pop((Bucket, Key), None)
+            return {}
+
+    def body(self, Bucket, Key):
+        """Test helper returning the raw bytes stored at a key"""
+        return self.objects[(Bucket, Key)]['Body']
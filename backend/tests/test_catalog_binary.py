@@ -0,0 +1,58 @@
+import pytest
+import os
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+from catalog_binary import BinaryCatalog, encode_catalog
+
+PRODUCTS = [
+    {'id': 'b2', 'name': 'Mug', 'price': 4.5, 'category': 'Kitchen'},
+    {'id': 'a1', 'name': 'Lämp ☀', 'price': '10', 'description': 'Warm light'},
+    {'id': 'c3', 'name': 'Cup'},
+]
+
+
+class TestBinaryCatalog:
+    
+    def test_round_trip(self):
+        catalog = BinaryCatalog(encode_catalog(PRODUCTS, 7, {'lastUpdated': 'now'}))
+        
+        assert len(catalog) == 3 and catalog.version == 7
+        assert catalog.meta == {'lastUpdated': 'now'}
+        assert list(catalog) == PRODUCTS
+        assert catalog[-1] == PRODUCTS[-1]
+        assert catalog[0:2] == PRODUCTS[0:2]
+        assert [catalog.price(i) for i in range(3)] == [4.5, 10.0, 0.0]
+        with pytest.raises(IndexError):
+            catalog[3]
+    
+    def test_lookup_by_id(self):
+        catalog = BinaryCatalog(encode_catalog(PRODUCTS, 1))
+        
+        assert catalog.get('a1')['name'] == 'Lämp ☀'
+        assert catalog.get('c3') == PRODUCTS[2]
+        assert catalog.get('zz') is None
+        assert catalog.get('a') is None
+    
+    def test_to_json_and_empty_catalog(self):
+        import json
+        assert json.loads(BinaryCatalog(encode_catalog(PRODUCTS, 1)).to_json()) == PRODUCTS
+        empty = BinaryCatalog(encode_catalog([], 0))
+        assert len(empty) == 0 and empty.to_json() == '[]' and empty.get('a') is None
+    
+    def test_mmapped_file(self, tmp_path):
+        path = tmp_path / 'catalog.bin'
+        path.write_bytes(encode_catalog(PRODUCTS, 3))
+        
+        catalog = BinaryCatalog.open(str(path))
+        
+        assert catalog.get('b2') == PRODUCTS[0]
+        catalog.close()
+    
+    def test_rejects_other_data(self):
+        with pytest.raises(ValueError):
+            BinaryCatalog(b'{"products": []}' * 4)
+        with pytest.raises(ValueError):
+            BinaryCatalog(encode_catalog(PRODUCTS, 1)[:40])
@@ -0,0 +1,86 @@
+import pytest
+import os
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+from catalog_import import ImportRowError, detect_format, iter_rows, parse_tags, product_fields
+
+
+class TestDetectFormat:
+    
+    def test_from_content_type(self):
+        assert detect_format('text/csv; charset=utf-8') == 'csv'
+        assert detect_format('application/x-ndjson') == 'ndjson'
+    
+    def test_explicit_format_wins(self):
+        assert detect_format('text/plain', 'CSV') == 'csv'
+        with pytest.raises(ValueError):
+            detect_format('text/csv', 'xml')
+        with pytest.raises(ValueError):
+            detect_format('text/plain')
+
+
+class TestIterRows:
+    
+    def test_csv_rows(self):
+        body = 'name,price\nLamp,10\n"Mug, large",4.5\nBroken,1,extra\n'
+        rows = list(iter_rows(body, 'csv'))
+        
+        assert [number for number, _ in rows] == [1, 2, 3]
+        assert rows[1][1] == {'name': 'Mug, large', 'price': '4.5'}
+        assert isinstance(rows[2][1], ImportRowError)
+    
+    def test_ndjson_skips_blank_lines_and_reports_bad_rows(self):
+        body = '{"name": "Lamp"}\n\n not json\n[1, 2]\n'
+        rows = list(iter_rows(body, 'ndjson'))
+        
+        assert rows[0] == (1, {'name': 'Lamp'})
+        assert [number for number, _ in rows] == [1, 2, 3]
+        assert all(isinstance(row, ImportRowError) for _, row in rows[1:])
+
+
+class TestProductFields:
+    
+    def test_valid_row(self):
+        fields = product_fields({'name': ' Lamp ', 'price': '10.499', 'imageUrl': 'https://x/lamp.png'})
+        assert fields['name'] == 'Lamp'
+        assert fields['price'] == 10.5
+        assert fields['image'] == 'https://x/lamp.png'
+    
+    @pytest.mark.parametrize('row', [
+        {'price': '1'},
+        {'name': 'Lamp', 'price': 'cheap'},
+        {'name': 'Lamp', 'price': '-1'},
+        {'name': 'Lamp', 'price': 'nan'},
+        {'name': 'x' * 201},
+    ])
+    def test_invalid_rows(self, row):
+        with pytest.raises(ImportRowError):
+            product_fields(row)
+
+
+class TestParseTags:
+    
+    def test_normalizes_analysis_labels(self):
+        tags = parse_tags([
+            {'name': 'Cup', 'confidence': 91.234},
+            {'name': 'cup', 'confidence': 97.0},
+            {'name': ' Pottery ', 'confidence': 80},
+            'handmade',
+        ])
+        assert tags == [{'name': 'handmade'}, {'name': 'cup', 'confidence': 97.0}, {'name': 'Pottery', 'confidence': 80.0}]
+        assert parse_tags('Mug, kitchen,') == [{'name': 'kitchen'}, {'name': 'Mug'}]
+        assert parse_tags(None) == []
+    
+    @pytest.mark.parametrize('value', [
+        {'name': 'Cup'},
+        [{'name': 'Cup', 'confidence': 120}],
+        [{'name': 'Cup', 'confidence': 'high'}],
+        [42],
+        [f'tag{i}' for i in range(21)],
+    ])
+    def test_invalid_tags(self, value):
+        with pytest.raises(ImportRowError):
+            parse_tags(value)
@@ -0,0 +1,218 @@
+import json
+import pytest
+import os
+from unittest.mock import patch, MagicMock
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+import orders_new
+import payment
+from catalog_index import CATALOG_MANIFEST_KEY
+from catalog_prices import (
+    PriceIndex, PriceMismatchError, PricingError,
+    clear_price_index_cache, load_price_index, price_order, to_cents
+)
+from tests.fake_s3 import FakeS3
+
+BUCKET = orders_new.S3_BUCKET
+
+CATALOG = [
+    {'id': 'mug', 'name': 'Mug', 'price': 4.99},
+    {'id': 'lamp', 'name': 'Lamp', 'price': '19.1'},
+    {'id': 'free', 'name': 'Sticker'},
+    {'id': 'zero', 'name': 'Mis-entered', 'price': 0.0},
+    {'id': 'broken', 'name': 'Broken', 'price': 'call us'},
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_price_index():
+    clear_price_index_cache()
+    yield
+    clear_price_index_cache()
+
+
+def store_catalog(s3, products=CATALOG, version=1):
+    s3.put_object(Bucket=BUCKET, Key=CATALOG_MANIFEST_KEY, Body=json.dumps({'version': version, 'products': products}))
+
+
+class TestToCents:
+
+    def test_exact_cents(self):
+        assert to_cents(4.99) == 499
+        assert to_cents('19.1') == 1910
+        assert to_cents(0.1 + 0.2) == 30
+        assert to_cents(2.675) == 268
+        assert to_cents(3) == 300
+
+    @pytest.mark.parametrize('value', [True, 'abc', -1, float('nan'), float('inf'), None])
+    def test_invalid(self, value):
+        with pytest.raises(PricingError):
+            to_cents(value)
+
+
+class TestPriceOrder:
+
+    def test_prices_from_index(self):
+        items, total = price_order(
+            [{'productId': 'mug', 'name': 'Mug', 'quantity': 3}, {'id': 'lamp', 'price': 19.10, 'quantity': 1}],
+            PriceIndex(CATALOG)
+        )
+
+        assert total == 3 * 499 + 1910
+        assert items[0] == {'productId': 'mug', 'name': 'Mug', 'quantity': 3, 'price': 4.99, 'total': 14.97, 'unitPriceCents': 499}
+        assert items[1]['productId'] == 'lamp'
+
+    def test_mismatches(self):
+        index = PriceIndex(CATALOG)
+
+        with pytest.raises(PriceMismatchError) as error:
+            price_order([{'productId': 'mug', 'price': 3.99, 'quantity': 2}], index)
+        assert error.value.total_cents == 998 and error.value.items[0]['price'] == 4.99
+        with pytest.raises(PriceMismatchError):
+            price_order([{'productId': 'mug', 'quantity': 2}], index, claimed_total=9.97)
+        assert price_order([{'productId': 'mug', 'quantity': 2}], index, claimed_total=9.98)[1] == 998
+
+    @pytest.mark.parametrize('items', [
+        [],
+        None,
+        [{'productId': 'nope'}],
+        [{'productId': 'broken'}],
+        [{'productId': 'free'}],
+        [{'productId': 'zero'}],
+        [{'productId': 'mug', 'quantity': 0}],
+        [{'productId': 'mug', 'quantity': 1.5}],
+        [{'productId': 'mug', 'quantity': 101}],
+        ['mug'],
+    ])
+    def test_invalid_orders(self, items):
+        with pytest.raises(PricingError) as error:
+            price_order(items, PriceIndex(CATALOG))
+        assert not isinstance(error.value, PriceMismatchError)
+
+
+class TestLoadPriceIndex:
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_cached_then_revalidated(self, s3):
+        """Within the TTL the index is reused; afterwards an unchanged manifest costs a 304"""
+        store_catalog(s3)
+
+        first = load_price_index(s3, BUCKET)
+        assert load_price_index(s3, BUCKET) is first
+        assert load_price_index(s3, BUCKET, max_age=0) is first
+        assert len(s3.calls_for('GetObject')) == 2
+
+        store_catalog(s3, [{'id': 'mug', 'price': 5.49}], version=2)
+        updated = load_price_index(s3, BUCKET, max_age=0)
+        assert updated.version == 2 and updated.get('mug') == 549 and updated.get('lamp') is None
+
+
+def order_event(body):
+    return {'httpMethod': 'POST', 'path': '/orders', 'headers': {}, 'body': json.dumps(body)}
+
+
+class TestCreateOrderPricing:
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_order_uses_catalogue_prices(self, s3):
+        store_catalog(s3)
+
+        response = orders_new.lambda_handler(order_event({
+            'userId': 'u1',
+            'items': [{'productId': 'mug', 'name': 'Mug', 'price': 4.99, 'quantity': 2}],
+            'total': 9.98
+        }), {})
+
+        assert response['statusCode'] == 201
+        order = json.loads(response['body'])['order']
+        assert order['total'] == 9.98 and order['totalCents'] == 998
+        assert orders_new.get_orders_from_s3()[0]['items'][0]['unitPriceCents'] == 499
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_rejects_client_prices(self, s3):
+        """A tampered price or total is refused and nothing is saved"""
+        store_catalog(s3)
+
+        tampered = orders_new.lambda_handler(order_event({
+            'items': [{'productId': 'mug', 'price': 0.01, 'quantity': 2}], 'total': 0.02
+        }), {})
+        wrong_total = orders_new.lambda_handler(order_event({
+            'items': [{'productId': 'mug', 'quantity': 2}], 'total': 1.00
+        }), {})
+        unknown = orders_new.lambda_handler(order_event({'items': [{'productId': 'gone', 'quantity': 1}]}), {})
+
+        assert tampered['statusCode'] == 409
+        assert json.loads(tampered['body'])['total'] == 9.98
+        assert wrong_total['statusCode'] == 409
+        assert unknown['statusCode'] == 400
+        assert orders_new.get_orders_from_s3() == []
+
+
+class TestPaymentIntentPricing:
+
+    def create_intent(self, amount, order_details, **fields):
+        event = {
+            'httpMethod': 'POST',
+            'path': '/create-payment-intent',
+            'body': json.dumps({'amount': amount, 'customerEmail': 'a@example.com', 'orderDetails': order_details, **fields})
+        }
+        response = payment.lambda_handler(event, {})
+        return response['statusCode'], json.loads(response['body'])
+
+    @pytest.fixture
+    def stripe(self):
+        stripe = MagicMock()
+        stripe.api_key = 'sk_test_' + 'x' * 24
+        stripe.error.StripeError = type('StripeError', (Exception,), {})
+        stripe.PaymentIntent.create.return_value = MagicMock(id='pi_1', client_secret='secret')
+        with patch('payment.stripe', stripe):
+            yield stripe
+
+    @patch('payment.s3_client', new_callable=FakeS3)
+    def test_charges_catalogue_amount(self, s3, stripe):
+        store_catalog(s3)
+        items = [{'productId': 'mug', 'price': 4.99, 'quantity': 2}]
+
+        status, _ = self.create_intent(998 + 500, {'items': items, 'shippingOption': {'id': 'express-shipping'}})
+
+        assert status == 200
+        assert stripe.PaymentIntent.create.call_args.kwargs['amount'] == 1498
+
+    @patch('payment.s3_client', new_callable=FakeS3)
+    def test_rejects_client_amount(self, s3, stripe):
+        store_catalog(s3)
+        items = [{'productId': 'mug', 'quantity': 2}]
+
+        assert self.create_intent(1, {'items': items}) == (409, {'error': 'Amount does not match the order total', 'amount': 998})
+        assert self.create_intent(998, {})[0] == 400
+        assert self.create_intent(998, {'items': items, 'shippingOption': {'id': 'teleport'}})[0] == 400
+        stripe.PaymentIntent.create.assert_not_called()
+
+    @patch('payment.s3_client', new_callable=FakeS3)
+    def test_rejects_other_currencies(self, s3, stripe):
+        store_catalog(s3)
+
+        assert self.create_intent(998, {'items': [{'productId': 'mug', 'quantity': 2}]}, currency='eur')[0] == 400
+        stripe.PaymentIntent.create.assert_not_called()
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_confirm_checks_the_intent_against_the_order(self, s3, stripe):
+        store_catalog(s3)
+        order = json.loads(orders_new.lambda_handler(order_event({
+            'userId': 'u1', 'items': [{'productId': 'mug', 'quantity': 2}]
+        }), {})['body'])['order']
+        stripe.PaymentIntent.retrieve.return_value = MagicMock(
+            id='pi_1', status='succeeded', currency='usd', amount_received=998, metadata={'order_id': 'order_other'}
+        )
+
+        response = payment.lambda_handler({
+            'httpMethod': 'POST',
+            'path': '/confirm-payment',
+            'body': json.dumps({'paymentIntentId': 'pi_1', 'orderDetails': {'orderId': order['id']}})
+        }, {})
+
+        assert response['statusCode'] == 409
+        assert orders_new.get_orders_from_s3()[0]['status'] == 'pending'
@@ -0,0 +1,68 @@
+import os
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+from cdn_invalidation import InvalidationBatcher, coalesce_paths
+from tests.fake_cloudfront import RecordingCloudFront
+
+
+class TestCoalescePaths:
+    
+    def test_crowded_directories_become_wildcards(self):
+        items = {f'/items/{i}.json' for i in range(5)}
+        
+        assert coalesce_paths(items | {'/manifest.json'}, threshold=3) == ['/items/*', '/manifest.json']
+        assert coalesce_paths(items, threshold=5) == sorted(items)
+    
+    def test_paths_under_a_wildcard_are_dropped(self):
+        paths = {'/a/1', '/a/2', '/a/3', '/a/b/1'}
+        assert coalesce_paths(paths, threshold=2) == ['/a/*']
+
+
+class TestInvalidationBatcher:
+    
+    def test_flush_submits_one_batch_and_clears(self):
+        cloudfront = RecordingCloudFront()
+        batcher = InvalidationBatcher('DIST', client=cloudfront, path_prefix='/')
+        batcher.add('products/catalog/manifest.json', '/products/a.json', None)
+        batcher.add('products/catalog/manifest.json')
+        
+        assert batcher.flush() == ['I1']
+        assert cloudfront.paths() == ['/products/a.json', '/products/catalog/manifest.json']
+        assert batcher.flush() == []
+    
+    def test_reference_identifies_the_change(self):
+        """Retrying one change is collapsed; a later change to the same paths is not"""
+        cloudfront = RecordingCloudFront()
+        first = InvalidationBatcher('DIST', client=cloudfront)
+        second = InvalidationBatcher('DIST', client=cloudfront)
+        for batcher, reference in ((first, 'v2'), (second, 'v2'), (first, 'v3'), (second, None)):
+            batcher.add('products/catalog/manifest.json')
+            batcher.flush(reference)
+        
+        assert len(cloudfront.requests) == 4
+        assert len(cloudfront.invalidations) == 3
+    
+    def test_keys_are_percent_encoded(self):
+        cloudfront = RecordingCloudFront()
+        batcher = InvalidationBatcher('DIST', client=cloudfront)
+        batcher.add('products/a/summer lamp (1).png')
+        batcher.flush()
+        
+        assert cloudfront.paths() == ['/products/a/summer%20lamp%20%281%29.png']
+    
+    def test_failed_flush_keeps_paths_pending(self):
+        batcher = InvalidationBatcher('DIST', client=RecordingCloudFront(fail=True))
+        batcher.add('products/catalog/manifest.json')
+        
+        assert batcher.flush() == []
+        assert batcher.pending == {'/products/catalog/manifest.json'}
+    
+    def test_disabled_without_distribution(self):
+        cloudfront = RecordingCloudFront()
+        batcher = InvalidationBatcher('', client=cloudfront)
+        batcher.add('products/catalog/manifest.json')
+        
+        assert batcher.flush() == [] and cloudfront.requests == []
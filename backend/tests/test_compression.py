@@ -0,0 +1,75 @@
+import base64
+import gzip
+import json
+import os
+from unittest.mock import patch
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+import compression
+from compression import accepted_encodings, compress, compress_response, negotiate_encoding
+
+
+class TestNegotiation:
+    
+    def test_accepted_encodings_respects_q_values(self):
+        assert accepted_encodings('gzip;q=0.5, br;q=0, Deflate') == {'gzip', 'deflate'}
+        assert accepted_encodings(None) == set()
+    
+    @patch('compression.brotli', None)
+    def test_gzip_without_brotli(self):
+        assert negotiate_encoding('gzip, deflate, br') == 'gzip'
+        assert negotiate_encoding('br') is None
+        assert negotiate_encoding('*') == 'gzip'
+        assert negotiate_encoding('identity') is None
+    
+    def test_compress_gzip_is_deterministic(self):
+        first = compress('{"a": 1}', 'gzip')
+        assert first == compress(b'{"a": 1}', 'gzip')
+        assert gzip.decompress(first) == b'{"a": 1}'
+
+
+class TestCompressResponse:
+    
+    EVENT = {
+        'httpMethod': 'GET',
+        'resource': '/orders',
+        'headers': {'accept': 'application/vnd.lplivings+json, application/json', 'Accept-Encoding': 'gzip'},
+    }
+    BODY = json.dumps([{'id': i, 'status': 'pending', 'items': []} for i in range(100)])
+    
+    def setup_method(self):
+        compression.reset_compression_stats()
+    
+    @patch('compression.brotli', None)
+    def test_compresses_large_bodies_for_binary_clients(self, capsys):
+        response = compress_response(self.EVENT, {'statusCode': 200, 'headers': {'ETag': '"x"'}, 'body': self.BODY})
+        
+        assert response['isBase64Encoded'] is True
+        assert response['headers']['Content-Encoding'] == 'gzip'
+        assert response['headers']['Vary'] == 'Accept, Accept-Encoding'
+        assert gzip.decompress(base64.b64decode(response['body'])).decode('utf-8') == self.BODY
+        stats = compression.get_compression_stats()['GET /orders']
+        assert stats['responses'] == 1 and stats['bytesIn'] == len(self.BODY) and stats['ratio'] > 5
+        record = json.loads(capsys.readouterr().out)
+        assert (record['Route'], record['Encoding']) == ('GET /orders', 'gzip')
+        assert record['CompressionBytesIn'] == len(self.BODY) and record['CompressionRatio'] > 5
+        assert 'CompressionCpuMilliseconds' in record
+    
+    def test_leaves_other_responses_alone(self):
+        plain = {'statusCode': 200, 'headers': {'Vary': 'Origin'}, 'body': self.BODY}
+        json_client = dict(self.EVENT, headers={'Accept': 'application/json', 'Accept-Encoding': 'gzip'})
+        
+        for event, response in [
+            (json_client, plain),
+            (self.EVENT, dict(plain, body='{}')),
+            (dict(self.EVENT, headers={**self.EVENT['headers'], 'Accept-Encoding': 'identity'}), plain),
+            (self.EVENT, dict(plain, headers={'Content-Encoding': 'gzip'})),
+        ]:
+            result = compress_response(event, response)
+            assert 'isBase64Encoded' not in result
+            assert result['body'] == response['body']
+        assert compress_response(json_client, plain)['headers']['Vary'] == 'Origin, Accept-Encoding'
+        assert compression.get_compression_stats() == {}
@@ -0,0 +1,66 @@
+import pytest
+import os
+from unittest.mock import patch
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+from facets import FacetIndex
+
+CATALOGUE = [
+    {'id': 'a', 'category': 'Kitchen', 'price': 10.0},
+    {'id': 'b', 'category': 'kitchen', 'price': 20.0},
+    {'id': 'c', 'category': 'Books', 'price': 30.0},
+    {'id': 'd', 'category': 'Kitchen', 'price': 40.0},
+    {'id': 'e', 'category': '', 'price': 50.0},
+]
+
+
+@pytest.fixture(params=['numpy', 'pure-python'])
+def numpy_mode(request):
+    """Run each test with NumPy and with the pure-Python fallback"""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+        yield
+    else:
+        with patch('facets.np', None):
+            yield
+
+
+class TestFacetIndex:
+    
+    def test_summary(self, numpy_mode):
+        """Counts, percentiles and histogram over the whole catalogue"""
+        summary = FacetIndex.build(CATALOGUE, 1).summary(buckets=4)
+        
+        assert summary['total'] == 5
+        assert summary['categories'] == [
+            {'name': 'Kitchen', 'count': 3},
+            {'name': 'Books', 'count': 1},
+            {'name': 'Uncategorized', 'count': 1},
+        ]
+        assert summary['price'] == {'min': 10.0, 'max': 50.0, 'p25': 20.0, 'p50': 30.0, 'p75': 40.0, 'p90': 46.0}
+        assert [bucket['count'] for bucket in summary['histogram']] == [1, 1, 1, 2]
+        assert summary['histogram'][0] == {'min': 10.0, 'max': 20.0, 'count': 1}
+    
+    def test_category_summary(self, numpy_mode):
+        """A category filter narrows prices but keeps catalogue-wide counts"""
+        summary = FacetIndex.build(CATALOGUE, 1).summary(category='KITCHEN', buckets=3)
+        
+        assert summary['total'] == 3
+        assert summary['price']['min'] == 10.0
+        assert summary['price']['max'] == 40.0
+        assert sum(bucket['count'] for bucket in summary['histogram']) == 3
+        assert FacetIndex.build(CATALOGUE, 1).summary(category='Garden')['price'] is None
+    
+    def test_incremental_changes_match_rebuild(self, numpy_mode):
+        """Swap-removal and appends give the same summary as a rebuild"""
+        index = FacetIndex.build(CATALOGUE, 1)
+        index.summary()
+        
+        index.apply_changes([{'id': 'f', 'category': 'Books', 'price': 15.0}, dict(CATALOGUE[3], price=5.0)], ['a', 'c'], 2)
+        
+        remaining = [dict(CATALOGUE[3], price=5.0), CATALOGUE[1], CATALOGUE[4], {'id': 'f', 'category': 'Books', 'price': 15.0}]
+        assert index.summary() == FacetIndex.build(remaining, 2).summary()
+        assert index.summary()['price']['min'] == 5.0
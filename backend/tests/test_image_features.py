@@ -0,0 +1,98 @@
+import io
+import pytest
+import os
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+np = pytest.importorskip('numpy')
+Image = pytest.importorskip('PIL.Image')
+
+from image_features import DIMENSIONS, FeatureMatrix, describe_image
+
+
+def image_bytes(color, stripe=None, size=(120, 90), image_format='PNG'):
+    """Shaded image in a base colour, optionally with a block of another colour"""
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    # A smooth 2-D pattern gives the perceptual hash some structure to capture
+    shading = 0.75 + 0.25 * np.sin(x / width * 5) * np.cos(y / height * 3)
+    pixels = np.clip(np.array(color)[None, None, :] * shading[..., None], 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels, 'RGB')
+    if stripe:
+        image.paste(stripe, (width // 3, height // 4, width // 2, height * 3 // 4))
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class TestDescribeImage:
+
+    def test_unit_length_float32(self):
+        vector = describe_image(image_bytes((200, 30, 30), stripe=(20, 20, 200)))
+
+        assert vector.dtype == np.float32 and vector.shape == (DIMENSIONS,)
+        assert abs(float(np.linalg.norm(vector)) - 1.0) < 1e-5
+
+    def test_similar_images_score_higher(self):
+        red = describe_image(image_bytes((200, 30, 30), stripe=(20, 20, 200)))
+        red_jpeg = describe_image(image_bytes((205, 35, 25), stripe=(25, 20, 190), size=(300, 200), image_format='JPEG'))
+        green = describe_image(image_bytes((30, 200, 30)))
+
+        assert float(red @ red_jpeg) > 0.9
+        assert float(red @ red_jpeg) > float(red @ green)
+
+
+class TestFeatureMatrix:
+
+    def build(self):
+        vectors = {
+            'red': describe_image(image_bytes((200, 30, 30))),
+            'dark-red': describe_image(image_bytes((180, 20, 20))),
+            'green': describe_image(image_bytes((30, 200, 30))),
+            'blue': describe_image(image_bytes((30, 30, 200), stripe=(250, 250, 250))),
+        }
+        entries = [(product_id, f'products/images/{product_id}.png') for product_id in vectors]
+        return FeatureMatrix().refresh(entries, lambda key: vectors[key.split('/')[-1][:-4]])
+
+    def test_nearest(self):
+        features = self.build()
+
+        matches = features.nearest('red', limit=2)
+
+        assert [product_id for product_id, _ in matches][0] == 'dark-red'
+        assert len(matches) == 2 and matches[0][1] >= matches[1][1]
+        assert [product_id for product_id, _ in features.nearest('red', limit=10)][0] == 'dark-red'
+        assert len(features.nearest('red', limit=10)) == 3
+        assert features.nearest('unknown') == []
+
+    def test_round_trip_is_a_view(self):
+        features = self.build()
+
+        loaded = FeatureMatrix.from_bytes(features.to_bytes())
+
+        assert loaded.rows == features.rows
+        assert np.array_equal(loaded.matrix, features.matrix)
+        assert not loaded.matrix.flags.owndata
+        assert loaded.nearest('green') == features.nearest('green')
+        with pytest.raises(ValueError):
+            FeatureMatrix.from_bytes(features.to_bytes()[:-4])
+
+    def test_refresh_only_describes_changed_images(self):
+        features = self.build()
+        described = []
+
+        def describe(key):
+            described.append(key)
+            return None if 'broken' in key else features.matrix[0]
+
+        refreshed = features.refresh([
+            ('red', 'products/images/red.png'),
+            ('green', 'products/images/green-v2.png'),
+            ('new', 'products/images/broken.png'),
+        ], describe)
+
+        assert described == ['products/images/green-v2.png', 'products/images/broken.png']
+        assert [product_id for product_id, _ in refreshed.rows] == ['red', 'green']
+        assert refreshed.matrix.flags.c_contiguous
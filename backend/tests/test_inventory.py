@@ -0,0 +1,331 @@
+import json
+import pytest
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+import inventory
+import orders_new
+from catalog_index import CATALOG_MANIFEST_KEY
+from catalog_prices import CURRENCY, clear_price_index_cache
+from inventory import (
+    OutOfStockError, ReservationError, commit_reservation, get_stock,
+    release_reservation, reserve, set_stock
+)
+from s3_store import ConflictError
+from tests.fake_s3 import FakeS3
+
+BUCKET = orders_new.S3_BUCKET
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay():
+    inventory.reset_inventory_stats()
+    clear_price_index_cache()
+    with patch('inventory.RETRY_BASE_DELAY', 0), patch('s3_store.RETRY_BASE_DELAY', 0):
+        yield
+
+
+class TestReservations:
+
+    def test_reserve_commit(self):
+        s3 = FakeS3()
+        set_stock(s3, BUCKET, 'mug', 10)
+
+        reservation = reserve(s3, BUCKET, [('mug', 2), ('mug', 1)])
+
+        assert sum(quantity for _, quantity in reservation['items']['mug']) == 3
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 7, 'held': 3, 'sold': 0}
+        assert commit_reservation(s3, BUCKET, reservation['id'])['state'] == 'committed'
+        assert commit_reservation(s3, BUCKET, reservation['id'])['state'] == 'committed'
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 7, 'held': 0, 'sold': 3}
+        assert release_reservation(s3, BUCKET, reservation['id'])['state'] == 'committed'
+        assert get_stock(s3, BUCKET, 'mug')['sold'] == 3
+
+    def test_release_restocks(self):
+        s3 = FakeS3()
+        set_stock(s3, BUCKET, 'mug', 5)
+        reservation = reserve(s3, BUCKET, [('mug', 5)])
+
+        assert release_reservation(s3, BUCKET, reservation['id'])['state'] == 'released'
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 5, 'held': 0, 'sold': 0}
+        with pytest.raises(ReservationError):
+            commit_reservation(s3, BUCKET, reservation['id'])
+        with pytest.raises(ReservationError):
+            commit_reservation(s3, BUCKET, 'missing')
+
+    def test_out_of_stock_holds_nothing(self):
+        """A reservation that cannot be filled gives back what it already took"""
+        s3 = FakeS3()
+        set_stock(s3, BUCKET, 'mug', 10)
+        set_stock(s3, BUCKET, 'lamp', 1)
+
+        with pytest.raises(OutOfStockError) as error:
+            reserve(s3, BUCKET, [('mug', 4), ('lamp', 2)])
+
+        assert (error.value.product_id, error.value.requested, error.value.available) == ('lamp', 2, 1)
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 10, 'held': 0, 'sold': 0}
+        assert get_stock(s3, BUCKET, 'lamp') == {'available': 1, 'held': 0, 'sold': 0}
+        assert s3.calls_for('PutObject')[-1].startswith('inventory/items/')
+
+    def test_untracked_products(self):
+        s3 = FakeS3()
+        set_stock(s3, BUCKET, 'mug', 2)
+
+        assert reserve(s3, BUCKET, [('poster', 100)]) is None
+        assert get_stock(s3, BUCKET, 'poster') is None
+        assert list(reserve(s3, BUCKET, [('poster', 100), ('mug', 2)])['items']) == ['mug']
+
+    def test_expired_holds_are_reclaimed(self):
+        s3 = FakeS3()
+        set_stock(s3, BUCKET, 'mug', 3)
+        abandoned = reserve(s3, BUCKET, [('mug', 3)], ttl=-1)
+
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 3, 'held': 0, 'sold': 0}
+        assert reserve(s3, BUCKET, [('mug', 3)]) is not None
+        with pytest.raises(OutOfStockError):
+            commit_reservation(s3, BUCKET, abandoned['id'])
+
+    def test_late_commit_retakes_stock(self):
+        """Paying after the hold expired still sells the units if they are free"""
+        s3 = FakeS3()
+        set_stock(s3, BUCKET, 'mug', 4)
+        late = reserve(s3, BUCKET, [('mug', 3)], ttl=-1)
+
+        assert commit_reservation(s3, BUCKET, late['id'])['state'] == 'committed'
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 1, 'held': 0, 'sold': 3}
+
+    def test_set_stock_keeps_holds(self):
+        s3 = FakeS3()
+        set_stock(s3, BUCKET, 'mug', 20)
+        reserve(s3, BUCKET, [('mug', 5)])
+
+        set_stock(s3, BUCKET, 'mug', 3)
+
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 3, 'held': 5, 'sold': 0}
+
+    def test_concurrent_checkouts_never_oversell(self):
+        s3 = FakeS3()
+        set_stock(s3, BUCKET, 'hot', 40)
+        outcomes = []
+
+        def checkout(_):
+            try:
+                outcomes.append(reserve(s3, BUCKET, [('hot', 1)]))
+            except (OutOfStockError, ConflictError) as e:
+                outcomes.append(e)
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(checkout, range(60)))
+
+        reserved = [outcome for outcome in outcomes if isinstance(outcome, dict)]
+        stock = get_stock(s3, BUCKET, 'hot')
+        assert len(outcomes) == 60
+        assert len(reserved) <= 40 and stock['held'] == len(reserved)
+        assert stock['available'] + stock['held'] == 40
+        assert inventory.get_inventory_stats()['reservations'] == len(reserved)
+
+
+def order_event(items, **fields):
+    return {'httpMethod': 'POST', 'path': '/orders', 'headers': {}, 'body': json.dumps({
+        'userId': 'u1', 'items': items, **fields
+    })}
+
+
+def cancel_event(order_id, user_id='u1'):
+    return {
+        'httpMethod': 'PUT',
+        'path': f'/orders/{order_id}',
+        'pathParameters': {'id': order_id},
+        'headers': {},
+        'body': json.dumps({'status': 'cancelled', 'userId': user_id})
+    }
+
+
+def paid_intent(order, intent_id='pi_1', **fields):
+    """A succeeded Stripe PaymentIntent for order, as retrieved from Stripe"""
+    return SimpleNamespace(**{
+        'id': intent_id, 'status': 'succeeded', 'currency': CURRENCY,
+        'amount_received': order['totalCents'], 'metadata': {'order_id': order['id']}, **fields
+    })
+
+
+class TestOrderInventory:
+
+    def store_catalog(self, s3):
+        s3.put_object(Bucket=BUCKET, Key=CATALOG_MANIFEST_KEY, Body=json.dumps({
+            'version': 1, 'products': [{'id': 'mug', 'price': 4.99}, {'id': 'poster', 'price': 10}]
+        }))
+
+    def place_order(self, items):
+        response = orders_new.lambda_handler(order_event(items), {})
+        assert response['statusCode'] == 201
+        return json.loads(response['body'])['order']
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_order_holds_stock_until_paid(self, s3):
+        self.store_catalog(s3)
+        set_stock(s3, BUCKET, 'mug', 2)
+
+        response = orders_new.lambda_handler(order_event([{'productId': 'mug', 'quantity': 2}]), {})
+        sold_out = orders_new.lambda_handler(order_event([{'productId': 'mug', 'quantity': 1}]), {})
+
+        assert response['statusCode'] == 201
+        order = json.loads(response['body'])['order']
+        assert order['reservationId']
+        assert sold_out['statusCode'] == 409
+        assert json.loads(sold_out['body'])['productId'] == 'mug'
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 0, 'held': 2, 'sold': 0}
+
+        paid = orders_new.mark_order_paid(order['id'], paid_intent(order))
+
+        assert paid['status'] == 'processing' and paid['paymentIntentId'] == 'pi_1'
+        assert 'inventoryError' not in paid
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 0, 'held': 0, 'sold': 2}
+        assert orders_new.mark_order_paid(order['id'], paid_intent(order))['status'] == 'processing'
+        assert orders_new.mark_order_paid('missing', paid_intent({**order, 'id': 'missing'}, 'pi_2')) is None
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_client_cannot_choose_status(self, s3):
+        self.store_catalog(s3)
+        set_stock(s3, BUCKET, 'mug', 2)
+
+        response = orders_new.lambda_handler(order_event(
+            [{'productId': 'mug', 'quantity': 1}], status='processing', paymentIntentId='pi_other'
+        ), {})
+
+        order = json.loads(response['body'])['order']
+        assert (order['status'], order['paymentIntentId']) == ('pending', '')
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 1, 'held': 1, 'sold': 0}
+
+    @pytest.mark.parametrize('fields', [
+        {'status': 'requires_payment_method'},
+        {'metadata': {'order_id': 'order_other'}},
+        {'metadata': {}},
+        {'amount_received': 1},
+        {'currency': 'eur'},
+    ])
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_payment_must_cover_the_order(self, s3, fields):
+        self.store_catalog(s3)
+        set_stock(s3, BUCKET, 'mug', 2)
+        order = self.place_order([{'productId': 'mug', 'quantity': 2}])
+
+        with pytest.raises(orders_new.PaymentError):
+            orders_new.mark_order_paid(order['id'], paid_intent(order, **fields))
+
+        assert orders_new.get_orders_from_s3()[0]['status'] == 'pending'
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 0, 'held': 2, 'sold': 0}
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_payment_pays_for_one_order(self, s3):
+        self.store_catalog(s3)
+        first = self.place_order([{'productId': 'poster', 'quantity': 1}])
+        second = self.place_order([{'productId': 'poster', 'quantity': 1}])
+        orders_new.mark_order_paid(first['id'], paid_intent(first))
+
+        with pytest.raises(orders_new.PaymentError):
+            orders_new.mark_order_paid(second['id'], paid_intent(second))
+        with pytest.raises(orders_new.PaymentError):
+            orders_new.mark_order_paid(first['id'], paid_intent(first, 'pi_2'))
+
+        assert {order['id']: order['status'] for order in orders_new.get_orders_from_s3()} == {
+            first['id']: 'processing', second['id']: 'pending'
+        }
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_cancelling_releases_stock(self, s3):
+        self.store_catalog(s3)
+        set_stock(s3, BUCKET, 'mug', 2)
+        order = json.loads(orders_new.lambda_handler(order_event([{'productId': 'mug', 'quantity': 1}]), {})['body'])
+
+        response = orders_new.lambda_handler({
+            'httpMethod': 'PUT',
+            'path': f"/orders/{order['id']}",
+            'pathParameters': {'id': order['id']},
+            'queryStringParameters': {'admin': 'true'},
+            'headers': {},
+            'body': json.dumps({'status': 'cancelled'})
+        }, {})
+
+        assert response['statusCode'] == 200
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 2, 'held': 0, 'sold': 0}
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_owner_cancels_pending_order(self, s3):
+        self.store_catalog(s3)
+        set_stock(s3, BUCKET, 'mug', 2)
+        order = self.place_order([{'productId': 'mug', 'quantity': 1}])
+        paid = self.place_order([{'productId': 'mug', 'quantity': 1}])
+        orders_new.mark_order_paid(paid['id'], paid_intent(paid))
+
+        assert orders_new.lambda_handler(cancel_event(order['id'], 'u2'), {})['statusCode'] == 404
+        assert orders_new.lambda_handler({**cancel_event(order['id']), 'body': json.dumps({
+            'status': 'shipped', 'userId': 'u1'
+        })}, {})['statusCode'] == 403
+        assert orders_new.lambda_handler(cancel_event(paid['id']), {})['statusCode'] == 409
+        assert orders_new.lambda_handler(cancel_event(order['id']), {})['statusCode'] == 200
+
+        statuses = {order['id']: order['status'] for order in orders_new.get_orders_from_s3()}
+        assert statuses == {order['id']: 'cancelled', paid['id']: 'processing'}
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 1, 'held': 0, 'sold': 1}
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_unpaid_orders_expire(self, s3):
+        self.store_catalog(s3)
+        set_stock(s3, BUCKET, 'mug', 3)
+        paid = self.place_order([{'productId': 'mug', 'quantity': 1}])
+        orders_new.mark_order_paid(paid['id'], paid_intent(paid))
+        abandoned = self.place_order([{'productId': 'mug', 'quantity': 2}])
+
+        assert orders_new.expire_pending_orders({}, None) == {'expired': []}
+        with patch('orders_new.PENDING_ORDER_TTL', -1):
+            assert orders_new.expire_pending_orders({}, None) == {'expired': [abandoned['id']]}
+
+        assert [order['status'] for order in orders_new.get_orders_from_s3()] == ['processing', 'cancelled']
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 2, 'held': 0, 'sold': 1}
+        with pytest.raises(orders_new.PaymentError):
+            orders_new.mark_order_paid(abandoned['id'], paid_intent(abandoned))
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_untracked_products_are_not_limited(self, s3):
+        self.store_catalog(s3)
+
+        response = orders_new.lambda_handler(order_event([{'productId': 'poster', 'quantity': 50}]), {})
+
+        assert response['statusCode'] == 201
+        assert 'reservationId' not in json.loads(response['body'])['order']
+
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_failed_save_releases_stock(self, s3):
+        """An order that was never saved does not hold stock"""
+        self.store_catalog(s3)
+        set_stock(s3, BUCKET, 'mug', 2)
+        
+        with patch('orders_new.update_orders_in_s3', side_effect=ConflictError('busy')):
+            response = orders_new.lambda_handler(order_event([{'productId': 'mug', 'quantity': 2}]), {})
+        
+        assert response['statusCode'] == 409
+        assert get_stock(s3, BUCKET, 'mug') == {'available': 2, 'held': 0, 'sold': 0}
+    
+    @patch('orders_new.s3_client', new_callable=FakeS3)
+    def test_paid_order_sells_stock_after_saving(self, s3):
+        self.store_catalog(s3)
+        set_stock(s3, BUCKET, 'mug', 2)
+        order = self.place_order([{'productId': 'mug', 'quantity': 1}])
+        flagged = self.place_order([{'productId': 'mug', 'quantity': 1}])
+        
+        orders_new.mark_order_paid(order['id'], paid_intent(order))
+        with patch('orders_new.commit_reservation', side_effect=ReservationError('gone')):
+            assert orders_new.mark_order_paid(flagged['id'], paid_intent(flagged, 'pi_2'))['inventoryError'] == 'gone'
+        
+        stored = {order['id']: order for order in orders_new.get_orders_from_s3()}
+        assert 'inventoryError' not in stored[order['id']]
+        assert stored[flagged['id']]['status'] == 'processing'
+        assert stored[flagged['id']]['inventoryError'] == 'gone'
+        assert get_stock(s3, BUCKET, 'mug')['sold'] == 1
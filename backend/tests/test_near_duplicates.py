@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+from near_duplicates import (
+    BANDS, add_to_buckets, band_keys, find_duplicates, minhash, rebuild_buckets, shard_key, shard_of, similarity
+)
+from tests.fake_s3 import FakeS3
+
+BUCKET = 'test-bucket'
+
+ORIGINAL = {
+    'id': 'a',
+    'name': 'Handmade Ceramic Coffee Mug',
+    'description': 'Wheel-thrown stoneware mug with a speckled blue glaze, holds 350ml. Dishwasher safe.'
+}
+REPOST = {
+    'id': 'b',
+    'name': 'Handmade ceramic coffee mug!',
+    'description': 'Wheel-thrown stoneware mug with a speckled blue glaze, holds 350 ml. Dishwasher-safe.'
+}
+DIFFERENT = {
+    'id': 'c',
+    'name': 'Wireless Headphones',
+    'description': 'Over-ear bluetooth headphones with active noise cancelling and 30 hour battery.'
+}
+
+
+class TestMinHash:
+    
+    def test_signatures_are_deterministic(self):
+        assert minhash(ORIGINAL) == minhash(dict(ORIGINAL))
+        assert minhash({'id': 'x', 'name': ''}) is None
+    
+    def test_similarity_tracks_overlap(self):
+        assert similarity(minhash(ORIGINAL), minhash(REPOST)) > 0.8
+        assert similarity(minhash(ORIGINAL), minhash(DIFFERENT)) < 0.2
+
+
+class TestDuplicateBuckets:
+    
+    def load(self, *products):
+        by_id = {product['id']: product for product in products}
+        return lambda ids: [by_id[product_id] for product_id in ids if product_id in by_id]
+    
+    def test_finds_reposts_only(self):
+        s3 = FakeS3()
+        add_to_buckets(s3, BUCKET, [ORIGINAL, DIFFERENT])
+        load = self.load(ORIGINAL, DIFFERENT)
+        
+        matches = find_duplicates(s3, BUCKET, dict(REPOST, id='new'), load)
+        
+        assert [match_id for match_id, _ in matches] == ['a']
+        assert find_duplicates(s3, BUCKET, dict(DIFFERENT, id='c', name='Something else entirely'), load) == []
+        assert find_duplicates(s3, BUCKET, ORIGINAL, load) == []
+    
+    def test_only_touched_shards_are_written(self):
+        s3 = FakeS3()
+        
+        add_to_buckets(s3, BUCKET, [ORIGINAL])
+        add_to_buckets(s3, BUCKET, [ORIGINAL])
+        
+        written = s3.calls_for('PutObject')
+        assert len(written) == len({shard_key(shard_of(key)) for key in band_keys(minhash(ORIGINAL))})
+        assert len(written) <= BANDS
+    
+    def test_gone_candidates_are_pruned(self):
+        s3 = FakeS3()
+        add_to_buckets(s3, BUCKET, [ORIGINAL])
+        
+        requested = []
+        def load(ids):
+            requested.append(list(ids))
+            return []
+        
+        assert find_duplicates(s3, BUCKET, REPOST, load) == []
+        assert find_duplicates(s3, BUCKET, REPOST, load) == []
+        
+        assert requested == [['a'], []]
+    
+    def test_rebuild_replaces_every_shard(self):
+        s3 = FakeS3()
+        add_to_buckets(s3, BUCKET, [ORIGINAL])
+        
+        rebuild_buckets(s3, BUCKET, [DIFFERENT])
+        
+        members = {product_id for _, key in list(s3.objects) for ids in json.loads(s3.body(BUCKET, key)).values()
+                   for product_id in ids}
+        assert members == {'c'}
@@ -1,3 +1,6 @@
+import base64
+import io
+import gzip
 import json
 import pytest
 import os
@@ -8,6 +11,24 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
 
 from products import lambda_handler, get_products, add_product
+import products
+from catalog_binary import BinaryCatalog
+from catalog_snapshots import POINTER_KEY, SNAPSHOT_PREFIX
+from near_duplicates import BANDS, BUCKET_PREFIX
+from cdn_invalidation import InvalidationBatcher
+from tests.fake_cloudfront import RecordingCloudFront
+from tests.fake_s3 import FakeS3
+
+BUCKET = products.S3_BUCKET
+
+
+@pytest.fixture(autouse=True)
+def fresh_catalog_cache(tmp_path, monkeypatch):
+    """Each test starts with a cold container"""
+    monkeypatch.setattr(products, 'BINARY_CATALOG_PATH', str(tmp_path / 'catalog.bin'))
+    products.clear_catalog_cache()
+    yield
+    products.clear_catalog_cache()
 
 
 class TestProductsHandler:
@@ -170,4 +191,1233 @@ class TestProductsHandler:
         
         assert response['statusCode'] == 500
         body = json.loads(response['body'])
-        assert 'error' in body
\ No newline at end of file
+        assert 'error' in body
+
+
+def admin_delete_event(product_id):
+    return {
+        'httpMethod': 'DELETE',
+        'headers': {},
+        'queryStringParameters': {'admin': 'true'},
+        'pathParameters': {'id': product_id},
+        'body': None
+    }
+
+
+def add_product_event(**fields):
+    return {
+        'httpMethod': 'POST',
+        'headers': {'content-type': 'application/json'},
+        'body': json.dumps(fields)
+    }
+
+
+class TestShardedCatalogue:
+    
+    def manifest(self, s3):
+        return json.loads(s3.body(BUCKET, products.CATALOG_MANIFEST_KEY))
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_add_product_writes_one_object_and_manifest(self, s3):
+        """Adding a product puts its own object plus the manifest only"""
+        lambda_handler(add_product_event(name='Lamp', price='10.50', category='Home'), {})
+        s3.calls.clear()
+        
+        response = lambda_handler(add_product_event(name='Mug', price='4', category='Kitchen'), {})
+        
+        assert response['statusCode'] == 201
+        product_id = json.loads(response['body'])['id']
+        # Derived documents (snapshots, binary and compressed listings, indexes) are left to the schedule;
+        # only the few duplicate-bucket shards of the new product's bands are written alongside
+        puts = s3.calls_for('PutObject')
+        assert [key for key in puts if not key.startswith(BUCKET_PREFIX)] == [products.product_key(product_id),
+                                                                              products.CATALOG_MANIFEST_KEY]
+        assert len(puts) <= 2 + BANDS
+        manifest = self.manifest(s3)
+        assert manifest['version'] == 2
+        assert [p['name'] for p in manifest['products']] == ['Lamp', 'Mug']
+        assert [p['version'] for p in manifest['products']] == [1, 2]
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_manifest_holds_listing_fields_only(self, s3):
+        lambda_handler(add_product_event(name='Lamp', price='10', description='Brass desk lamp', userId='u1'), {})
+        
+        entry = self.manifest(s3)['products'][0]
+        
+        assert set(entry) <= set(products.LISTING_FIELDS)
+        assert products.get_product_from_s3(entry['id'])['description'] == 'Brass desk lamp'
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_artifacts_refreshed_once_per_version(self, s3):
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        lambda_handler(add_product_event(name='Mug', price='4'), {})
+        
+        assert products.refresh_catalog_artifacts({}, None) == {'version': 2, 'rebuilt': ['duplicates'], 'failed': []}
+        s3.calls.clear()
+        products.refresh_catalog_artifacts({}, None)
+        
+        assert s3.calls_for('PutObject') == []
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_delete_product_removes_object(self, s3):
+        """Deleting a product drops it from the manifest and deletes its object"""
+        response = lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        product_id = json.loads(response['body'])['id']
+        
+        response = lambda_handler(admin_delete_event(product_id), {})
+        
+        assert response['statusCode'] == 200
+        assert self.manifest(s3)['products'] == []
+        assert (BUCKET, products.product_key(product_id)) not in s3.objects
+        assert lambda_handler(admin_delete_event(product_id), {})['statusCode'] == 404
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_legacy_catalogue_is_migrated(self, s3):
+        """An existing products.json is split into per-product objects on first read"""
+        legacy = [{'id': 'p1', 'name': 'Old', 'price': 1.0}, {'id': 'p2', 'name': 'Older', 'price': 2.0}]
+        s3.put_object(Bucket=BUCKET, Key=products.LEGACY_PRODUCTS_KEY, Body=json.dumps({'products': legacy}))
+        
+        assert products.get_products_from_s3() == legacy
+        assert json.loads(s3.body(BUCKET, products.product_key('p2'))) == legacy[1]
+        assert self.manifest(s3)['version'] == 1
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_failed_read_never_replaces_catalogue(self, s3):
+        """A catalogue read error fails the write instead of saving a one-product catalogue"""
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        before = s3.body(BUCKET, products.CATALOG_MANIFEST_KEY)
+        
+        with patch.object(s3, 'get_object', side_effect=RuntimeError('throttled')):
+            response = lambda_handler(add_product_event(name='Mug', price='4'), {})
+        
+        assert response['statusCode'] == 500
+        assert s3.body(BUCKET, products.CATALOG_MANIFEST_KEY) == before
+
+
+class TestCatalogueCache:
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_warm_reads_skip_s3_within_ttl(self, s3):
+        """Repeat reads inside the TTL are served from the container cache"""
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        s3.calls.clear()
+        
+        for _ in range(3):
+            assert lambda_handler({'httpMethod': 'GET'}, {})['statusCode'] == 200
+        
+        assert s3.calls == []
+    
+    @patch('products.CATALOG_CACHE_TTL', 0)
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_revalidates_with_etag_after_ttl(self, s3):
+        """After the TTL an unchanged manifest is revalidated, and a changed one reloaded"""
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        products.clear_catalog_cache()
+        products.get_products_from_s3()
+        
+        with patch.object(s3, 'get_object', wraps=s3.get_object) as get_object:
+            products.get_products_from_s3()
+            assert get_object.call_args.kwargs['IfNoneMatch'] == products.catalog_cache['etag']
+        
+        # Another container commits a change
+        manifest = json.loads(s3.body(BUCKET, products.CATALOG_MANIFEST_KEY))
+        manifest['products'].append({'id': 'p2', 'name': 'Mug'})
+        s3.put_object(Bucket=BUCKET, Key=products.CATALOG_MANIFEST_KEY, Body=json.dumps(manifest))
+        
+        assert [p['name'] for p in products.get_products_from_s3()] == ['Lamp', 'Mug']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_own_writes_are_visible_immediately(self, s3):
+        """A write updates this container's cache without waiting for the TTL"""
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        products.get_products_from_s3()
+        
+        lambda_handler(add_product_event(name='Mug', price='4'), {})
+        
+        assert [p['name'] for p in products.get_products_from_s3()] == ['Lamp', 'Mug']
+
+
+class TestConditionalGet:
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_get_products_returns_etag(self, s3):
+        """Listings carry a strong ETag derived from the catalogue version"""
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        
+        response = lambda_handler({'httpMethod': 'GET'}, {})
+        
+        assert response['statusCode'] == 200
+        assert response['headers']['ETag'] == '"catalog-v1"'
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_matching_if_none_match_returns_304(self, s3):
+        """A client holding the current version gets a bodyless 304"""
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        etag = lambda_handler({'httpMethod': 'GET'}, {})['headers']['ETag']
+        
+        response = lambda_handler({'httpMethod': 'GET', 'headers': {'if-none-match': f'W/{etag}'}}, {})
+        
+        assert response['statusCode'] == 304
+        assert response['body'] == ''
+        assert response['headers']['ETag'] == etag
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_stale_etag_gets_full_listing(self, s3):
+        """After a write the old ETag no longer matches"""
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        etag = lambda_handler({'httpMethod': 'GET'}, {})['headers']['ETag']
+        lambda_handler(add_product_event(name='Mug', price='4'), {})
+        
+        response = lambda_handler({'httpMethod': 'GET', 'headers': {'If-None-Match': etag}}, {})
+        
+        assert response['statusCode'] == 200
+        assert len(json.loads(response['body'])) == 2
+
+
+class TestPagination:
+    
+    def seed(self, s3, count):
+        catalogue = [
+            {'id': f'p{i:02d}', 'name': f'Product {i}', 'price': float(i), 'createdAt': f'2024-01-{i + 1:02d}T00:00:00'}
+            for i in range(count)
+        ]
+        products.commit_catalog_changes(upserts=catalogue)
+    
+    def get_page(self, **params):
+        response = lambda_handler({'httpMethod': 'GET', 'queryStringParameters': params}, {})
+        return response['statusCode'], json.loads(response['body'])
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_cursor_walks_whole_catalogue(self, s3):
+        """Following nextCursor visits every product once in createdAt order"""
+        self.seed(s3, 7)
+        
+        seen = []
+        status, page = self.get_page(limit='3')
+        while True:
+            assert status == 200
+            assert page['total'] == 7
+            seen.extend(p['id'] for p in page['products'])
+            if not page['nextCursor']:
+                break
+            status, page = self.get_page(limit='3', cursor=page['nextCursor'])
+        
+        assert seen == [f'p{i:02d}' for i in range(7)]
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_cursor_is_stable_across_inserts(self, s3):
+        """Products added before the cursor do not shift the next page"""
+        self.seed(s3, 4)
+        _, page = self.get_page(limit='2')
+        products.commit_catalog_changes(upserts=[{'id': 'early', 'name': 'Early', 'createdAt': '2023-12-31T00:00:00'}])
+        
+        _, next_page = self.get_page(limit='2', cursor=page['nextCursor'])
+        
+        assert [p['id'] for p in next_page['products']] == ['p02', 'p03']
+        assert next_page['total'] == 5
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_invalid_page_parameters(self, s3):
+        """Bad limits and tampered cursors are rejected"""
+        self.seed(s3, 2)
+        
+        assert self.get_page(limit='0')[0] == 400
+        assert self.get_page(limit='abc')[0] == 400
+        assert self.get_page(cursor='not-a-cursor')[0] == 400
+
+
+class TestListingFilters:
+    
+    CATALOGUE = [
+        {'id': 'a', 'name': 'Mug', 'category': 'Kitchen', 'price': 12.0, 'createdAt': '2024-01-01'},
+        {'id': 'b', 'name': 'Shirt', 'category': 'Clothing', 'price': 20.0, 'createdAt': '2024-01-02'},
+        {'id': 'c', 'name': 'Pan', 'category': 'kitchen', 'price': 35.0, 'createdAt': '2024-01-03'},
+        {'id': 'd', 'name': 'Bowl', 'category': 'Kitchen', 'price': 8.0, 'createdAt': '2024-01-04'},
+        {'id': 'e', 'name': 'Hat', 'category': 'Clothing', 'price': 15.0, 'createdAt': '2024-01-05'},
+    ]
+    
+    def query(self, **params):
+        response = lambda_handler({'httpMethod': 'GET', 'queryStringParameters': params}, {})
+        return response['statusCode'], json.loads(response['body'])
+    
+    def ids(self, **params):
+        return [p['id'] for p in self.query(**params)[1]['products']]
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_category_and_price_filters(self, s3):
+        """Category matches case-insensitively and price bounds are inclusive"""
+        products.commit_catalog_changes(upserts=self.CATALOGUE)
+        
+        assert self.ids(category='KITCHEN') == ['a', 'c', 'd']
+        assert self.ids(category='Kitchen', minPrice='10', maxPrice='35') == ['a', 'c']
+        assert self.ids(sort='price', maxPrice='15') == ['d', 'a', 'e']
+        assert self.query(category='Kitchen', sort='price', minPrice='9')[1]['total'] == 2
+        assert self.ids(category='Garden') == []
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_price_sort_pagination(self, s3):
+        """Cursors page through a price-sorted, filtered listing"""
+        products.commit_catalog_changes(upserts=self.CATALOGUE)
+        
+        _, first = self.query(sort='price', minPrice='10', limit='2')
+        _, second = self.query(sort='price', minPrice='10', limit='2', cursor=first['nextCursor'])
+        
+        assert [p['id'] for p in first['products']] == ['a', 'e']
+        assert [p['id'] for p in second['products']] == ['b', 'c']
+        assert second['nextCursor'] is None
+        assert self.query(sort='createdAt', cursor=first['nextCursor'])[0] == 400
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_index_updated_incrementally_on_writes(self, s3):
+        """Writes patch the warm index in place instead of rebuilding it"""
+        products.commit_catalog_changes(upserts=self.CATALOGUE)
+        self.ids(category='Kitchen')
+        index = products.derived_indexes['catalog']
+        
+        products.commit_catalog_changes(
+            upserts=[{'id': 'f', 'name': 'Kettle', 'category': 'Kitchen', 'price': 30.0, 'createdAt': '2024-01-06'}],
+            deletes=['a']
+        )
+        
+        assert self.ids(category='Kitchen', sort='price') == ['d', 'f', 'c']
+        assert products.derived_indexes['catalog'] is index
+        assert index.version == products.load_catalog()['version']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_invalid_filters(self, s3):
+        """Unknown sorts and non-numeric prices are rejected"""
+        products.commit_catalog_changes(upserts=self.CATALOGUE)
+        
+        assert self.query(sort='name')[0] == 400
+        assert self.query(minPrice='cheap')[0] == 400
+
+
+class TestSearchEndpoint:
+    
+    def search(self, **params):
+        event = {'httpMethod': 'GET', 'path': '/products/search', 'queryStringParameters': params}
+        response = lambda_handler(event, {})
+        return response['statusCode'], json.loads(response['body'])
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_search_uses_persisted_index_and_tracks_writes(self, s3):
+        """Search results follow writes, and the index is persisted next to the catalogue"""
+        products.commit_catalog_changes(upserts=[
+            {'id': 'mug', 'name': 'Coffee Mug', 'description': 'Ceramic', 'category': 'Kitchen'},
+            {'id': 'pot', 'name': 'Tea Pot', 'description': 'For tea', 'category': 'Kitchen'},
+        ])
+        
+        status, body = self.search(q='coffee')
+        assert status == 200
+        assert [p['id'] for p in body['products']] == ['mug']
+        
+        products.commit_catalog_changes(upserts=[{'id': 'beans', 'name': 'Coffee Beans', 'category': 'Grocery'}])
+        _, body = self.search(q='coffee')
+        assert {p['id'] for p in body['products']} == {'mug', 'beans'}
+        
+        products.refresh_catalog_artifacts({}, None)
+        persisted = json.loads(s3.body(BUCKET, products.SEARCH_INDEX_KEY))
+        assert persisted['version'] == products.load_catalog()['version']
+        
+        # A cold container loads the persisted index instead of re-tokenizing
+        products.clear_catalog_cache()
+        with patch('products.SearchIndex.build') as build:
+            _, body = self.search(q='beans')
+        assert not build.called
+        assert [p['id'] for p in body['products']] == ['beans']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_repeat_queries_hit_result_cache(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': 'mug', 'name': 'Coffee Mug'}])
+        self.search(q='Coffee')
+        
+        with patch('products.get_search_index') as get_search_index:
+            status, body = self.search(q='coffee ')
+        
+        assert status == 200
+        assert not get_search_index.called
+        assert body['total'] == 1
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_search_requires_query(self, s3):
+        assert self.search()[0] == 400
+
+
+class TestSuggestEndpoint:
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_warm_suggestions_do_not_touch_s3(self, s3):
+        """Warm containers answer typeahead from memory"""
+        products.commit_catalog_changes(upserts=[{'id': 'mug', 'name': 'Coffee Mug', 'category': 'Kitchen'}])
+        event = {'httpMethod': 'GET', 'path': '/products/suggest', 'queryStringParameters': {'prefix': 'cof'}}
+        lambda_handler(event, {})
+        s3.calls.clear()
+        
+        with patch('products.CATALOG_CACHE_TTL', 0):
+            response = lambda_handler(event, {})
+        
+        assert response['statusCode'] == 200
+        assert json.loads(response['body'])['suggestions'] == [{'text': 'Coffee Mug', 'type': 'product', 'id': 'mug'}]
+        assert s3.calls == []
+
+
+class TestFacetsEndpoint:
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_facets_follow_writes(self, s3):
+        """Facet counts reflect this container's writes without a rebuild"""
+        products.commit_catalog_changes(upserts=[
+            {'id': 'a', 'category': 'Kitchen', 'price': 10.0},
+            {'id': 'b', 'category': 'Books', 'price': 30.0},
+        ])
+        event = {'httpMethod': 'GET', 'path': '/products/facets', 'queryStringParameters': {'buckets': '2'}}
+        lambda_handler(event, {})
+        index = products.derived_indexes['facets']
+        
+        products.commit_catalog_changes(upserts=[{'id': 'c', 'category': 'Kitchen', 'price': 20.0}])
+        response = lambda_handler(event, {})
+        
+        body = json.loads(response['body'])
+        assert response['statusCode'] == 200
+        assert body['categories'][0] == {'name': 'Kitchen', 'count': 2}
+        assert body['price']['p50'] == 20.0
+        assert products.derived_indexes['facets'] is index
+        assert lambda_handler(dict(event, queryStringParameters={'buckets': '0'}), {})['statusCode'] == 400
+
+
+class TestGetProduct:
+    
+    def get(self, product_id, **headers):
+        return lambda_handler({'httpMethod': 'GET', 'path': f'/products/{product_id}',
+                               'pathParameters': {'id': product_id}, 'headers': headers}, {})
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_reads_only_the_product_object(self, s3):
+        """A detail lookup is one small read, not a catalogue download"""
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp'}, {'id': 'b', 'name': 'Mug'}])
+        products.clear_catalog_cache()
+        s3.calls.clear()
+        
+        response = self.get('b')
+        
+        assert response['statusCode'] == 200
+        assert json.loads(response['body']) == {'id': 'b', 'name': 'Mug'}
+        assert s3.calls == [('GetObject', products.product_key('b'))]
+        assert self.get('missing')['statusCode'] == 404
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_product_etag_revalidation(self, s3):
+        """Each product has its own ETag that changes only when that product changes"""
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp'}, {'id': 'b', 'name': 'Mug'}])
+        etag = self.get('a')['headers']['ETag']
+        
+        products.commit_catalog_changes(upserts=[{'id': 'b', 'name': 'Big Mug'}])
+        assert self.get('a', **{'If-None-Match': etag})['statusCode'] == 304
+        
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Desk Lamp'}])
+        response = self.get('a', **{'If-None-Match': etag})
+        assert response['statusCode'] == 200
+        assert response['headers']['ETag'] != etag
+        assert json.loads(response['body'])['name'] == 'Desk Lamp'
+
+
+class TestFieldProjection:
+    
+    PRODUCT = {'id': 'a', 'name': 'Lamp', 'description': 'A long description', 'price': 10.0,
+               'category': 'Home', 'image': 'img', 'userId': 'u1', 'createdAt': '2024-01-01'}
+    
+    def get(self, **params):
+        response = lambda_handler({'httpMethod': 'GET', 'queryStringParameters': params}, {})
+        return response['statusCode'], json.loads(response['body']), response['headers']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_projects_listing_and_pages(self, s3):
+        """Only the requested fields (plus id) are returned"""
+        products.commit_catalog_changes(upserts=[self.PRODUCT])
+        
+        status, body, headers = self.get(fields='name,price,image,category')
+        assert status == 200
+        assert body == [{'id': 'a', 'name': 'Lamp', 'price': 10.0, 'category': 'Home', 'image': 'img'}]
+        assert headers['ETag'] != self.get()[2]['ETag']
+        
+        _, page, _ = self.get(fields='name', limit='5')
+        assert page['products'] == [{'id': 'a', 'name': 'Lamp'}]
+        assert self.get(fields='name,secret')[0] == 400
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_projection_serialized_once_per_version(self, s3):
+        products.commit_catalog_changes(upserts=[self.PRODUCT])
+        self.get(fields='name')
+        
+        with patch('products.project') as project:
+            status, body, _ = self.get(fields='name')
+        
+        assert status == 200 and body == [{'id': 'a', 'name': 'Lamp'}]
+        assert not project.called
+        products.commit_catalog_changes(upserts=[dict(self.PRODUCT, name='Desk Lamp')])
+        assert self.get(fields='name')[1] == [{'id': 'a', 'name': 'Desk Lamp'}]
+
+
+class TestCatalogSnapshots:
+    
+    def pointer(self, s3):
+        return json.loads(s3.body(BUCKET, POINTER_KEY))
+    
+    def snapshot(self, s3, path):
+        return json.loads(s3.body(BUCKET, SNAPSHOT_PREFIX + path))
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_write_publishes_listing_and_category_slices(self, s3):
+        """Each catalogue write moves current.json to content-hashed snapshot files"""
+        lambda_handler(add_product_event(name='Lamp', price='10', category='Home'), {})
+        lambda_handler(add_product_event(name='Mug', price='4', category='Kitchen'), {})
+        assert (BUCKET, POINTER_KEY) not in s3.objects
+        products.refresh_catalog_artifacts({}, None)
+        
+        pointer = self.pointer(s3)
+        assert pointer['version'] == 2 and pointer['count'] == 2
+        assert [p['name'] for p in self.snapshot(s3, pointer['listing'])] == ['Lamp', 'Mug']
+        slices = {c['name']: self.snapshot(s3, c['file']) for c in pointer['categories']}
+        assert {name: [p['name'] for p in items] for name, items in slices.items()} == {'Home': ['Lamp'], 'Kitchen': ['Mug']}
+        assert s3.objects[(BUCKET, SNAPSHOT_PREFIX + pointer['listing'])]['CacheControl'].endswith('immutable')
+        assert 'max-age=' in s3.objects[(BUCKET, POINTER_KEY)]['CacheControl']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_unchanged_slices_are_not_reuploaded(self, s3):
+        lambda_handler(add_product_event(name='Lamp', price='10', category='Home'), {})
+        products.refresh_catalog_artifacts({}, None)
+        home = self.pointer(s3)['categories'][0]['file']
+        s3.calls.clear()
+        
+        lambda_handler(add_product_event(name='Mug', price='4', category='Kitchen'), {})
+        products.refresh_catalog_artifacts({}, None)
+        
+        pointer = self.pointer(s3)
+        uploaded = [key for key in s3.calls_for('PutObject') if key.startswith(SNAPSHOT_PREFIX)]
+        assert SNAPSHOT_PREFIX + home not in uploaded
+        assert SNAPSHOT_PREFIX + pointer['listing'] in uploaded
+        assert home in {c['file'] for c in pointer['categories']}
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_retired_files_deleted_after_grace_period(self, s3):
+        """Superseded files are kept for one publish, then deleted once past the grace period"""
+        with patch('catalog_snapshots.RETIRED_GRACE_SECONDS', 0):
+            lambda_handler(add_product_event(name='Lamp', price='10', category='Home'), {})
+            products.refresh_catalog_artifacts({}, None)
+            first = self.pointer(s3)['listing']
+            lambda_handler(add_product_event(name='Mug', price='4', category='Home'), {})
+            products.refresh_catalog_artifacts({}, None)
+            assert first in [r['file'] for r in self.pointer(s3)['retired']]
+            lambda_handler(add_product_event(name='Cup', price='3', category='Home'), {})
+            products.refresh_catalog_artifacts({}, None)
+        
+        assert (BUCKET, SNAPSHOT_PREFIX + first) not in s3.objects
+        listing = self.snapshot(s3, self.pointer(s3)['listing'])
+        assert [p['name'] for p in listing] == ['Lamp', 'Mug', 'Cup']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_pointer_never_moves_backwards(self, s3):
+        """A slow publisher for an older version leaves a newer pointer alone"""
+        manifest, _ = products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp', 'category': 'Home'}])
+        products.commit_catalog_changes(upserts=[{'id': 'b', 'name': 'Mug', 'category': 'Home'}])
+        products.refresh_catalog_artifacts({}, None)
+        
+        products.publish_catalog_snapshot(manifest)
+        
+        assert self.pointer(s3)['version'] == 2
+        # The losing publisher's uploads are retired, so the next publish past the grace period deletes them
+        orphans = [r['file'] for r in self.pointer(s3)['retired']]
+        assert orphans and all((BUCKET, SNAPSHOT_PREFIX + path) in s3.objects for path in orphans)
+        with patch('catalog_snapshots.RETIRED_GRACE_SECONDS', 0):
+            products.commit_catalog_changes(upserts=[{'id': 'c', 'name': 'Cup', 'category': 'Home'}])
+            products.refresh_catalog_artifacts({}, None)
+        assert not any((BUCKET, SNAPSHOT_PREFIX + path) in s3.objects for path in orphans)
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_publish_failure_is_retried_next_run(self, s3):
+        """A failed publish leaves the other artifacts current and is retried by the next run"""
+        lambda_handler(add_product_event(name='Lamp', price='10'), {})
+        with patch('products.publish_snapshot', side_effect=RuntimeError('boom')):
+            result = products.refresh_catalog_artifacts({}, None)
+        
+        assert result['failed'] == ['snapshot']
+        assert (BUCKET, POINTER_KEY) not in s3.objects
+        assert (BUCKET, products.CATALOG_BINARY_KEY) in s3.objects
+        assert products.refresh_catalog_artifacts({}, None)['failed'] == []
+        assert self.pointer(s3)['version'] == 1
+
+
+class TestDeltaSync:
+    
+    def sync(self, since, **params):
+        event = {'httpMethod': 'GET', 'queryStringParameters': {'since': str(since), **params}}
+        response = lambda_handler(event, {})
+        return response['statusCode'], json.loads(response['body'])
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_returns_changes_and_tombstones_since_version(self, s3):
+        """Only products changed after the client's version are returned"""
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp'}, {'id': 'b', 'name': 'Mug'}])
+        products.commit_catalog_changes(upserts=[{'id': 'c', 'name': 'Cup'}])
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Desk Lamp'}], deletes=['b'])
+        
+        status, body = self.sync(1)
+        
+        assert status == 200
+        assert body['version'] == 3 and not body['full']
+        assert [p['name'] for p in body['products']] == ['Desk Lamp', 'Cup']
+        assert body['deleted'] == ['b']
+        assert self.sync(3)[1]['products'] == [] and self.sync(3)[1]['deleted'] == []
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_full_listing_when_tombstones_compacted(self, s3):
+        with patch('products.TOMBSTONE_LIMIT', 2):
+            products.commit_catalog_changes(upserts=[{'id': i, 'name': i} for i in 'abcde'])
+            for product_id in 'abc':
+                products.commit_catalog_changes(deletes=[product_id])
+        
+        status, body = self.sync(1, fields='name')
+        
+        assert status == 200 and body['full']
+        assert body['products'] == [{'id': i, 'name': i} for i in 'de']
+        assert self.sync(2)[1]['deleted'] == ['b', 'c'] and not self.sync(2)[1]['full']
+        assert self.sync(9)[1]['full']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_manifest_keeps_no_per_commit_log(self, s3):
+        """Bulk upserts cost one version number per entry, not a logged list of IDs"""
+        products.commit_catalog_changes(upserts=[{'id': f'p{i}', 'name': str(i)} for i in range(50)])
+        products.commit_catalog_changes(upserts=[{'id': 'p1', 'name': 'One'}], deletes=['p2'])
+        
+        manifest = json.loads(s3.body(BUCKET, products.CATALOG_MANIFEST_KEY))
+        
+        assert set(manifest) == {'version', 'lastUpdated', 'products', 'deleted', 'deletesSince'}
+        assert manifest['deleted'] == {'p2': 2}
+        assert self.sync(1)[1]['products'] == [{'id': 'p1', 'name': 'One', 'version': 2}]
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_invalid_since(self, s3):
+        assert self.sync('yesterday')[0] == 400
+        assert self.sync(-1)[0] == 400
+
+
+def import_event(body, content_type='application/x-ndjson', admin=True):
+    return {
+        'httpMethod': 'POST',
+        'path': '/products/import',
+        'headers': {'Content-Type': content_type},
+        'queryStringParameters': {'admin': 'true'} if admin else None,
+        'body': body
+    }
+
+
+class TestBulkImport:
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_imports_valid_rows_in_one_commit(self, s3):
+        """All valid rows land in a single manifest write; bad rows are reported"""
+        body = 'name,price,category\nLamp,10,Home\n,5,Home\nMug,4.5,Kitchen\n'
+        
+        response = lambda_handler(import_event(body, 'text/csv'), {})
+        
+        assert response['statusCode'] == 201
+        result = json.loads(response['body'])
+        assert result['imported'] == 2 and result['failed'] == 1
+        assert result['results'][1] == {'row': 2, 'error': 'name is required'}
+        assert s3.calls_for('PutObject').count(products.CATALOG_MANIFEST_KEY) == 1
+        manifest = json.loads(s3.body(BUCKET, products.CATALOG_MANIFEST_KEY))
+        assert manifest['version'] == 1
+        assert [p['name'] for p in manifest['products']] == ['Lamp', 'Mug']
+        for row in (result['results'][0], result['results'][2]):
+            assert products.get_product_from_s3(row['id'])['id'] == row['id']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_rejects_non_admin_and_empty_imports(self, s3):
+        assert lambda_handler(import_event('{"name": "Lamp"}', admin=False), {})['statusCode'] == 403
+        assert lambda_handler(import_event('{"price": 1}'), {})['statusCode'] == 400
+        assert lambda_handler(import_event('name\nLamp', 'text/plain'), {})['statusCode'] == 415
+        assert (BUCKET, products.CATALOG_MANIFEST_KEY) not in s3.objects
+    
+    @patch('products.MAX_IMPORT_ROWS', 2)
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_too_many_rows(self, s3):
+        body = '\n'.join(json.dumps({'name': f'Item {i}'}) for i in range(3))
+        
+        assert lambda_handler(import_event(body), {})['statusCode'] == 413
+        assert (BUCKET, products.CATALOG_MANIFEST_KEY) not in s3.objects
+
+
+def admin_event(method, body, path='/products', product_id=None):
+    return {
+        'httpMethod': method,
+        'path': path,
+        'headers': {'Content-Type': 'application/json'},
+        'queryStringParameters': {'admin': 'true'},
+        'pathParameters': {'id': product_id} if product_id else None,
+        'body': json.dumps(body)
+    }
+
+
+class TestProductMutations:
+    
+    def seed(self):
+        products.commit_catalog_changes(upserts=[
+            {'id': 'a', 'name': 'Lamp', 'price': 10.0, 'category': 'Home'},
+            {'id': 'b', 'name': 'Mug', 'price': 4.0, 'category': 'Kitchen'},
+            {'id': 'c', 'name': 'Cup', 'price': 3.0, 'category': 'Kitchen'},
+        ])
+    
+    def manifest(self, s3):
+        return json.loads(s3.body(BUCKET, products.CATALOG_MANIFEST_KEY))
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_patch_updates_fields(self, s3):
+        """PATCH merges the given fields into the product and its listing entry"""
+        self.seed()
+        
+        response = lambda_handler(admin_event('PATCH', {'price': '12.5'}, '/products/a', 'a'), {})
+        
+        assert response['statusCode'] == 200
+        assert json.loads(response['body'])['name'] == 'Lamp'
+        assert products.get_product_from_s3('a')['price'] == 12.5
+        assert self.manifest(s3)['products'][0]['price'] == 12.5
+        assert self.manifest(s3)['version'] == 2
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_patch_errors(self, s3):
+        self.seed()
+        
+        assert lambda_handler(admin_event('PATCH', {'name': 'X'}, '/products/zz', 'zz'), {})['statusCode'] == 404
+        assert lambda_handler(admin_event('PATCH', {'id': 'b'}, '/products/a', 'a'), {})['statusCode'] == 400
+        assert lambda_handler(admin_event('PATCH', {'name': ''}, '/products/a', 'a'), {})['statusCode'] == 400
+        event = admin_event('PATCH', {'name': 'X'}, '/products/a', 'a')
+        event['queryStringParameters'] = None
+        assert lambda_handler(event, {})['statusCode'] == 403
+        assert self.manifest(s3)['version'] == 1
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_batch_is_one_commit(self, s3):
+        """Creates, updates and deletes are applied with a single manifest write"""
+        self.seed()
+        s3.calls.clear()
+        batch = {'upserts': [{'name': 'Kettle', 'price': 20}, {'id': 'a', 'name': 'Desk Lamp'}], 'deletes': ['b', 'c', 'zz']}
+        
+        response = lambda_handler(admin_event('POST', batch, '/products/batch'), {})
+        
+        assert response['statusCode'] == 200
+        result = json.loads(response['body'])
+        assert result['updated'] == ['a'] and result['deleted'] == ['b', 'c'] and result['notFound'] == ['zz']
+        assert s3.calls_for('PutObject').count(products.CATALOG_MANIFEST_KEY) == 1
+        manifest = self.manifest(s3)
+        assert manifest['version'] == 2
+        assert [p['name'] for p in manifest['products']] == ['Desk Lamp', 'Kettle']
+        assert products.get_product_from_s3('b') is None
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_batch_keeps_concurrent_patch(self, s3):
+        """A PATCH landing between the batch's read and write is merged, not overwritten"""
+        self.seed()
+        key = products.product_key('a')
+        put_object = s3.put_object
+        
+        def racing_put(**kwargs):
+            if kwargs['Key'] == key and not racing_put.done:
+                racing_put.done = True
+                current = json.loads(s3.body(BUCKET, key))
+                put_object(Bucket=BUCKET, Key=key, Body=json.dumps({**current, 'category': 'Office'}))
+            return put_object(**kwargs)
+        racing_put.done = False
+        
+        with patch.object(s3, 'put_object', side_effect=racing_put):
+            response = lambda_handler(admin_event('POST', {'upserts': [{'id': 'a', 'price': 12}]}, '/products/batch'), {})
+        
+        assert response['statusCode'] == 200
+        product = products.get_product_from_s3('a')
+        assert (product['price'], product['category']) == (12.0, 'Office')
+        assert self.manifest(s3)['products'][0]['category'] == 'Office'
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_invalid_batch_changes_nothing(self, s3):
+        self.seed()
+        batch = {'upserts': [{'name': 'Kettle'}, {'id': 'zz', 'name': 'Ghost'}, {'price': 'free'}], 'deletes': ['b']}
+        
+        response = lambda_handler(admin_event('POST', batch, '/products/batch'), {})
+        
+        assert response['statusCode'] == 400
+        assert len(json.loads(response['body'])['errors']) == 2
+        assert self.manifest(s3)['version'] == 1
+        assert lambda_handler(admin_event('POST', {'upserts': [{'id': 'a', 'name': 'X'}], 'deletes': ['a']}, '/products/batch'), {})['statusCode'] == 400
+
+
+class TestBinaryCatalogColdStart:
+    
+    PRODUCTS = [
+        {'id': 'a', 'name': 'Lamp', 'price': 10.0, 'category': 'Home'},
+        {'id': 'b', 'name': 'Mug', 'price': 4.0, 'category': 'Kitchen'},
+    ]
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_cold_container_maps_binary_snapshot(self, s3):
+        """A current snapshot is used after a bodyless 304 from the manifest"""
+        products.commit_catalog_changes(upserts=self.PRODUCTS)
+        products.refresh_catalog_artifacts({}, None)
+        products.clear_catalog_cache()
+        
+        manifest = products.load_catalog()
+        
+        assert isinstance(manifest['products'], BinaryCatalog)
+        assert manifest['version'] == 1 and manifest['deletesSince'] == 0
+        response = lambda_handler({'httpMethod': 'GET', 'queryStringParameters': None}, {})
+        assert [p['name'] for p in json.loads(response['body'])] == ['Lamp', 'Mug']
+        page = lambda_handler({'httpMethod': 'GET', 'queryStringParameters': {'sort': 'price'}}, {})
+        assert [p['id'] for p in json.loads(page['body'])['products']] == ['b', 'a']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_stale_snapshot_falls_back_to_json(self, s3):
+        products.commit_catalog_changes(upserts=self.PRODUCTS[:1])
+        products.refresh_catalog_artifacts({}, None)
+        stale = s3.objects[(BUCKET, products.CATALOG_BINARY_KEY)]
+        products.commit_catalog_changes(upserts=self.PRODUCTS[1:])
+        products.refresh_catalog_artifacts({}, None)
+        s3.objects[(BUCKET, products.CATALOG_BINARY_KEY)] = stale
+        products.clear_catalog_cache()
+        
+        manifest = products.load_catalog()
+        
+        assert isinstance(manifest['products'], list)
+        assert manifest['version'] == 2
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_same_bytes_as_json_manifest(self, s3):
+        """Both cold-start paths send the same body under the same strong ETag"""
+        products.commit_catalog_changes(upserts=[*self.PRODUCTS, {'id': 'c', 'name': 'Café chair'}])
+        products.refresh_catalog_artifacts({}, None)
+        event = {'httpMethod': 'GET', 'queryStringParameters': None}
+        products.clear_catalog_cache()
+        from_binary = lambda_handler(event, {})
+        products.clear_catalog_cache()
+        
+        with patch('products.BINARY_CATALOG_ENABLED', False):
+            from_json = lambda_handler(event, {})
+        
+        assert from_binary['body'] == from_json['body']
+        assert from_binary['headers']['ETag'] == from_json['headers']['ETag']
+    
+    @patch('products.BINARY_CATALOG_ENABLED', False)
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_can_be_disabled(self, s3):
+        products.commit_catalog_changes(upserts=self.PRODUCTS)
+        products.refresh_catalog_artifacts({}, None)
+        products.clear_catalog_cache()
+        
+        assert isinstance(products.load_catalog()['products'], list)
+        assert (BUCKET, products.CATALOG_BINARY_KEY) not in s3.objects
+
+
+class TestCompressedListing:
+    
+    def get(self, accept=products.CATALOG_MEDIA_TYPE, accept_encoding='gzip, deflate, br', **extra):
+        headers = {'Accept': accept, 'Accept-Encoding': accept_encoding, **extra}
+        return lambda_handler({'httpMethod': 'GET', 'headers': headers, 'queryStringParameters': None}, {})
+    
+    @patch('compression.brotli', None)
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_serves_stored_gzip_verbatim(self, s3):
+        """The gzip body stored at write time is returned without re-encoding"""
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp'}, {'id': 'b', 'name': 'Mug'}])
+        products.refresh_catalog_artifacts({}, None)
+        stored = s3.body(BUCKET, products.ENCODED_LISTING_KEYS['gzip'])
+        products.clear_catalog_cache()
+        
+        response = self.get()
+        
+        assert response['isBase64Encoded'] is True
+        assert response['headers']['Content-Encoding'] == 'gzip'
+        assert base64.b64decode(response['body']) == stored
+        assert [p['name'] for p in json.loads(gzip.decompress(stored))] == ['Lamp', 'Mug']
+        assert self.get(**{'If-None-Match': response['headers']['ETag']})['statusCode'] == 304
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_plain_json_unless_opted_in(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp'}])
+        compressed = self.get()
+        
+        for response in (self.get(accept='application/json, */*'), self.get(accept_encoding='identity')):
+            assert 'isBase64Encoded' not in response
+            assert json.loads(response['body']) == [{'id': 'a', 'name': 'Lamp', 'version': 1}]
+            assert response['headers']['ETag'] != compressed['headers']['ETag']
+    
+    @patch('compression.brotli', None)
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_stale_stored_encoding_is_not_served(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp'}])
+        products.refresh_catalog_artifacts({}, None)
+        stale = s3.objects[(BUCKET, products.ENCODED_LISTING_KEYS['gzip'])]
+        products.commit_catalog_changes(upserts=[{'id': 'b', 'name': 'Mug'}])
+        products.refresh_catalog_artifacts({}, None)
+        s3.objects[(BUCKET, products.ENCODED_LISTING_KEYS['gzip'])] = stale
+        products.clear_catalog_cache()
+        
+        body = gzip.decompress(base64.b64decode(self.get()['body']))
+        
+        assert [p['id'] for p in json.loads(body)] == ['a', 'b']
+
+
+class TestCdnInvalidation:
+    
+    def image(self, name):
+        return f"https://{BUCKET}.s3.amazonaws.com/products/img/{name}.png"
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_commits_queue_keys_for_the_schedule(self, s3):
+        """Commits only queue CDN-served keys; the scheduled job submits them"""
+        cloudfront = RecordingCloudFront()
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp', 'image': self.image('lamp')}])
+        
+        with patch('products.cdn_invalidations', InvalidationBatcher('DIST', client=cloudfront)):
+            products.commit_catalog_changes(upserts=[{'id': 'b', 'name': 'Mug'}], deletes=['a'])
+            assert cloudfront.invalidations == []
+            products.refresh_catalog_artifacts({}, None)
+        
+        assert cloudfront.paths() == ['/products/img/lamp.png']
+        assert json.loads(s3.body(BUCKET, products.CDN_INVALIDATION_QUEUE_KEY)) == {'batch': 1, 'keys': []}
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_commits_between_runs_share_one_invalidation(self, s3):
+        cloudfront = RecordingCloudFront()
+        
+        with patch('products.cdn_invalidations', InvalidationBatcher('DIST', client=cloudfront)):
+            for name in ('lamp', 'desk-lamp', 'floor-lamp'):
+                products.commit_catalog_changes(upserts=[{'id': 'a', 'name': name, 'image': self.image(name)}])
+            products.refresh_catalog_artifacts({}, None)
+            products.refresh_catalog_artifacts({}, None)
+            products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'lamp', 'image': self.image('lamp')}])
+            products.refresh_catalog_artifacts({}, None)
+        
+        assert len(cloudfront.invalidations) == 2
+        assert cloudfront.invalidations[0]['Paths'] == [f'/products/img/{n}.png' for n in ('desk-lamp', 'floor-lamp', 'lamp')]
+        assert cloudfront.invalidations[1]['Paths'] == ['/products/img/floor-lamp.png', '/products/img/lamp.png']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_failed_submission_stays_queued(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp', 'image': self.image('lamp')}])
+        batcher = InvalidationBatcher('DIST', client=RecordingCloudFront(fail=True))
+        
+        with patch('products.cdn_invalidations', batcher):
+            products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp', 'image': self.image('lamp-2')}])
+            assert products.refresh_catalog_artifacts({}, None)['failed'] == ['invalidations']
+            batcher.client = RecordingCloudFront()
+            assert products.refresh_catalog_artifacts({}, None)['failed'] == []
+        
+        assert batcher.client.paths() == ['/products/img/lamp-2.png', '/products/img/lamp.png']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_bulk_changes_coalesce_to_wildcard(self, s3):
+        cloudfront = RecordingCloudFront()
+        upserts = [{'id': f'p{i}', 'name': f'Item {i}', 'image': self.image(i)} for i in range(30)]
+        
+        with patch('products.cdn_invalidations', InvalidationBatcher('DIST', client=cloudfront)):
+            products.commit_catalog_changes(upserts=upserts)
+            products.refresh_catalog_artifacts({}, None)
+        
+        assert cloudfront.paths() == ['/products/img/*']
+
+
+class TestDuplicateDetection:
+    
+    DESCRIPTION = 'Wheel-thrown stoneware mug with a speckled blue glaze, holds 350ml. Dishwasher safe.'
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_flags_reposts(self, s3):
+        """Near-duplicates are saved but flagged with the listing they resemble"""
+        first = lambda_handler(add_product_event(name='Handmade Ceramic Mug', description=self.DESCRIPTION), {})
+        first_id = json.loads(first['body'])['id']
+        
+        response = lambda_handler(add_product_event(name='Handmade ceramic mug!!', description=self.DESCRIPTION), {})
+        
+        assert response['statusCode'] == 201
+        body = json.loads(response['body'])
+        assert [match['id'] for match in body['possibleDuplicates']] == [first_id]
+        assert products.get_product_from_s3(body['id'])['possibleDuplicateOf'] == [first_id]
+    
+    @patch('products.DUPLICATE_POLICY', 'reject')
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_reject_policy(self, s3):
+        lambda_handler(add_product_event(name='Handmade Ceramic Mug', description=self.DESCRIPTION), {})
+        
+        response = lambda_handler(add_product_event(name='Handmade Ceramic Mug', description=self.DESCRIPTION), {})
+        other = lambda_handler(add_product_event(name='Wireless Headphones', description='Noise cancelling'), {})
+        
+        assert response['statusCode'] == 409
+        assert other['statusCode'] == 201
+        assert len(json.loads(s3.body(BUCKET, products.CATALOG_MANIFEST_KEY))['products']) == 2
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_lookup_reads_only_its_own_shards(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': f'p{i}', 'name': f'Product number {i}', 'description': f'Item {i}'}
+                                                 for i in range(40)])
+        products.refresh_catalog_artifacts({}, None)
+        s3.calls.clear()
+        
+        products.find_product_duplicates({'id': 'new', 'name': 'Handmade Ceramic Mug', 'description': self.DESCRIPTION})
+        
+        shard_reads = [key for key in s3.calls_for('GetObject') if key.startswith(BUCKET_PREFIX)]
+        assert 0 < len(shard_reads) <= BANDS
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_imports_are_indexed_by_schedule(self, s3):
+        """Bulk commits leave the buckets to the scheduled job, which adds only what changed"""
+        products.commit_catalog_changes(upserts=[{'id': 'x', 'name': 'Lamp'}])
+        products.refresh_catalog_artifacts({}, None)
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Handmade Ceramic Mug', 'description': self.DESCRIPTION}])
+        repost = {'id': 'new', 'name': 'Handmade ceramic mug', 'description': self.DESCRIPTION}
+        assert products.find_product_duplicates(repost) == []
+        
+        with patch('products.rebuild_buckets', side_effect=AssertionError('full rebuild')):
+            assert products.refresh_catalog_artifacts({}, None)['failed'] == []
+        
+        assert [match_id for match_id, _ in products.find_product_duplicates(repost)] == ['a']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_deleted_and_edited_listings_are_pruned(self, s3):
+        lambda_handler(add_product_event(name='Handmade Ceramic Mug', description=self.DESCRIPTION), {})
+        products.commit_catalog_changes(upserts=[{'id': 'b', 'name': 'Handmade Ceramic Mug', 'description': self.DESCRIPTION}])
+        products.refresh_catalog_artifacts({}, None)
+        first_id = next(p['id'] for p in products.get_products_from_s3() if p['id'] != 'b')
+        products.commit_catalog_changes(upserts=[{'id': 'b', 'name': 'Wireless Headphones'}], deletes=[first_id])
+        repost = {'id': 'new', 'name': 'Handmade ceramic mug', 'description': self.DESCRIPTION}
+        
+        assert products.find_product_duplicates(repost) == []
+        
+        members = {product_id for _, key in list(s3.objects) if key.startswith(BUCKET_PREFIX)
+                   for ids in json.loads(s3.body(BUCKET, key)).values() for product_id in ids}
+        assert members.isdisjoint({first_id, 'b'})
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_unreadable_buckets_skip_the_check(self, s3):
+        lambda_handler(add_product_event(name='Handmade Ceramic Mug', description=self.DESCRIPTION), {})
+        
+        with patch('products.find_duplicates', side_effect=RuntimeError('throttled')):
+            response = lambda_handler(add_product_event(name='Handmade ceramic mug', description=self.DESCRIPTION), {})
+        
+        assert response['statusCode'] == 201 and 'possibleDuplicates' not in json.loads(response['body'])
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_schedule_brings_persisted_index_forward(self, s3):
+        """The search index persisted at an older version is caught up from the touched product objects"""
+        lambda_handler(add_product_event(name='Handmade Ceramic Mug', description=self.DESCRIPTION), {})
+        products.refresh_catalog_artifacts({}, None)
+        products.commit_catalog_changes(upserts=[{'id': 'b', 'name': 'Lamp'}, {'id': 'c', 'name': 'Vase'}])
+        products.clear_catalog_cache()
+        products.commit_catalog_changes(deletes=['b'])
+        
+        with patch('products.SearchIndex.build', side_effect=AssertionError('full rebuild')):
+            assert products.refresh_catalog_artifacts({}, None)['rebuilt'] == []
+        
+        persisted = json.loads(s3.body(BUCKET, products.SEARCH_INDEX_KEY))
+        assert persisted['version'] == 3
+        assert set(persisted['documents']) == {p['id'] for p in products.get_products_from_s3()}
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_unrecoverable_index_is_rebuilt_by_schedule(self, s3):
+        """Past the tombstones, the scheduled job rebuilds from the product objects"""
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Handmade Ceramic Mug', 'description': self.DESCRIPTION}])
+        products.refresh_catalog_artifacts({}, None)
+        manifest = json.loads(s3.body(BUCKET, products.CATALOG_MANIFEST_KEY))
+        s3.put_object(Bucket=BUCKET, Key=products.CATALOG_MANIFEST_KEY, Body=json.dumps({**manifest, 'deletesSince': 1}))
+        s3.delete_object(Bucket=BUCKET, Key=products.SEARCH_INDEX_KEY)
+        products.clear_catalog_cache()
+        
+        products.commit_catalog_changes(upserts=[{'id': 'b', 'name': 'Coffee Beans'}])
+        result = products.refresh_catalog_artifacts({}, None)
+        
+        assert result == {'version': 2, 'rebuilt': ['search'], 'failed': []}
+        assert set(json.loads(s3.body(BUCKET, products.SEARCH_INDEX_KEY))['documents']) == {'a', 'b'}
+
+
+class TestRelatedProducts:
+    
+    def related(self, product_id, **params):
+        event = {
+            'httpMethod': 'GET',
+            'path': f'/products/{product_id}/related',
+            'pathParameters': {'id': product_id},
+            'queryStringParameters': params or None
+        }
+        response = lambda_handler(event, {})
+        return response['statusCode'], json.loads(response['body'])
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_serves_materialized_recommendations(self, s3):
+        """Related products come from the stored document, joined with live listings"""
+        products.commit_catalog_changes(upserts=[
+            {'id': 'mug', 'name': 'Mug'}, {'id': 'coffee', 'name': 'Coffee', 'price': 9.0}, {'id': 'tea', 'name': 'Tea'}
+        ])
+        document = {'generatedAt': '2024-06-01T00:00:00', 'related': {'mug': [
+            {'id': 'coffee', 'count': 5, 'confidence': 0.5},
+            {'id': 'gone', 'count': 3, 'confidence': 0.3},
+            {'id': 'tea', 'count': 1, 'confidence': 0.1},
+        ]}}
+        s3.put_object(Bucket=BUCKET, Key=products.RELATED_PRODUCTS_KEY, Body=json.dumps(document))
+        
+        status, body = self.related('mug')
+        
+        assert status == 200
+        assert [(r['id'], r['count']) for r in body['related']] == [('coffee', 5), ('tea', 1)]
+        assert body['related'][0]['price'] == 9.0
+        assert self.related('mug', limit='1')[1]['related'][0]['id'] == 'coffee'
+        assert self.related('tea') == (200, {'productId': 'tea', 'related': [], 'generatedAt': '2024-06-01T00:00:00'})
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_errors(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': 'mug', 'name': 'Mug'}])
+        
+        assert self.related('nope')[0] == 404
+        assert self.related('mug', limit='0')[0] == 400
+        assert self.related('mug') == (200, {'productId': 'mug', 'related': [], 'generatedAt': None})
+
+
+class TestSimilarProducts:
+    
+    def similar(self, product_id, **params):
+        event = {
+            'httpMethod': 'GET',
+            'path': f'/products/{product_id}/similar',
+            'pathParameters': {'id': product_id},
+            'queryStringParameters': params or None
+        }
+        response = lambda_handler(event, {})
+        return response['statusCode'], json.loads(response['body'])
+    
+    def add_images(self, s3, colors):
+        """Store a solid PNG per product and commit products pointing at them"""
+        Image = pytest.importorskip('PIL.Image')
+        upserts = []
+        for product_id, color in colors.items():
+            buffer = io.BytesIO()
+            Image.new('RGB', (48, 48), color).save(buffer, format='PNG')
+            key = f'products/images/{product_id}.png'
+            s3.put_object(Bucket=BUCKET, Key=key, Body=buffer.getvalue())
+            upserts.append({'id': product_id, 'name': product_id, 'image': f'https://{BUCKET}.s3.amazonaws.com/{key}'})
+        products.commit_catalog_changes(upserts=upserts)
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_indexes_images_and_serves_neighbours(self, s3):
+        """The job describes each image once; queries rank by visual similarity"""
+        self.add_images(s3, {'red': (200, 30, 30), 'dark-red': (170, 20, 20), 'green': (30, 200, 30)})
+        products.commit_catalog_changes(upserts=[{'id': 'external', 'name': 'Hotlinked', 'image': 'https://example.com/a.png'}])
+        
+        assert products.index_product_images({}, None) == {'products': 3, 'described': 3}
+        status, body = self.similar('red', limit='1')
+        
+        assert status == 200 and body['indexed'] is True
+        assert [(s['id'], s['name']) for s in body['similar']] == [('dark-red', 'dark-red')]
+        assert self.similar('external')[1] == {'productId': 'external', 'indexed': False, 'similar': []}
+        assert products.index_product_images({}, None) == {'products': 3, 'described': 0}
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_deleted_products_are_skipped(self, s3):
+        self.add_images(s3, {'red': (200, 30, 30), 'dark-red': (170, 20, 20), 'green': (30, 200, 30)})
+        products.index_product_images({}, None)
+        
+        products.commit_catalog_changes(deletes=['dark-red'])
+        
+        assert [s['id'] for s in self.similar('red', limit='1')[1]['similar']] == ['green']
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_errors(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': 'mug', 'name': 'Mug'}])
+        
+        assert self.similar('nope')[0] == 404
+        assert self.similar('mug', limit='0')[0] == 400
+        assert self.similar('mug', limit='51')[0] == 400
+
+
+class TestTagBrowsing:
+    
+    def browse(self, **params):
+        response = lambda_handler({'httpMethod': 'GET', 'path': '/products', 'queryStringParameters': params}, {})
+        return json.loads(response['body'])
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_add_product_keeps_analysis_labels(self, s3):
+        """Labels from /analyze-image are saved with their confidences and indexed"""
+        products.commit_catalog_changes(upserts=[{'id': 'lamp', 'name': 'Lamp', 'tags': [{'name': 'Light'}]}])
+        event = {
+            'httpMethod': 'POST',
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'name': 'Blue mug', 'price': '8', 'tags': [
+                {'name': 'Cup', 'confidence': 97.25}, {'name': 'Pottery', 'confidence': 81.0}
+            ]})
+        }
+        
+        response = lambda_handler(event, {})
+        product_id = json.loads(response['body'])['id']
+        
+        assert response['statusCode'] == 201
+        assert products.get_product_from_s3(product_id)['tags'] == [
+            {'name': 'Cup', 'confidence': 97.2}, {'name': 'Pottery', 'confidence': 81.0}
+        ]
+        body = self.browse(tag='cup')
+        assert [p['id'] for p in body['products']] == [product_id] and body['total'] == 1
+        assert body['products'][0]['tags'] == ['Cup', 'Pottery']
+        assert self.browse(tag='pottery', category='Kitchen')['products'] == []
+        assert self.browse(tag='unknown') == {'products': [], 'nextCursor': None, 'total': 0}
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_index_follows_writes(self, s3):
+        products.commit_catalog_changes(upserts=[
+            {'id': 'a', 'name': 'Mug', 'price': 4.0, 'category': 'Kitchen', 'tags': [{'name': 'Cup'}]},
+            {'id': 'b', 'name': 'Cup', 'price': 3.0, 'category': 'Kitchen', 'tags': [{'name': 'Cup'}]},
+            {'id': 'c', 'name': 'Vase', 'price': 9.0, 'category': 'Home', 'tags': [{'name': 'Pottery'}]},
+        ])
+        assert [p['id'] for p in self.browse(tag='Cup', sort='price')['products']] == ['b', 'a']
+        
+        lambda_handler(admin_event('PATCH', {'tags': ['Pottery']}, '/products/a', 'a'), {})
+        products.commit_catalog_changes(deletes=['c'])
+        
+        assert [p['id'] for p in self.browse(tag='cup')['products']] == ['b']
+        assert [p['id'] for p in self.browse(tag='pottery', category='kitchen')['products']] == ['a']
+        assert products.get_catalog_index().by_tag == {'cup': {'b'}, 'pottery': {'a'}}
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_invalid_tags_rejected(self, s3):
+        event = {
+            'httpMethod': 'POST',
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'name': 'Mug', 'tags': [{'name': 'Cup', 'confidence': 'high'}]})
+        }
+        
+        assert lambda_handler(event, {})['statusCode'] == 400
+
+
+class TestProductInventory:
+    
+    def inventory_event(self, method, product_id, body=None, admin=True):
+        event = admin_event(method, body, f'/products/{product_id}/inventory', product_id)
+        if not admin:
+            event['queryStringParameters'] = None
+        return event
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_set_and_get_stock(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp', 'price': 10.0}])
+        
+        untracked = json.loads(lambda_handler(self.inventory_event('GET', 'a'), {})['body'])
+        response = lambda_handler(self.inventory_event('PUT', 'a', {'stock': 12}), {})
+        stock = lambda_handler(self.inventory_event('GET', 'a'), {})
+        
+        assert untracked == {'productId': 'a', 'tracked': False}
+        assert response['statusCode'] == 200
+        assert stock['headers']['Cache-Control'] == 'no-store'
+        assert json.loads(stock['body']) == {'productId': 'a', 'tracked': True, 'available': 12, 'held': 0, 'sold': 0}
+    
+    @patch('products.s3_client', new_callable=FakeS3)
+    def test_errors(self, s3):
+        products.commit_catalog_changes(upserts=[{'id': 'a', 'name': 'Lamp', 'price': 10.0}])
+        
+        assert lambda_handler(self.inventory_event('PUT', 'a', {'stock': 5}, admin=False), {})['statusCode'] == 403
+        assert lambda_handler(self.inventory_event('PUT', 'a', {'stock': -1}), {})['statusCode'] == 400
+        assert lambda_handler(self.inventory_event('PUT', 'a', {'stock': 2.5}), {})['statusCode'] == 400
+        assert lambda_handler(self.inventory_event('PUT', 'zz', {'stock': 5}), {})['statusCode'] == 404
+        assert lambda_handler(self.inventory_event('GET', 'zz'), {})['statusCode'] == 404
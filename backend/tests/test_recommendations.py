@@ -0,0 +1,83 @@
+import json
+import pytest
+import os
+from unittest.mock import patch
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+import recommendations
+from recommendations import RELATED_PRODUCTS_KEY, build_related, order_baskets
+from orders_new import ORDERS_KEY
+from tests.fake_s3 import FakeS3
+
+
+def order(*product_ids, status='pending'):
+    return {'status': status, 'items': [{'productId': product_id, 'quantity': 1} for product_id in product_ids]}
+
+
+ORDERS = [
+    order('mug', 'coffee', 'spoon'),
+    order('mug', 'coffee'),
+    order('mug', 'tea'),
+    order('coffee', 'filter'),
+    order('mug', 'coffee', status='cancelled'),
+    order('lamp'),
+]
+
+
+@pytest.fixture(params=['scipy', 'pure-python'])
+def scipy_mode(request):
+    """Run each test with the sparse matrix path and with the pure-Python fallback"""
+    if request.param == 'scipy':
+        pytest.importorskip('scipy')
+        yield
+    else:
+        with patch('recommendations.sparse', None):
+            yield
+
+
+class TestOrderBaskets:
+    
+    def test_skips_cancelled_and_single_item_orders(self):
+        baskets = order_baskets(ORDERS + [{'items': [{'id': 'a'}, {'id': 'a'}, {'id': 'b'}]}])
+        
+        assert len(baskets) == 5
+        assert baskets[-1] == {'a', 'b'}
+
+
+class TestBuildRelated:
+    
+    def test_ranks_by_co_occurrence(self, scipy_mode):
+        related = build_related(ORDERS)
+        
+        assert [(r['id'], r['count']) for r in related['mug']] == [('coffee', 2), ('spoon', 1), ('tea', 1)]
+        assert related['coffee'][0] == {'id': 'mug', 'count': 2, 'confidence': round(2 / 3, 3)}
+        assert 'lamp' not in related
+    
+    def test_top_k(self, scipy_mode):
+        orders = [order('hub', f'p{i}') for i in range(8)] + [order('hub', 'p3')]
+        
+        related = build_related(orders, top_k=3)
+        
+        assert [r['id'] for r in related['hub']] == ['p3', 'p0', 'p1']
+    
+    def test_modes_agree(self):
+        pytest.importorskip('scipy')
+        orders = [order(*(f'p{(i * 7 + j) % 13}' for j in range(i % 4 + 2))) for i in range(40)]
+        
+        with patch('recommendations.sparse', None):
+            fallback = build_related(orders, top_k=4)
+        
+        assert build_related(orders, top_k=4) == fallback
+    
+    @patch('recommendations.s3_client', new_callable=FakeS3)
+    def test_job_materializes_document(self, s3):
+        s3.put_object(Bucket=recommendations.S3_BUCKET, Key=ORDERS_KEY, Body=json.dumps({'orders': ORDERS}))
+        
+        result = recommendations.lambda_handler({}, None)
+        
+        document = json.loads(s3.body(recommendations.S3_BUCKET, RELATED_PRODUCTS_KEY))
+        assert result == {'products': 5, 'orders': len(ORDERS)}
+        assert document['related']['tea'][0]['id'] == 'mug'
@@ -0,0 +1,102 @@
+import json
+import pytest
+import os
+from unittest.mock import patch
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+import s3_store
+from s3_store import ConflictError, read_json, update_json, write_json
+from tests.fake_s3 import FakeS3
+
+BUCKET = 'test-bucket'
+KEY = 'docs/doc.json'
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay():
+    s3_store.reset_write_stats()
+    with patch('s3_store.RETRY_BASE_DELAY', 0):
+        yield
+
+
+class TestConditionalWrites:
+    
+    def test_create_only_if_missing(self):
+        """A write without an ETag refuses to overwrite an existing document"""
+        s3 = FakeS3()
+        write_json(s3, BUCKET, KEY, {'n': 1})
+        
+        with pytest.raises(Exception) as error:
+            write_json(s3, BUCKET, KEY, {'n': 2})
+        
+        assert s3_store.is_conflict(error.value)
+        assert read_json(s3, BUCKET, KEY)[0] == {'n': 1}
+    
+    def test_concurrent_update_is_merged(self):
+        """A writer that loses the race re-applies its change on the winner's document"""
+        s3 = FakeS3()
+        write_json(s3, BUCKET, KEY, {'items': []})
+        
+        def append(value, race=False):
+            def mutate(current):
+                if race and not current['items']:
+                    # Another invocation commits between our read and write
+                    doc, etag = read_json(s3, BUCKET, KEY)
+                    write_json(s3, BUCKET, KEY, {'items': doc['items'] + ['other']}, etag)
+                return {'items': current['items'] + [value]}
+            return mutate
+        
+        document, _ = update_json(s3, BUCKET, KEY, append('mine', race=True))
+        
+        assert document == {'items': ['other', 'mine']}
+        assert read_json(s3, BUCKET, KEY)[0] == document
+        stats = s3_store.get_write_stats()
+        assert stats['conflicts'] == 1
+        assert stats['retries'] == 1
+    
+    def test_gives_up_after_max_attempts(self):
+        """Permanent contention surfaces as ConflictError instead of a lost write"""
+        s3 = FakeS3()
+        write_json(s3, BUCKET, KEY, {'n': 0})
+        
+        def always_lose(current):
+            doc, etag = read_json(s3, BUCKET, KEY)
+            write_json(s3, BUCKET, KEY, {'n': doc['n'] + 1}, etag)
+            return {'n': -1}
+        
+        with pytest.raises(ConflictError):
+            update_json(s3, BUCKET, KEY, always_lose, max_attempts=3)
+        
+        assert s3_store.get_write_stats()['exhausted'] == 1
+        assert read_json(s3, BUCKET, KEY)[0] == {'n': 3}
+    
+    def test_contention_is_recorded_as_metric(self, capsys):
+        """Contended writes log one CloudWatch EMF line; uncontended ones log nothing"""
+        s3 = FakeS3()
+        write_json(s3, BUCKET, KEY, {'n': 0})
+        update_json(s3, BUCKET, KEY, lambda current: {'n': 1})
+        assert capsys.readouterr().out == ''
+        
+        def lose_once(current):
+            if current['n'] == 1:
+                doc, etag = read_json(s3, BUCKET, KEY)
+                write_json(s3, BUCKET, KEY, {'n': 2}, etag)
+            return {'n': current['n'] + 10}
+        update_json(s3, BUCKET, KEY, lose_once)
+        
+        record = json.loads(capsys.readouterr().out)
+        assert record['Document'] == 'docs/doc.json'
+        assert record['WriteConflicts'] == 1 and record['WritesExhausted'] == 0
+        assert record['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Document']]
+    
+    def test_read_errors_propagate(self):
+        """Only a missing key reads as empty; other failures raise"""
+        s3 = FakeS3()
+        assert read_json(s3, BUCKET, KEY) == (None, None)
+        
+        with patch.object(s3, 'get_object', side_effect=RuntimeError('throttled')):
+            with pytest.raises(RuntimeError):
+                read_json(s3, BUCKET, KEY)
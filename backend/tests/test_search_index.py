@@ -0,0 +1,99 @@
+import os
+import sys
+
+# Add the lambda_functions directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda_functions'))
+
+from search_index import PrefixIndex, QueryCache, SearchIndex, tokenize
+
+CATALOGUE = [
+    {'id': 'mug', 'name': 'Coffee Mug', 'description': 'Ceramic mug for coffee and tea', 'category': 'Kitchen'},
+    {'id': 'beans', 'name': 'Coffee Beans', 'description': 'Dark roast', 'category': 'Grocery'},
+    {'id': 'pot', 'name': 'Tea Pot', 'description': 'Glass pot', 'category': 'Kitchen'},
+    {'id': 'book', 'name': 'Tech Book', 'description': 'Learn programming basics', 'category': 'Books'},
+]
+
+
+class TestSearchIndex:
+    
+    def test_tokenize(self):
+        """Tokens are lowercased, stopwords dropped and simple plurals folded"""
+        assert tokenize('The Coffee Mugs, for Tea!') == ['coffee', 'mug', 'tea']
+        assert tokenize('Glass') == ['glass']
+    
+    def test_ranking_prefers_name_matches(self):
+        """BM25 ranks products whose name matches above description-only matches"""
+        index = SearchIndex.build(CATALOGUE, 1)
+        
+        ranked, total = index.search('tea')
+        
+        assert [product_id for product_id, _ in ranked] == ['pot', 'mug']
+        assert total == 2
+        assert index.search('kitchen coffee', limit=1)[0][0][0] == 'mug'
+        assert index.search('nothing here') == ([], 0)
+    
+    def test_incremental_changes_match_rebuild(self):
+        """Applying upserts and deletes gives the same results as a full rebuild"""
+        index = SearchIndex.build(CATALOGUE[:3], 1)
+        renamed = dict(CATALOGUE[0], name='Espresso Cup')
+        
+        index.apply_changes([renamed, CATALOGUE[3]], ['beans'], 2)
+        rebuilt = SearchIndex.build([renamed, CATALOGUE[2], CATALOGUE[3]], 2)
+        
+        for query in ('coffee', 'espresso', 'tea pot', 'programming'):
+            assert index.search(query) == rebuilt.search(query)
+        assert index.version == 2
+    
+    def test_round_trip(self):
+        """The persisted form restores identical rankings"""
+        index = SearchIndex.build(CATALOGUE, 7)
+        
+        restored = SearchIndex.from_dict(index.to_dict())
+        
+        assert restored.version == 7
+        assert restored.search('coffee tea') == index.search('coffee tea')
+    
+    def test_query_cache_evicts_least_recent(self):
+        cache = QueryCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+
+
+
+class TestPrefixIndex:
+    
+    PRODUCTS = [
+        {'id': '1', 'name': 'Coffee Mug', 'category': 'Kitchen'},
+        {'id': '2', 'name': 'Mug Warmer', 'category': 'Kitchen'},
+        {'id': '3', 'name': 'Kitchen Scale', 'category': 'Home'},
+    ]
+    
+    def texts(self, index, prefix):
+        return [s['text'] for s in index.suggest(prefix)]
+    
+    def test_matches_any_word_start(self):
+        """Whole-name matches rank before later-word matches; categories come first"""
+        index = PrefixIndex.build(self.PRODUCTS, 1)
+        
+        assert self.texts(index, 'mu') == ['Mug Warmer', 'Coffee Mug']
+        assert self.texts(index, 'KIT') == ['Kitchen', 'Kitchen Scale']
+        assert self.texts(index, 'coffee m') == ['Coffee Mug']
+        assert index.suggest('') == []
+    
+    def test_incremental_changes(self):
+        """Categories disappear with their last product; renamed products move"""
+        index = PrefixIndex.build(self.PRODUCTS, 1)
+        
+        index.apply_changes([dict(self.PRODUCTS[1], name='Cup Warmer')], ['1'], 2)
+        
+        assert self.texts(index, 'mug') == []
+        assert self.texts(index, 'cup') == ['Cup Warmer']
+        assert self.texts(index, 'kitchen') == ['Kitchen', 'Kitchen Scale']
+        index.apply_changes([], ['2'], 3)
+        assert self.texts(index, 'kitchen') == ['Kitchen Scale']
+        assert index.entries == PrefixIndex.build([self.PRODUCTS[2]], 3).entries
@@ -10,6 +10,7 @@ import {
   CardContent,
   Divider
 } from '@mui/material';
+import { cancelOrder, createOrder } from '../services/api';
 
 interface ExpressCheckoutProps {
   items: Array<{
@@ -20,6 +21,7 @@ interface ExpressCheckoutProps {
     image?: string;
   }>;
   totalAmount: number;
+  userId: string;
   onSuccess: (paymentData: any) => void;
   onError: (error: string) => void;
 }
@@ -27,6 +29,7 @@ interface ExpressCheckoutProps {
 const ExpressCheckout: React.FC<ExpressCheckoutProps> = ({
   items,
   totalAmount,
+  userId,
   onSuccess,
   onError
 }) => {
@@ -82,9 +85,23 @@ const ExpressCheckout: React.FC<ExpressCheckoutProps> = ({
     });
 
     pr.on('paymentmethod', async (event) => {
+      let orderId = '';
+
+      // A payment that did not go through cancels its pending order, so the
+      // stock it held is free again for the next attempt
+      const fail = (message: string) => {
+        event.complete('fail');
+        if (orderId) {
+          cancelOrder(orderId, userId).catch(error => {
+            console.error('Could not cancel pending order:', error);
+          });
+        }
+        onError(message);
+      };
+
       try {
         // Prepare order data
-        const orderData = {
+        const orderData: any = {
           items: items.map(item => ({
             productId: item.id,
             name: item.name,
@@ -108,6 +125,17 @@ const ExpressCheckout: React.FC<ExpressCheckoutProps> = ({
           paymentMethod: event.paymentMethod
         };
 
+        // Reserve the stock in a pending order before charging; an
+        // out-of-stock 409 fails here with nothing charged
+        const order = await createOrder({
+          userId,
+          items: orderData.items,
+          total: totalAmount,
+          customerInfo: orderData.customerInfo
+        });
+        orderId = order.id;
+        orderData.orderId = order.id;
+
         // Create payment intent
         const authData = localStorage.getItem('auth-storage');
         const authToken = authData ? JSON.parse(authData).state?.user?.token : '';
@@ -152,8 +180,7 @@ const ExpressCheckout: React.FC<ExpressCheckoutProps> = ({
         );
 
         if (error) {
-          event.complete('fail');
-          onError(error.message || 'Payment failed');
+          fail(error.message || 'Payment failed');
         } else if (paymentIntent.status === 'succeeded') {
           event.complete('success');
           onSuccess({
@@ -166,8 +193,7 @@ const ExpressCheckout: React.FC<ExpressCheckoutProps> = ({
             await stripe.confirmCardPayment(clientSecret);
           
           if (confirmError) {
-            event.complete('fail');
-            onError(confirmError.message || 'Payment failed');
+            fail(confirmError.message || 'Payment failed');
           } else if (confirmedPaymentIntent?.status === 'succeeded') {
             event.complete('success');
             onSuccess({
@@ -175,16 +201,13 @@ const ExpressCheckout: React.FC<ExpressCheckoutProps> = ({
               orderData
             });
           } else {
-            event.complete('fail');
-            onError('Payment could not be completed');
+            fail('Payment could not be completed');
           }
         } else {
-          event.complete('fail');
-          onError('Payment failed');
+          fail('Payment failed');
         }
-      } catch (error) {
-        event.complete('fail');
-        onError('Payment failed');
+      } catch (error: any) {
+        fail(error.response?.data?.error || 'Payment failed');
         console.error('Express checkout error:', error);
       }
     });
@@ -220,7 +243,7 @@ const ExpressCheckout: React.FC<ExpressCheckoutProps> = ({
       });
     });
 
-  }, [stripe, items, totalAmount, onSuccess, onError]);
+  }, [stripe, items, totalAmount, userId, onSuccess, onError]);
 
   if (!canMakePayment || !paymentRequest || !items.length) {
     return null;
@@ -17,6 +17,7 @@ interface StripePaymentFormProps {
   onSuccess: (paymentIntentId: string) => void;
   onError: (error: string) => void;
   amount: number;
+  orderId: string;
   customerInfo?: {
     name: string;
     email: string;
@@ -33,6 +34,7 @@ const StripePaymentForm: React.FC<StripePaymentFormProps> = ({
   onSuccess,
   onError,
   amount,
+  orderId,
   customerInfo
 }) => {
   const stripe = useStripe();
@@ -171,6 +173,7 @@ const StripePaymentForm: React.FC<StripePaymentFormProps> = ({
           <WalletPaymentButton
             amount={amount}
             currency="usd"
+            orderId={orderId}
             country={customerInfo.country || 'US'}
             customerInfo={customerInfo}
             onSuccess={onSuccess}
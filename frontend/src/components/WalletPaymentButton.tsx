@@ -8,11 +8,13 @@ import {
   Typography,
   Divider
 } from '@mui/material';
+import useCartStore from '../store/cartStore';
 
 interface WalletPaymentButtonProps {
   amount: number;
   currency: string;
   country: string;
+  orderId: string;
   customerInfo: {
     name: string;
     email: string;
@@ -31,17 +33,19 @@ const WalletPaymentButton: React.FC<WalletPaymentButtonProps> = ({
   amount,
   currency,
   country,
+  orderId,
   customerInfo,
   onSuccess,
   onError
 }) => {
   const stripe = useStripe();
+  const { items } = useCartStore();
   const [paymentRequest, setPaymentRequest] = useState<any>(null);
   const [canMakePayment, setCanMakePayment] = useState(false);
   const [walletType, setWalletType] = useState<'applePay' | 'googlePay' | 'link' | null>(null);
 
   useEffect(() => {
-    if (!stripe) return;
+    if (!stripe || !orderId) return;
 
     const pr = stripe.paymentRequest({
       country: country.toUpperCase(),
@@ -129,7 +133,16 @@ const WalletPaymentButton: React.FC<WalletPaymentButtonProps> = ({
             currency: currency,
             customerEmail: event.payerEmail || customerInfo.email,
             orderDetails: {
-              orderId: `wallet_${Date.now()}`,
+              // The pending order checkout created, which holds the stock
+              // and is marked paid when this intent is confirmed
+              orderId,
+              // The server prices the charge from these items
+              items: items.map(item => ({
+                productId: item.id,
+                name: item.name,
+                price: item.price,
+                quantity: item.quantity
+              })),
               customerId: authToken ? 'authenticated_user' : 'guest',
               customerInfo: {
                 ...customerInfo,
@@ -235,7 +248,7 @@ const WalletPaymentButton: React.FC<WalletPaymentButtonProps> = ({
       });
     });
 
-  }, [stripe, amount, currency, country, customerInfo, onSuccess, onError]);
+  }, [stripe, amount, currency, country, orderId, customerInfo, items, onSuccess, onError]);
 
   if (!canMakePayment || !paymentRequest) {
     console.log('Wallet payment not available:', { canMakePayment, paymentRequest: !!paymentRequest });
@@ -233,7 +233,8 @@ const AddProduct: React.FC = () => {
         price: parseFloat(formData.price),
         category: 'General', // Default category when not specified
         userId: user?.id || '',
-        imageUrl: imageUrl
+        imageUrl: imageUrl,
+        tags: aiAnalysis?.tags || [] // Image labels, saved for browse-by-tag
       };
       
       const result = await addProduct(productData);
@@ -21,7 +21,7 @@ import useCartStore from '../store/cartStore';
 import useAuthStore from '../store/authStore';
 import { useNavigate } from 'react-router-dom';
 import ExpressCheckout from '../components/ExpressCheckout';
-import { createOrder } from '../services/api';
+import { confirmPayment } from '../services/api';
 
 const Cart: React.FC = () => {
   const navigate = useNavigate();
@@ -41,14 +41,11 @@ const Cart: React.FC = () => {
 
   const handleExpressCheckoutSuccess = async (paymentData: any) => {
     try {
-      // Create order in our system
-      const order = await createOrder({
-        userId: user?.id || '',
-        items: paymentData.orderData.items,
-        total: paymentData.orderData.totalAmount,
-        status: 'processing',
-        customerInfo: paymentData.orderData.customerInfo,
-        paymentIntentId: paymentData.paymentIntentId
+      // The pending order was created before charging; confirming marks it
+      // paid and sells its held stock
+      const order = await confirmPayment({
+        paymentIntentId: paymentData.paymentIntentId,
+        orderDetails: paymentData.orderData
       });
 
       // Clear cart
@@ -57,8 +54,8 @@ const Cart: React.FC = () => {
       // Navigate to success page with order info
       navigate('/orders', { 
         state: { 
-          successMessage: `Order ${order.id} created successfully!`,
-          orderId: order.id 
+          successMessage: `Order ${order.orderId} created successfully!`,
+          orderId: order.orderId 
         } 
       });
     } catch (error) {
@@ -99,6 +96,7 @@ const Cart: React.FC = () => {
           <ExpressCheckout
             items={items}
             totalAmount={getTotalPrice()}
+            userId={user.id}
             onSuccess={handleExpressCheckoutSuccess}
             onError={handleExpressCheckoutError}
           />
@@ -119,7 +119,6 @@ const Checkout: React.FC = () => {
         userId: user?.id || '',
         items: orderDetails.items,
         total: totalAmount,
-        status: 'processing',
         customerInfo: customerInfo
       });
 
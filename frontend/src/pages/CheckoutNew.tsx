@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import {
   Container,
   Paper,
@@ -35,7 +35,7 @@ import { Elements } from '@stripe/react-stripe-js';
 import { stripePromise } from '../App';
 import useAuthStore from '../store/authStore';
 import useCartStore from '../store/cartStore';
-import { createPaymentIntent, confirmPayment, createOrder } from '../services/api';
+import { createPaymentIntent, confirmPayment, createOrder, cancelOrder } from '../services/api';
 import StripePaymentForm from '../components/StripePaymentForm';
 // import WalletDebug from '../components/WalletDebug';
 // import ApplePayCheck from '../components/ApplePayCheck';
@@ -60,12 +60,26 @@ const CheckoutNew: React.FC = () => {
   });
   const [paymentIntentClientSecret, setPaymentIntentClientSecret] = useState('');
   const [orderId, setOrderId] = useState('');
+  // The unpaid order holding stock for this checkout, and the cart it was made for
+  const pendingOrder = useRef<{ id: string; key: string } | null>(null);
 
   const steps = ['Review Order', 'Shipping Info', 'Payment', 'Confirmation'];
 
   const totalAmount = getTotalPrice();
   const totalAmountCents = Math.round(totalAmount * 100);
 
+  // Cancels the pending order so its held stock is released now; guest orders
+  // cannot be cancelled by the client and expire on the server instead
+  const abandonPendingOrder = () => {
+    const order = pendingOrder.current;
+    pendingOrder.current = null;
+    if (order && user?.id) {
+      cancelOrder(order.id, user.id).catch(error => {
+        console.error('Could not cancel pending order:', error);
+      });
+    }
+  };
+
   // Create payment intent when reaching payment step
   const createPaymentMutation = useMutation({
     mutationFn: async () => {
@@ -73,38 +87,68 @@ const CheckoutNew: React.FC = () => {
       console.log('Customer info:', customerInfo);
       console.log('Total amount cents:', totalAmountCents);
       
+      const orderItems = items.map(item => ({
+        productId: item.id,
+        name: item.name,
+        price: item.price,
+        quantity: item.quantity,
+        total: item.price * item.quantity
+      }));
+
+      // A pending order holds the stock while the customer pays. Going back
+      // and forth reuses it; if the cart or details changed, it is cancelled
+      // and replaced so its stock is not held twice.
+      const key = JSON.stringify({ orderItems, customerInfo });
+      if (pendingOrder.current && pendingOrder.current.key !== key) {
+        abandonPendingOrder();
+      }
+      const createdOrder = !pendingOrder.current;
+      if (!pendingOrder.current) {
+        const order = await createOrder({
+          userId: user?.id || '',
+          items: orderItems,
+          total: totalAmount,
+          customerInfo: customerInfo
+        });
+        pendingOrder.current = { id: order.id, key };
+      }
+      const pendingOrderId = pendingOrder.current.id;
+
       const orderDetails = {
-        orderId: `order_${Date.now()}`,
+        orderId: pendingOrderId,
         customerId: user?.id || '',
         customerEmail: customerInfo.email,
         customerName: customerInfo.name,
-        items: items.map(item => ({
-          productId: item.id,
-          name: item.name,
-          price: item.price,
-          quantity: item.quantity,
-          total: item.price * item.quantity
-        })),
+        items: orderItems,
         totalAmount: totalAmount,
         shippingInfo: customerInfo
       };
 
       console.log('Order details:', orderDetails);
 
-      const response = await createPaymentIntent({
-        amount: totalAmountCents,
-        currency: 'usd',
-        customerEmail: customerInfo.email,
-        orderDetails
-      });
+      let response;
+      try {
+        response = await createPaymentIntent({
+          amount: totalAmountCents,
+          currency: 'usd',
+          customerEmail: customerInfo.email,
+          orderDetails
+        });
+      } catch (error) {
+        // Nothing can pay for an order made in this attempt, so give its stock back
+        if (createdOrder) {
+          abandonPendingOrder();
+        }
+        throw error;
+      }
 
       console.log('Payment intent response:', response);
-      return response;
+      return { ...response, orderId: pendingOrderId };
     },
     onSuccess: (data) => {
       console.log('Payment intent created successfully:', data);
       setPaymentIntentClientSecret(data.clientSecret);
-      setOrderId(data.orderId || `order_${Date.now()}`);
+      setOrderId(data.orderId);
       setActiveStep(2);
     },
     onError: (error: any) => {
@@ -118,7 +162,7 @@ const CheckoutNew: React.FC = () => {
   // Handle successful payment
   const handlePaymentSuccess = async (paymentIntentId: string) => {
     try {
-      // Confirm payment in backend
+      // Confirming marks the pending order paid and sells its held stock
       await confirmPayment({
         paymentIntentId,
         orderDetails: {
@@ -135,23 +179,8 @@ const CheckoutNew: React.FC = () => {
         }
       });
 
-      // Create order record
-      await createOrder({
-        userId: user?.id || '',
-        items: items.map(item => ({
-          productId: item.id,
-          name: item.name,
-          price: item.price,
-          quantity: item.quantity,
-          total: item.price * item.quantity
-        })),
-        total: totalAmount,
-        status: 'processing',
-        customerInfo: customerInfo,
-        paymentIntentId
-      });
-
       // Clear cart and go to confirmation
+      pendingOrder.current = null;
       clearCart();
       setActiveStep(3);
     } catch (error) {
@@ -342,6 +371,7 @@ const CheckoutNew: React.FC = () => {
                   <Elements stripe={stripePromise} options={{ clientSecret: paymentIntentClientSecret }}>
                     <StripePaymentForm
                       amount={totalAmountCents}
+                      orderId={orderId}
                       customerInfo={customerInfo}
                       onSuccess={handlePaymentSuccess}
                       onError={(error) => {
@@ -146,7 +146,7 @@ const Products: React.FC = () => {
                     fontSize: { xs: '0.75rem', md: '0.875rem' }
                   }}
                 >
-                  {product.description}
+                  {product.description ?? product.category}
                 </Typography>
                 <Typography 
                   variant={isMobile ? "subtitle1" : "h6"} 
@@ -5,6 +5,8 @@ const API_BASE_URL = process.env.REACT_APP_API_URL || 'https://api.example.com';
 const api = axios.create({
   baseURL: API_BASE_URL,
   timeout: 30000, // 30 seconds timeout
+  // Lets the API compress large responses (see backend/lambda_functions/compression.py)
+  headers: { Accept: 'application/vnd.lplivings+json, application/json' },
 });
 
 api.interceptors.request.use((config) => {
@@ -18,8 +20,34 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Static catalogue snapshot published to S3 on every write; browsing reads it
+// without going through the API when configured
+const CATALOG_URL = process.env.REACT_APP_CATALOG_URL;
+
+const getProductsSnapshot = async (pointerUrl: string) => {
+  const pointer = (await axios.get(pointerUrl)).data;
+  const response = await axios.get(new URL(pointer.listing, pointerUrl).toString());
+  return response.data;
+};
+
 export const getProducts = async () => {
-  const response = await api.get('/products');
+  if (CATALOG_URL) {
+    try {
+      return await getProductsSnapshot(CATALOG_URL);
+    } catch (error) {
+      console.warn('Catalogue snapshot unavailable, falling back to the API', error);
+    }
+  }
+  // Asking for the catalogue media type first lets the API return the
+  // stored gzip/brotli listing; the browser decompresses it transparently
+  const response = await api.get('/products', {
+    headers: { Accept: 'application/vnd.lplivings.catalog+json, application/json' },
+  });
+  return response.data;
+};
+
+export const getProductsByTag = async (tag: string, cursor?: string) => {
+  const response = await api.get('/products', { params: { tag, cursor } });
   return response.data;
 };
 
@@ -114,18 +142,23 @@ export const getOrders = async (userId?: string) => {
   return response.data;
 };
 
+// Orders are always created pending; confirmPayment marks them paid
 export const createOrder = async (orderData: {
   userId: string;
   items: any[];
   total: number;
-  status?: string;
   customerInfo?: any;
-  paymentIntentId?: string;
 }) => {
   const response = await api.post('/orders', orderData);
   return response.data;
 };
 
+// Gives back the stock held by one of the user's own unpaid orders
+export const cancelOrder = async (orderId: string, userId: string) => {
+  const response = await api.put(`/orders/${orderId}`, { status: 'cancelled', userId });
+  return response.data;
+};
+
 export const deleteProduct = async (productId: string) => {
   // Check if admin mode is enabled via URL parameter
   const urlParams = new URLSearchParams(window.location.search);